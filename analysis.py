@@ -0,0 +1,260 @@
+"""Farm analysis pipeline shared by the dashboard and the batch CLI.
+
+Kept free of Streamlit so it can run headless and in worker processes.
+"""
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from analysis_cache import aoi_fingerprint
+from anomalies import detect_stress_regions
+from change_detection import SCENE_TILES, change_distribution, classify_period, detect_changes, synthesize_period_bands
+from fields import FieldGrid, assign_anomalies, field_boxes, field_geometries, field_statistics, label_fields
+from forecasting import declining_mask, forecast_cube
+from geometry import geometry_bounds, points_bounds
+from ndvi_engine import NODATA, health_distribution
+from telemetry import span
+from timeseries_store import TIMESERIES_STORE
+from zones import YIELD_T_HA_PER_NDVI
+
+# Define anomaly types and their example detection descriptions/colors
+ANOMALY_TYPES = {
+    "Double Plant": {"color": "#FFD700", "description": "High density planting, potentially impacting yield and resource competition.", "pattern_shape": "rectangle"},
+    "Drydown": {"color": "#8B4513", "description": "Area showing signs of severe water stress or maturation, check irrigation.", "pattern_shape": "polygon"},
+    "Endrow": {"color": "#00CED1", "description": "Irregular planting or stress detected at the end of rows. Could be due to turns or machinery issues.", "pattern_shape": "polygon"},
+    "Nutrient Deficiency": {"color": "#A0522D", "description": "Area indicating lack of essential nutrients. Consider soil testing.", "pattern_shape": "rectangle"},
+    "Planter Skip": {"color": "#DC143C", "description": "Gaps in planting due to planter malfunction. May lead to yield loss.", "pattern_shape": "rectangle"},
+    "Water Accumulation": {"color": "#4682B4", "description": "Ponding or waterlogged area. Can cause root damage and disease.", "pattern_shape": "polygon"}
+}
+
+MOCK_SCENE_SHAPE = (100, 100)
+MAX_MOCK_SCENE_PX = 1000
+MOCK_NDVI_REVISIT_DAYS = 5
+MIN_NDVI_LOOKBACK_DAYS = 60
+FORECAST_DAYS = 14
+
+def describe_anomaly(region):
+    """Picks the closest ANOMALY_TYPES entry from a stress region's severity and shape."""
+    (min_lat, min_lon), (max_lat, max_lon) = region['bbox']
+    width = (max_lon - min_lon) * np.cos(np.radians((min_lat + max_lat) / 2))
+    height = max_lat - min_lat
+    elongated = max(width, height) > 3 * min(width, height)
+    if region['severe_fraction'] >= 0.5:
+        name = "Planter Skip" if elongated else "Drydown"
+    else:
+        name = "Endrow" if elongated else "Nutrient Deficiency"
+    info = ANOMALY_TYPES[name]
+    return {"type": name, "description": info["description"], "color": info["color"]}
+
+def fetch_mock_observations(farm_id, start_date, end_date):
+    """Stands in for the satellite/sensor feed: stores observations only for days not yet in the store."""
+    days = np.arange(np.datetime64(start_date), np.datetime64(end_date) + 1)
+    missing = days[~np.isin(days, TIMESERIES_STORE.stored_dates(farm_id, start_date, end_date))]
+    if missing.size == 0:
+        return
+    day_of_year = (missing - missing.astype('datetime64[Y]')).astype(np.int64)
+    ndvi = 0.65 + 0.08 * np.sin(2 * np.pi * day_of_year / 365) + np.random.normal(0, 0.02, missing.size)
+    ndvi[missing.astype(np.int64) % MOCK_NDVI_REVISIT_DAYS != 0] = np.nan  # cloud-free passes only
+    TIMESERIES_STORE.append(
+        farm_id, missing, ndvi=ndvi,
+        soil_moisture=np.random.uniform(20, 45, missing.size),
+        temperature=np.random.uniform(25, 40, missing.size)
+    )
+
+def load_farm_history(aoi, start_date, end_date):
+    """NDVI, soil moisture and temperature for the selected window, read from the time-series store."""
+    farm_id = aoi_fingerprint(aoi)[:16]
+    fetch_mock_observations(farm_id, start_date, end_date)
+    history = TIMESERIES_STORE.query(farm_id, start_date, end_date)
+    ndvi, ndvi_dates = history['ndvi'], history['dates']
+    if np.count_nonzero(~np.isnan(ndvi)) < 2:
+        # Window too short for two satellite passes: fall back to the latest passes before its end.
+        lookback = end_date - timedelta(days=MIN_NDVI_LOOKBACK_DAYS)
+        fetch_mock_observations(farm_id, lookback, end_date)
+        ndvi_window = TIMESERIES_STORE.query(farm_id, lookback, end_date, columns=['ndvi'])
+        ndvi, ndvi_dates = ndvi_window['ndvi'], ndvi_window['dates']
+    observed = ~np.isnan(ndvi)
+    history['ndvi'], history['ndvi_dates'] = ndvi[observed], ndvi_dates[observed]
+    return history
+
+def mock_ndvi_stack(stress_map_array, ndvi_dates, farm_ndvi):
+    """Per-pixel NDVI history around the farm series: stressed pixels trend down, with cloud gaps.
+
+    Returns a float32 (T, H, W) stack, built one date at a time so no
+    float64 temporary of the whole stack is ever held.
+    """
+    days_before_last = (ndvi_dates - ndvi_dates[-1]).astype(np.float32)
+    classes = np.minimum(stress_map_array, 2)
+    offset = np.array([0.05, -0.1, -0.3], dtype=np.float32)[classes]
+    slope = np.array([0.0005, -0.003, -0.006], dtype=np.float32)[classes]
+    slope = slope + np.random.normal(0, 0.001, stress_map_array.shape).astype(np.float32)
+    outside = stress_map_array == NODATA
+    stack = np.empty((len(ndvi_dates),) + stress_map_array.shape, dtype=np.float32)
+    for layer, farm_value, days in zip(stack, np.asarray(farm_ndvi, dtype=np.float32), days_before_last):
+        np.multiply(slope, days, out=layer)
+        layer += offset + farm_value
+        layer += np.random.normal(0, 0.02, stress_map_array.shape).astype(np.float32)
+        layer[outside | (np.random.random(stress_map_array.shape) < 0.1)] = np.nan
+    return stack
+
+def mock_scene_shape(boxes, aoi_bounds):
+    """Scene size for several fields: MOCK_SCENE_SHAPE across the largest one, capped at MAX_MOCK_SCENE_PX a side."""
+    if len(boxes) == 1:
+        return MOCK_SCENE_SHAPE
+    (min_lat, min_lon), (max_lat, max_lon) = aoi_bounds
+    pixel = max(float(np.max(boxes[:, 2:] - boxes[:, :2])) / max(MOCK_SCENE_SHAPE), 1e-9)
+    rows, cols = (max_lat - min_lat) / pixel, (max_lon - min_lon) / pixel
+    scale = min(1.0, MAX_MOCK_SCENE_PX / max(rows, cols))
+    return max(int(np.ceil(rows * scale)), 1), max(int(np.ceil(cols * scale)), 1)
+
+def _report(progress, stage, fraction=None):
+    if progress is not None:
+        progress(stage, fraction)
+
+def generate_mock_data(aoi, date_range=None, progress=None, scene_shape=None, compare_range=None):
+    """Generates realistic mock data for the dashboard, now including anomalies.
+
+    `aoi` is one field or a GeometryCollection of several (see
+    `fields.combine_fields`); all of them share one scene and one
+    classification, and `fields` in the result breaks the statistics down
+    per field. `progress(stage, fraction)` is called as each stage starts
+    and, during classification, after every raster block; `fraction` is None
+    when unknown. `scene_shape` is the (rows, cols) size of the mock
+    satellite raster (default: `mock_scene_shape`). With a `compare_range`
+    (start, end), `change` in the result holds the per-pixel change from
+    that earlier period (see `change_detection`).
+    """
+    end_date = date_range[1] if date_range else datetime.now().date()
+    start_date = date_range[0] if date_range else end_date - timedelta(days=29)
+    farm_id = aoi_fingerprint(aoi)
+
+    # Mock satellite fetch: band rasters on disk, classified tile by tile; tiles whose
+    # source data was classified before are reused (see change_detection).
+    # Only pixels inside a drawn boundary are classified; the rest of the bounding box is NODATA.
+    _report(progress, "Classifying crop health", 0.0)
+    with span("analysis.aoi_parsing"):
+        fields = field_geometries(aoi)
+        aoi_bounds = geometry_bounds(aoi)
+        index = FieldGrid(field_boxes(fields))
+        scene_shape = scene_shape or mock_scene_shape(index.boxes, aoi_bounds)
+        field_labels = label_fields(fields, aoi_bounds, scene_shape, index=index)
+        aoi_mask = field_labels > 0
+    scene_id = f"{farm_id[:16]}-{scene_shape[0]}x{scene_shape[1]}"
+    with tempfile.TemporaryDirectory() as scene_dir:
+        def fetch_bands(period):
+            with span("analysis.scene_load"):
+                return synthesize_period_bands(
+                    os.path.join(scene_dir, period[1].isoformat()), scene_shape, int(farm_id[:8], 16), period
+                )
+
+        with span("analysis.classification"):
+            stress_map_array, tile_hashes, _ = classify_period(
+                scene_id, (start_date, end_date), aoi_mask, lambda: fetch_bands((start_date, end_date)), SCENE_TILES,
+                progress=lambda done, total: _report(progress, "Classifying crop health", done / total)
+            )
+
+        change = None
+        if compare_range:
+            _report(progress, "Comparing with the earlier period")
+            with span("analysis.change_detection"):
+                compare_range = tuple(compare_range)
+                before, before_hashes, recomputed = classify_period(
+                    scene_id, compare_range, aoi_mask, lambda: fetch_bands(compare_range), SCENE_TILES
+                )
+                change_map_array, transitions = detect_changes(before, stress_map_array, before_hashes, tile_hashes)
+                change = {
+                    "compare_range": compare_range,
+                    "change_map_array": change_map_array,
+                    "change_distribution": change_distribution(change_map_array),
+                    "transitions": transitions,
+                    "tiles_total": int(np.count_nonzero(tile_hashes)),
+                    "tiles_changed": int(np.count_nonzero(tile_hashes != before_hashes)),
+                    "tiles_recomputed": recomputed,
+                }
+    
+    # Anomaly detection: every connected stress patch above the minimum area.
+    _report(progress, "Detecting anomalies")
+    with span("analysis.anomaly_detection"):
+        detected_anomalies = [
+            dict(region, **describe_anomaly(region)) for region in detect_stress_regions(stress_map_array, aoi_bounds)
+        ]
+        for anomaly, owner in zip(detected_anomalies, assign_anomalies(detected_anomalies, field_labels, aoi_bounds, index)):
+            anomaly['field'] = owner
+
+    _report(progress, "Loading field history")
+    with span("analysis.history_fetch"):
+        history = load_farm_history(aoi, start_date, end_date)
+
+    # Per-pixel forecast: one batched least-squares fit over the (time x pixels) NDVI stack.
+    _report(progress, "Forecasting crop health")
+    with span("analysis.forecasting"):
+        ndvi_stack = mock_ndvi_stack(stress_map_array, history['ndvi_dates'], history['ndvi'])
+        _, ndvi_forecast_cube = forecast_cube(history['ndvi_dates'], ndvi_stack, horizon=FORECAST_DAYS)
+        # A pixel is either forecast on every day or on none, so the first day tells which ones were fitted.
+        fitted = ~np.isnan(ndvi_forecast_cube[0])
+        if fitted.any():
+            ndvi_pred = [float(day[fitted].mean()) for day in ndvi_forecast_cube]
+        else:
+            ndvi_pred = [float(history['ndvi'][-1])] * FORECAST_DAYS
+        # Per-pixel mean NDVI over the window, for zonal statistics (see zones.py); summed date by date.
+        total = np.zeros(stress_map_array.shape, dtype=np.float32)
+        observed = np.zeros(stress_map_array.shape, dtype=np.int32)
+        for layer in ndvi_stack:
+            seen = ~np.isnan(layer)
+            np.add(total, layer, out=total, where=seen)
+            observed += seen
+        ndvi_map_array = np.full(stress_map_array.shape, np.nan, dtype=np.float32)
+        np.divide(total, observed, out=ndvi_map_array, where=observed > 0)
+        del ndvi_stack, total, observed
+
+    declining = np.ma.masked_array(declining_mask(ndvi_forecast_cube), mask=stress_map_array == NODATA)
+    field_stats = field_statistics(stress_map_array, field_labels, len(fields), aoi_bounds, declining)
+    for i, stats in enumerate(field_stats):
+        owned = [a for a in detected_anomalies if a['field'] == i]
+        stats['anomaly_count'] = len(owned)
+        stats['anomaly_area_ha'] = float(sum(a['area_ha'] for a in owned))
+
+    return {
+        "stress_map_array": stress_map_array,
+        "health_distribution": health_distribution(stress_map_array),
+        "ndvi_hist": history['ndvi'],
+        "ndvi_pred": ndvi_pred,
+        "ndvi_forecast_cube": ndvi_forecast_cube,
+        "ndvi_map_array": ndvi_map_array,
+        # Masked outside the field so shares are relative to farm pixels only.
+        "declining_mask": declining,
+        "soil_moisture_hist": history['soil_moisture'],
+        "temperature_hist": history['temperature'],
+        "dates": history['dates'],
+        "aoi_bounds": aoi_bounds,
+        "detected_anomalies": detected_anomalies,
+        "fields": field_stats,
+        "change": change
+    }
+
+def simulate_latency(seconds, stage, progress=None, step=0.1):
+    """Stands in for remote I/O; reports progress every `step` so callers can cancel mid-wait."""
+    steps = max(int(seconds / step), 1)
+    for i in range(steps):
+        _report(progress, stage, i / steps)
+        time.sleep(seconds / steps)
+
+def run_farm_analysis(aoi, date_range, progress=None, compare_range=None):
+    """Full analysis for one AOI and date range (optionally compared with an earlier one); only runs on a result-cache miss."""
+    with span("analysis.satellite_fetch"):
+        simulate_latency(1.5, "Fetching satellite data", progress)
+    data = generate_mock_data(aoi, date_range, progress=progress, compare_range=compare_range)
+    with span("analysis.finalise"):
+        simulate_latency(1.5, "Finalising results", progress)
+    return data
+
+def get_aoi_bounds(coords):
+    """`[[min_lat, min_lon], [max_lat, max_lon]]` of a lon/lat ring."""
+    return points_bounds(coords)
+
+def estimate_yield(ndvi_hist):
+    """Estimated yield in tonnes/hectare from the NDVI history."""
+    return float(np.mean(ndvi_hist) * YIELD_T_HA_PER_NDVI)
@@ -0,0 +1,224 @@
+"""Two-tier result cache for farm analysis.
+
+Results are keyed by a canonical hash of the AOI polygon and the selected date
+range, so redrawing the same field (different start vertex, winding or float
+noise) or re-analysing it from another session reuses the earlier result.
+Tier one is an in-process LRU; tier two is a pickle store on disk with a TTL
+and a total-size budget, shared by every server process on the machine.
+Concurrent misses on the same key within a process are computed once: later
+callers wait for the first one's result.
+"""
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from geometry import geometry_rings
+
+CACHE_DIR = os.environ.get(
+    "KRISHI_ANALYSIS_CACHE", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".krishi_cache", "analysis")
+)
+COORD_PRECISION = 6  # ~0.1 m; anything finer is digitising noise
+MEMORY_ENTRIES = 64
+MEMORY_MAX_BYTES = 256 * 1024 * 1024
+DISK_MAX_BYTES = 512 * 1024 * 1024
+TTL_SECONDS = 24 * 3600
+# Bump whenever the layout of the cached analysis result changes.
+RESULT_VERSION = 7
+
+
+def canonical_ring(coords, precision=COORD_PRECISION):
+    """Normalises a polygon ring: rounded, open, counter-clockwise, min vertex first."""
+    ring = [(round(float(lon), precision), round(float(lat), precision)) for lon, lat, *_ in coords]
+    if len(ring) > 1 and ring[0] == ring[-1]:
+        ring = ring[:-1]
+    # Drop consecutive duplicates that rounding may have created.
+    ring = [p for i, p in enumerate(ring) if i == 0 or p != ring[i - 1]]
+    if len(ring) > 1 and ring[0] == ring[-1]:
+        ring = ring[:-1]
+
+    signed_area = sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(ring, ring[1:] + ring[:1]))
+    if signed_area < 0:
+        ring.reverse()
+    start = ring.index(min(ring)) if ring else 0
+    return ring[start:] + ring[:start]
+
+
+def aoi_fingerprint(aoi):
+    """Content hash of an AOI geometry alone; stable across redraws of the same field."""
+    if aoi.get('type') == 'GeometryCollection':
+        # Hash member by member so the split into fields is part of the identity.
+        members = [aoi_fingerprint(member) for member in aoi['geometries']]
+        return hashlib.sha256(json.dumps({"type": aoi['type'], "geometries": members}).encode("utf-8")).hexdigest()
+    rings = [canonical_ring(ring.tolist()) for ring in geometry_rings(aoi)]
+    payload = json.dumps({"type": aoi.get('type', 'Polygon'), "rings": rings}, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def result_nbytes(value):
+    """Approximate size of a cached result: the bytes held by its NumPy arrays."""
+    if isinstance(value, np.ndarray):
+        return value.nbytes + (value.mask.nbytes if np.ma.isMaskedArray(value) and value.mask is not np.ma.nomask else 0)
+    if isinstance(value, dict):
+        return sum(result_nbytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(result_nbytes(v) for v in value)
+    return 0
+
+
+def aoi_cache_key(aoi, date_range):
+    """Content hash of an AOI geometry and a (start, end) date range."""
+    dates = ",".join(d.isoformat() for d in date_range)
+    payload = f"{RESULT_VERSION}|{aoi_fingerprint(aoi)}|{dates}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AnalysisCache:
+    """In-process LRU in front of an on-disk store with TTL and size-based eviction.
+
+    The in-process tier is bounded both by entry count and by the bytes of
+    the arrays it holds, so large rasters don't pin memory beyond the budget.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, memory_entries=MEMORY_ENTRIES, memory_max_bytes=MEMORY_MAX_BYTES,
+                 disk_max_bytes=DISK_MAX_BYTES, ttl_seconds=TTL_SECONDS):
+        self.cache_dir = cache_dir
+        self.memory_entries = memory_entries
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._inflight = {}  # key -> [lock held while computing it, callers using that lock]
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+    def _expired(self, created):
+        return time.time() - created > self.ttl_seconds
+
+    def get(self, key):
+        """Returns the cached result for `key`, or None."""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry[0]):
+                    self._memory.move_to_end(key)
+                    return entry[1]
+                self._forget(key)
+
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                created, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if self._expired(created):
+            self._remove(path)
+            return None
+        try:
+            os.utime(path)  # mtime doubles as last-access time for eviction
+        except OSError:
+            pass
+        self._remember(key, created, value)
+        return value
+
+    def put(self, key, value):
+        """Stores `value` in both tiers and trims the disk store to budget."""
+        created = time.time()
+        self._remember(key, created, value)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump((created, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        self._evict_disk()
+
+    def get_or_compute(self, aoi, date_range, compute):
+        """Returns the result for this AOI and date range, running `compute(aoi, date_range)` on a miss.
+
+        Only one caller per key computes; the others block until it has
+        stored the result. If it raises, the next waiter computes instead.
+        """
+        key = aoi_cache_key(aoi, date_range)
+        value = self.get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            flight = self._inflight.setdefault(key, [threading.Lock(), 0])
+            flight[1] += 1
+        try:
+            with flight[0]:
+                value = self.get(key)
+                if value is None:
+                    value = compute(aoi, date_range)
+                    self.put(key, value)
+        finally:
+            with self._lock:
+                flight[1] -= 1
+                if not flight[1]:
+                    del self._inflight[key]
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+        if os.path.isdir(self.cache_dir):
+            for name in os.listdir(self.cache_dir):
+                self._remove(os.path.join(self.cache_dir, name))
+
+    def _remember(self, key, created, value):
+        with self._lock:
+            if key in self._memory:
+                self._forget(key)
+            size = result_nbytes(value)
+            self._memory[key] = (created, value, size)
+            self._memory_bytes += size
+            # Oldest first, but always keep the entry just stored.
+            while len(self._memory) > 1 and (len(self._memory) > self.memory_entries
+                                             or self._memory_bytes > self.memory_max_bytes):
+                self._forget(next(iter(self._memory)))
+
+    def _forget(self, key):
+        self._memory_bytes -= self._memory.pop(key)[2]
+
+    def _evict_disk(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".pkl"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        now = time.time()
+        for mtime, size, path in sorted(entries):
+            # Oldest-accessed first; anything untouched for a full TTL is stale anyway.
+            if total <= self.disk_max_bytes and now - mtime <= self.ttl_seconds:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# Shared by every session in this server process.
+ANALYSIS_CACHE = AnalysisCache()
@@ -0,0 +1,179 @@
+"""Stress-patch detection on the classified raster.
+
+Stressed and Severe pixels are grouped into 4-connected regions with a
+union-find over row runs: runs are extracted for the whole raster at once,
+runs touching across adjacent rows are linked, and components are resolved by
+vectorised hook-and-compress rounds, so each round is linear in the number of
+runs rather than a Python step per pixel. Regions below a minimum area are
+dropped; the rest are traced into simplified outline polygons.
+"""
+import numpy as np
+
+from geometry import simplify_ring
+from ndvi_engine import SEVERE, STRESSED
+
+MIN_AREA_PX = 20
+MAX_REGIONS = 50
+SIMPLIFY_TOLERANCE_PX = 1.0
+
+# Clockwise Moore neighbourhood starting west, in (row, col) offsets.
+_NEIGHBOURS = [(0, -1), (-1, -1), (-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1)]
+_NEIGHBOUR_INDEX = {offset: i for i, offset in enumerate(_NEIGHBOURS)}
+
+
+def _row_runs(mask):
+    """All horizontal runs of True as parallel (row, start, stop) arrays, in raster order."""
+    rows, cols = mask.shape
+    padded = np.zeros((rows, cols + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    edges = np.diff(padded, axis=1)
+    start_r, start_c = np.nonzero(edges == 1)
+    _, stop_c = np.nonzero(edges == -1)
+    return start_r, start_c, stop_c
+
+
+def _link_runs(run_row, run_start, run_stop, width):
+    """Index pairs of runs in consecutive rows that share at least one column."""
+    stride = width + 1
+    start_key = run_row * stride + run_start
+    stop_key = run_row * stride + run_stop
+    # For each run, the overlapping runs one row up form a contiguous block.
+    above = (run_row - 1) * stride
+    lo = np.searchsorted(stop_key, above + run_start, side='right')
+    hi = np.searchsorted(start_key, above + run_stop, side='left')
+    counts = np.maximum(hi - lo, 0)
+    below = np.repeat(np.arange(run_row.size), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(lo, counts) + offsets, below
+
+
+def _union_find(n, a, b):
+    """Component root (smallest member index) for each of `n` nodes linked by edges a-b."""
+    parent = np.arange(n)
+    while True:
+        pa, pb = parent[a], parent[b]
+        unresolved = pa != pb
+        if not unresolved.any():
+            return parent
+        # Hook the larger root under the smaller, then compress every path fully.
+        np.minimum.at(parent, np.maximum(pa, pb)[unresolved], np.minimum(pa, pb)[unresolved])
+        while True:
+            grand = parent[parent]
+            if np.array_equal(grand, parent):
+                break
+            parent = grand
+
+
+def _label_runs(mask):
+    """Runs of `mask` plus the 1-based component label of each run."""
+    run_row, run_start, run_stop = _row_runs(mask)
+    if run_row.size == 0:
+        return run_row, run_start, run_stop, np.zeros(0, dtype=np.int32), 0
+    a, b = _link_runs(run_row, run_start, run_stop, mask.shape[1])
+    roots = _union_find(run_row.size, a, b)
+    _, run_label = np.unique(roots, return_inverse=True)
+    run_label = run_label.astype(np.int32) + 1
+    return run_row, run_start, run_stop, run_label, int(run_label.max())
+
+
+def _paint_runs(shape, run_row, run_start, run_stop, run_label):
+    labels = np.zeros(shape, dtype=np.int32)
+    lengths = run_stop - run_start
+    within = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    labels[np.repeat(run_row, lengths), np.repeat(run_start, lengths) + within] = np.repeat(run_label, lengths)
+    return labels
+
+
+def label_regions(mask):
+    """4-connected component labels for a boolean raster (0 = background, 1..n = regions)."""
+    run_row, run_start, run_stop, run_label, n = _label_runs(mask)
+    return _paint_runs(mask.shape, run_row, run_start, run_stop, run_label), n
+
+
+def trace_outline(region):
+    """Moore-neighbour boundary trace of one region; returns (row, col) pixel centres in order."""
+    padded = np.pad(region, 1)
+    height, width = padded.shape
+    flat_start = int(np.argmax(padded))
+    start = (flat_start // width, flat_start % width)
+    contour = [start]
+    current, backtrack = start, 0  # the west neighbour of the first pixel is background
+    first_move = None
+    for _ in range(4 * padded.size):
+        for k in range(8):
+            d = (backtrack + k) % 8
+            nxt = (current[0] + _NEIGHBOURS[d][0], current[1] + _NEIGHBOURS[d][1])
+            if padded[nxt]:
+                break
+        else:
+            break  # isolated pixel
+        prev = _NEIGHBOURS[(d - 1) % 8]
+        backtrack = _NEIGHBOUR_INDEX[(current[0] + prev[0] - nxt[0], current[1] + prev[1] - nxt[1])]
+        if current == start:
+            if first_move is None:
+                first_move = nxt
+            elif nxt == first_move:
+                break
+        current = nxt
+        contour.append(current)
+    if len(contour) > 1 and contour[-1] == start:
+        contour.pop()
+    return [(r - 1, c - 1) for r, c in contour]
+
+
+def detect_stress_regions(stress_array, bounds, min_area=MIN_AREA_PX, max_regions=MAX_REGIONS,
+                          tolerance=SIMPLIFY_TOLERANCE_PX):
+    """Finds connected Stressed/Severe patches, largest first.
+
+    Each region is a dict with pixel `area_px`, `area_ha`, `severe_fraction`,
+    lon/lat `centroid`, `bbox` as `[[min_lat, min_lon], [max_lat, max_lon]]`
+    and a simplified lon/lat outline ring in `coordinates`.
+    """
+    (min_lat, min_lon), (max_lat, max_lon) = bounds
+    rows, cols = stress_array.shape
+    px_w = (max_lon - min_lon) / cols
+    px_h = (max_lat - min_lat) / rows
+    px_area_ha = (px_w * 111320 * np.cos(np.radians((min_lat + max_lat) / 2))) * (px_h * 110540) / 10000
+
+    stressed = (stress_array == STRESSED) | (stress_array == SEVERE)
+    run_row, run_start, run_stop, run_label, n = _label_runs(stressed)
+    if n == 0:
+        return []
+
+    # Area, centroid and bounding box come straight from the runs.
+    lengths = run_stop - run_start
+    area = np.bincount(run_label, weights=lengths, minlength=n + 1)
+    row_sum = np.bincount(run_label, weights=run_row * lengths, minlength=n + 1)
+    col_sum = np.bincount(run_label, weights=lengths * (run_start + run_stop - 1) / 2, minlength=n + 1)
+    r_min = np.full(n + 1, rows); r_max = np.full(n + 1, -1)
+    c_min = np.full(n + 1, cols); c_max = np.full(n + 1, -1)
+    np.minimum.at(r_min, run_label, run_row); np.maximum.at(r_max, run_label, run_row)
+    np.minimum.at(c_min, run_label, run_start); np.maximum.at(c_max, run_label, run_stop - 1)
+
+    candidates = np.nonzero(area >= min_area)[0]
+    candidates = candidates[candidates > 0]
+    candidates = candidates[np.argsort(area[candidates], kind='stable')[::-1]][:max_regions]
+    if candidates.size == 0:
+        return []
+
+    labels = _paint_runs(stress_array.shape, run_row, run_start, run_stop, run_label)
+    severe = np.bincount(labels[stress_array == SEVERE], minlength=n + 1)
+
+    regions = []
+    for k in candidates:
+        window = labels[r_min[k]:r_max[k] + 1, c_min[k]:c_max[k] + 1] == k
+        outline = np.array(trace_outline(window), dtype=np.float64) + (r_min[k], c_min[k])
+        ring = simplify_ring(outline[:, ::-1], tolerance)  # (col, row) so x/y match lon/lat
+        lons = min_lon + (ring[:, 0] + 0.5) * px_w
+        lats = max_lat - (ring[:, 1] + 0.5) * px_h
+        regions.append({
+            "area_px": int(area[k]),
+            "area_ha": float(area[k] * px_area_ha),
+            "severe_fraction": float(severe[k] / area[k]),
+            "centroid": (float(min_lon + (col_sum[k] / area[k] + 0.5) * px_w),
+                         float(max_lat - (row_sum[k] / area[k] + 0.5) * px_h)),
+            "bbox": [[float(max_lat - (r_max[k] + 1) * px_h), float(min_lon + c_min[k] * px_w)],
+                     [float(max_lat - r_min[k] * px_h), float(min_lon + (c_max[k] + 1) * px_w)]],
+            "coordinates": list(zip(lons.tolist(), lats.tolist())),
+        })
+    return regions
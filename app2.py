@@ -12,6 +12,10 @@ from datetime import datetime, timedelta
 import random
 import base64
 
+from basemap import basemap_layer
+from gazetteer import geocoder_options
+from geometry import area_centroid, map_tolerance, points_bounds, simplify_ring
+
 # --- 1. APP CONFIGURATION ---
 st.set_page_config(
     page_title="Krishi-Drishti",
@@ -43,14 +47,15 @@ def generate_mock_data(aoi):
     }
 
 def get_aoi_bounds(coords):
-    lons = [c[0] for c in coords]
-    lats = [c[1] for c in coords]
-    return [[min(lats), min(lons)], [max(lats), max(lons)]]
+    return points_bounds(coords)
 
 # --- 4. DASHBOARD COMPONENTS ---
+BOUNDARY_DETAIL_ZOOM = 18  # boundary detail finer than half a pixel at this zoom is dropped
+
 def display_spectral_health_map(stress_array, bounds, aoi_coords):
-    map_center = [np.mean([p[1] for p in aoi_coords]), np.mean([p[0] for p in aoi_coords])]
-    health_map = folium.Map(location=map_center, zoom_start=16, tiles="https://mt1.google.com/vt/lyrs=s&x={x}&y={y}&z={z}", attr="Google")
+    _, (center_lon, center_lat) = area_centroid({"type": "Polygon", "coordinates": [aoi_coords]})
+    health_map = folium.Map(location=[center_lat, center_lon], zoom_start=16, tiles=None)
+    basemap_layer("google-satellite").add_to(health_map)
     colormap = np.array([[0, 128, 0, 128], [255, 255, 0, 128], [255, 0, 0, 128]], dtype=np.uint8)
     colored_array = colormap[stress_array]
     img = Image.fromarray(colored_array, 'RGBA')
@@ -59,7 +64,8 @@ def display_spectral_health_map(stress_array, bounds, aoi_coords):
     image_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
     image_url = f'data:image/png;base64,{image_base64}'
     folium.raster_layers.ImageOverlay(image=image_url, bounds=bounds, opacity=0.6, name='Spectral Health Map').add_to(health_map)
-    folium.Polygon(locations=[(lat, lon) for lon, lat in aoi_coords], color='white', weight=2, fill=False, tooltip="Your Farm Boundary").add_to(health_map)
+    boundary = simplify_ring(aoi_coords, map_tolerance(BOUNDARY_DETAIL_ZOOM, center_lat))
+    folium.Polygon(locations=boundary[:, ::-1].tolist(), color='white', weight=2, fill=False, tooltip="Your Farm Boundary").add_to(health_map)
     st_folium(health_map, width="100%", height=500, returned_objects=[])
 
 def create_temporal_trend_chart(hist_data, pred_data):
@@ -119,14 +125,15 @@ st.header("Krishi-Drishti: AI-Powered Farm Analysis")
 if st.session_state.view_state == 'initial':
     st.write("Draw your farm boundary using the polygon tool 툴 on the map to get started.")
     
-    initial_map = folium.Map(location=[22.3, 73.1], zoom_start=12)
+    initial_map = folium.Map(location=[22.3, 73.1], zoom_start=12, tiles=None)
+    basemap_layer("openstreetmap").add_to(initial_map)
     
     # Add Google Map Layers
-    folium.TileLayer('https://mt1.google.com/vt/lyrs=s&x={x}&y={y}&z={z}', attr='Google', name='Google Satellite').add_to(initial_map)
-    folium.TileLayer('https://mt1.google.com/vt/lyrs=y&x={x}&y={y}&z={z}', attr='Google', name='Google Hybrid').add_to(initial_map)
+    basemap_layer("google-satellite").add_to(initial_map)
+    basemap_layer("google-hybrid").add_to(initial_map)
     
     # Add Plugins to the initial map
-    folium.plugins.Geocoder(collapsed=False, position='topleft', add_marker=False).add_to(initial_map)
+    folium.plugins.Geocoder(collapsed=False, position='topleft', add_marker=False, **geocoder_options()).add_to(initial_map)
     folium.plugins.Draw(export=False, draw_options={'polyline': False, 'marker': False, 'circlemarker': False, 'circle': False}).add_to(initial_map)
     folium.LayerControl().add_to(initial_map)
     
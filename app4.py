@@ -4,13 +4,28 @@ from folium import LayerControl
 from streamlit_folium import st_folium
 from folium.plugins import Draw, Geocoder
 import numpy as np
-import plotly.graph_objects as go
-from PIL import Image
+import csv
+import hashlib
 import io
-import time
+import json
 from datetime import datetime, timedelta
-import random
-import base64
+
+from analysis import estimate_yield, run_farm_analysis
+from analysis_cache import ANALYSIS_CACHE, aoi_cache_key
+from anomalies import MIN_AREA_PX, label_regions
+from basemap import basemap_layer, fit_zoom, prefetch_aoi
+from fields import combine_fields, drawn_fields
+from gazetteer import geocoder_options
+from geometry import geometry_bounds
+import figures
+from figures import ENV_CHART_MAX_POINTS
+from jobs import ANALYSIS_JOBS, CANCELLED, DONE, FAILED, QUEUED
+import local_server
+from session_data import SESSION_RESULTS
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from telemetry import begin_rerun, end_rerun, span
+import zones
+from zones import DEFAULT_CELL_M, DEFAULT_ZONE_COUNT, prescription_geojson, prescription_rates, prescription_table
 
 # --- 1. APP CONFIGURATION ---
 st.set_page_config(
@@ -19,6 +34,12 @@ st.set_page_config(
     layout="wide",
     initial_sidebar_state="expanded"
 )
+# Times the whole script run (and profiles it when KRISHI_PROFILE_SLOW_MS is set); closed at the end of the file.
+rerun_timer = begin_rerun()
+# Serves /metrics, the overlay and basemap tiles and place search; falls back to a free port when busy.
+if local_server.ensure_server() is None:
+    st.error(f"The local tile server could not start, so the maps will be blank: {local_server.start_error()}. "
+             "Set KRISHI_LOCAL_PORT to a free port and restart.", icon="⚠️")
 
 # --- 2. CUSTOM STYLING (CSS Injection) ---
 # This CSS enhances the visual appeal with a dark theme and card-like containers.
@@ -103,184 +124,246 @@ if 'view_state' not in st.session_state:
     st.session_state.view_state = 'initial'
 if 'drawn_aoi' not in st.session_state:
     st.session_state.drawn_aoi = None
-if 'mock_data' not in st.session_state:
-    st.session_state.mock_data = None
+if 'result_key' not in st.session_state:
+    # Only the key lives in the session; the result itself is shared through SESSION_RESULTS.
+    st.session_state.result_key = None
+if 'analysis_job_id' not in st.session_state:
+    st.session_state.analysis_job_id = None
+if 'analysis_message' not in st.session_state:
+    st.session_state.analysis_message = None
 
 # --- 4. BACKEND SIMULATION & DATA GENERATION ---
+# The analysis pipeline lives in analysis.py so the batch CLI can run it headless.
 
-# Define anomaly types and their example detection descriptions/colors
-ANOMALY_TYPES = {
-    "Double Plant": {"color": "#FFD700", "description": "High density planting, potentially impacting yield and resource competition.", "pattern_shape": "rectangle"},
-    "Drydown": {"color": "#8B4513", "description": "Area showing signs of severe water stress or maturation, check irrigation.", "pattern_shape": "polygon"},
-    "Endrow": {"color": "#00CED1", "description": "Irregular planting or stress detected at the end of rows. Could be due to turns or machinery issues.", "pattern_shape": "polygon"},
-    "Nutrient Deficiency": {"color": "#A0522D", "description": "Area indicating lack of essential nutrients. Consider soil testing.", "pattern_shape": "rectangle"},
-    "Planter Skip": {"color": "#DC143C", "description": "Gaps in planting due to planter malfunction. May lead to yield loss.", "pattern_shape": "rectangle"},
-    "Water Accumulation": {"color": "#4682B4", "description": "Ponding or waterlogged area. Can cause root damage and disease.", "pattern_shape": "polygon"}
-}
-
-def generate_mock_data(aoi):
-    """Generates realistic mock data for the dashboard, now including anomalies."""
-    severe_pct = np.random.randint(5, 25)
-    stressed_pct = np.random.randint(10, 30)
-    healthy_pct = 100 - severe_pct - stressed_pct
-    
-    # Simulate anomaly detection
-    detected_anomaly = None
-    if random.random() < 0.7: # 70% chance to detect an anomaly
-        anomaly_name = random.choice(list(ANOMALY_TYPES.keys()))
-        anomaly_info = ANOMALY_TYPES[anomaly_name]
-        
-        # Generate a random, simple polygon/rectangle within the AOI for the anomaly
-        aoi_coords = aoi['coordinates'][0]
-        lons = [c[0] for c in aoi_coords]
-        lats = [c[1] for c in aoi_coords]
-        
-        min_lon, max_lon = min(lons), max(lons)
-        min_lat, max_lat = min(lats), max(lats)
-        
-        center_lon = (min_lon + max_lon) / 2
-        center_lat = (min_lat + max_lat) / 2
-        
-        lon_span = (max_lon - min_lon) * 0.1
-        lat_span = (max_lat - min_lat) * 0.1
-        
-        offset_lon = random.uniform(-lon_span, lon_span)
-        offset_lat = random.uniform(-lat_span, lat_span)
+# --- 5. DASHBOARD COMPONENTS ---
+MAX_LISTED_ANOMALIES = 5
+DECLINE_ALERT_PCT = 10
+COMPARE_OFFSET_DAYS = 7
+JOB_POLL_SECONDS = 1.0
+FIGURE_CACHE_ENTRIES = 64
+ZONE_METHODS = {"Grid": "grid", "Clusters (k-means)": "kmeans"}
+DEFAULT_BASE_RATE = 100.0
 
-        anomaly_lon = center_lon + offset_lon
-        anomaly_lat = center_lat + offset_lat
-        
-        if anomaly_info["pattern_shape"] == "rectangle":
-            anomaly_polygon = [
-                (anomaly_lon - lon_span/2, anomaly_lat - lat_span/2),
-                (anomaly_lon + lon_span/2, anomaly_lat - lat_span/2),
-                (anomaly_lon + lon_span/2, anomaly_lat + lat_span/2),
-                (anomaly_lon - lon_span/2, anomaly_lat + lat_span/2),
-                (anomaly_lon - lon_span/2, anomaly_lat - lat_span/2)
-            ]
-        else: # Simple polygon
-             anomaly_polygon = [
-                (anomaly_lon, anomaly_lat + lat_span/2),
-                (anomaly_lon + lon_span/2, anomaly_lat - lat_span/4),
-                (anomaly_lon - lon_span/2, anomaly_lat - lat_span/4),
-                (anomaly_lon, anomaly_lat + lat_span/2)
-            ]
-
-        detected_anomaly = {
-            "type": anomaly_name,
-            "description": anomaly_info["description"],
-            "color": anomaly_info["color"],
-            "coordinates": anomaly_polygon
-        }
-
-    return {
-        "stress_map_array": np.random.choice([0, 1, 2], size=(100, 100), p=[healthy_pct/100, stressed_pct/100, severe_pct/100]),
-        "health_distribution": {'Healthy': healthy_pct, 'Stressed': stressed_pct, 'Severe': severe_pct},
-        "ndvi_hist": sorted(np.random.uniform(0.55, 0.75, 12).tolist()),
-        "ndvi_pred": sorted(np.random.uniform(0.45, 0.7, 14).tolist(), reverse=random.choice([True, False])),
-        "soil_moisture_hist": np.random.uniform(20, 45, 30).tolist(),
-        "temperature_hist": np.random.uniform(25, 40, 30).tolist(), # <-- ADDED TEMPERATURE DATA
-        "dates": [(datetime.now().date() - timedelta(days=i)) for i in range(30)][::-1],
-        "aoi_bounds": get_aoi_bounds(aoi['coordinates'][0]),
-        "detected_anomaly": detected_anomaly
-    }
+def current_session_id():
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else "bare"
 
-def get_aoi_bounds(coords):
-    lons = [c[0] for c in coords]
-    lats = [c[1] for c in coords]
-    return [[min(lats), min(lons)], [max(lats), max(lons)]]
+def array_digest(values):
+    """Full content hash of an array; Streamlit's default hasher only samples large arrays."""
+    values = np.ascontiguousarray(values)
+    h = hashlib.sha1(f"{values.shape}{values.dtype}".encode())
+    h.update(values.tobytes())
+    return h.hexdigest()
 
-# --- 5. DASHBOARD COMPONENTS ---
-def display_spectral_health_map(stress_array, bounds, aoi_coords, detected_anomaly=None):
-    map_center = [np.mean([p[1] for p in aoi_coords]), np.mean([p[0] for p in aoi_coords])]
-    health_map = folium.Map(location=map_center, zoom_start=16, tiles="CartoDB dark_matter", attr="CartoDB")
-    
-    colormap = np.array([[0, 128, 0, 180], [255, 255, 0, 180], [255, 0, 0, 180]], dtype=np.uint8)
-    colored_array = colormap[stress_array]
-    img = Image.fromarray(colored_array, 'RGBA')
-    
-    buffer = io.BytesIO()
-    img.save(buffer, format='PNG')
-    image_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-    image_url = f'data:image/png;base64,{image_base64}'
-    
-    folium.raster_layers.ImageOverlay(
-        image=image_url, bounds=bounds, opacity=0.7, name='Spectral Health Map'
-    ).add_to(health_map)
-    
-    folium.Polygon(
-        locations=[(lat, lon) for lon, lat in aoi_coords], color='#33bbff', 
-        weight=3, fill=False, tooltip="Your Farm Boundary"
-    ).add_to(health_map)
-
-    if detected_anomaly:
-        anomaly_folium_coords = [(c[1], c[0]) for c in detected_anomaly['coordinates']]
-        folium.Polygon(
-            locations=anomaly_folium_coords, color=detected_anomaly['color'], weight=4,
-            fill=True, fill_color=detected_anomaly['color'], fill_opacity=0.4,
-            tooltip=f"Anomaly Detected: {detected_anomaly['type']}"
-        ).add_to(health_map)
-        folium.Marker(
-            location=anomaly_folium_coords[0],
-            icon=folium.Icon(color='red', icon='exclamation-triangle', prefix='fa'),
-            tooltip=f"Anomaly: {detected_anomaly['type']}"
-        ).add_to(health_map)
-
-    st_folium(health_map, width="100%", height=500, returned_objects=[])
-
-def create_temporal_trend_chart(hist_data, pred_data):
-    fig = go.Figure()
-    hist_len = len(hist_data)
-    
-    fig.add_trace(go.Scatter(x=list(range(hist_len)), y=hist_data, mode='lines+markers', name='Historical NDVI', line=dict(color='#33bbff', width=3)))
-    fig.add_trace(go.Scatter(x=list(range(hist_len - 1, hist_len + len(pred_data))), y=[hist_data[-1]] + pred_data, mode='lines', name='14-Day Forecast', line=dict(color='#ff6a6a', dash='dash', width=3)))
-    
-    fig.update_layout(
-        title_text='<b>Crop Health Forecast (NDVI)</b>',
-        xaxis_title='Time', yaxis_title='NDVI Value',
-        legend=dict(x=0.01, y=0.99, bgcolor='rgba(0,0,0,0.5)', bordercolor='white', borderwidth=1),
-        paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font=dict(color='white')
-    )
-    return fig
+# Builders are memoized on their inputs, so a rerun (or another session viewing the
+# same result) reuses the finished figure. Plotly figures are only read by
+# st.plotly_chart and can be shared; st_folium mutates the map, so each caller
+# gets its own unpickled copy of it.
+memoize_figure = st.cache_resource(
+    max_entries=FIGURE_CACHE_ENTRIES, show_spinner=False, hash_funcs={np.ndarray: array_digest}
+)
+memoize_map = st.cache_data(
+    max_entries=FIGURE_CACHE_ENTRIES, show_spinner=False, hash_funcs={np.ndarray: array_digest}
+)
+
+build_spectral_health_map = memoize_map(figures.build_spectral_health_map)
+create_temporal_trend_chart = memoize_figure(figures.create_temporal_trend_chart)
+create_health_pie_chart = memoize_figure(figures.create_health_pie_chart)
+create_transition_pie_chart = memoize_figure(figures.create_transition_pie_chart)
+create_soil_condition_chart = memoize_figure(figures.create_soil_condition_chart)
+create_temperature_chart = memoize_figure(figures.create_temperature_chart)
+create_zone_map = memoize_figure(figures.create_zone_map)
+build_management_zones = memoize_figure(zones.build_zones)
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def display_analysis_progress():
+    """Polls the session's background analysis job; only this fragment reruns while it is in flight."""
+    job = ANALYSIS_JOBS.get(st.session_state.analysis_job_id)
+    if job is None or job.done:
+        if job is not None and job.status == DONE:
+            st.session_state.result_key = job.result
+            st.session_state.view_state = 'dashboard'
+        elif job is not None and job.status == FAILED:
+            st.session_state.analysis_message = ('error', f"Analysis failed: {job.error}")
+        elif job is not None and job.status == CANCELLED:
+            st.session_state.analysis_message = ('info', "Analysis cancelled.")
+        st.session_state.analysis_job_id = None
+        st.rerun()
+
+    if job.status == QUEUED:
+        ahead = ANALYSIS_JOBS.queue_position(job)
+        st.progress(0.0, text=f"⏳ Waiting for a free worker ({ahead} analyses ahead)...")
+    elif job.cancel_requested:
+        st.progress(job.progress or 0.0, text="Cancelling...")
+    else:
+        st.progress(job.progress or 0.0, text=f"🛰️ {job.stage}...")
+    if st.button("Cancel Analysis", disabled=job.cancel_requested):
+        job.cancel()
+
+
+def format_period(period):
+    return f"{period[0]:%d %b} – {period[1]:%d %b %Y}"
+
+def display_spectral_health_map(stress_array, bounds, aoi, detected_anomalies=(), change=None):
+    change_array, change_label = None, None
+    if change is not None:
+        change_array, change_label = change['change_map_array'], f"Change since {format_period(change['compare_range'])}"
+    health_map = build_spectral_health_map(stress_array, bounds, aoi, list(detected_anomalies), change_array, change_label)
+    with span("render.folium_component"):
+        st_folium(health_map, width="100%", height=500, returned_objects=[], render=False)
 
-def display_anomaly_alert_system(forecast, health_dist, detected_anomaly=None):
-    if detected_anomaly:
-        st.error(f"🚨 **Pattern Detected: {detected_anomaly['type']}!**", icon="🔎")
-        st.markdown(f"**Description:** {detected_anomaly['description']}")
-        st.markdown(f"**Recommended Action:** Investigate the highlighted area on the map immediately.")
+@memoize_figure
+def summarize_decline(declining, field_px):
+    """Percent of the field forecast to decline and the number of separate declining areas."""
+    labels, _ = label_regions(declining)
+    declining_pct = 100.0 * np.count_nonzero(declining) / max(field_px, 1)
+    return declining_pct, int(np.count_nonzero(np.bincount(labels.ravel())[1:] >= MIN_AREA_PX))
+
+def display_anomaly_alert_system(forecast, health_dist, detected_anomalies=(), declining=None):
+    if detected_anomalies:
+        total_ha = sum(a['area_ha'] for a in detected_anomalies)
+        st.error(f"🚨 **{len(detected_anomalies)} Stress Pattern(s) Detected** covering {total_ha:.2f} ha!", icon="🔎")
+        for anomaly in detected_anomalies[:MAX_LISTED_ANOMALIES]:
+            st.markdown(f"**{anomaly['type']}** · {anomaly['area_ha']:.2f} ha · {anomaly['severe_fraction']:.0%} severe — {anomaly['description']}")
+        if len(detected_anomalies) > MAX_LISTED_ANOMALIES:
+            st.markdown(f"…and {len(detected_anomalies) - MAX_LISTED_ANOMALIES} smaller patches shown on the map.")
+        st.markdown("**Recommended Action:** Investigate the highlighted areas on the map, largest first.")
         st.markdown("---")
 
-    is_declining = forecast[-1] < forecast[0]
+    # Share of the field whose per-pixel forecast declines, and in how many separate areas.
+    declining_pct, declining_areas = 0.0, 0
+    if declining is not None and declining.any():
+        declining_pct, declining_areas = summarize_decline(np.ma.filled(declining, False), int(declining.count()))
+    is_declining = declining_pct >= DECLINE_ALERT_PCT or forecast[-1] < forecast[0]
     is_severe = health_dist.get('Severe', 0) > 20
     
     if is_severe:
         st.error(f"‼️ **Action Required:** {health_dist['Severe']}% of your farm shows significant stress. Investigate the highlighted red zones immediately.", icon="🚨")
+    elif is_declining and declining_areas:
+        st.warning(f"⚠️ **Early Warning:** Crop health is predicted to decline on {declining_pct:.0f}% of your farm across {declining_areas} area(s). Check irrigation and nutrient levels.", icon="📉")
     elif is_declining:
         st.warning("⚠️ **Early Warning:** Crop health is predicted to decline. Check irrigation and nutrient levels.", icon="📉")
     else:
         st.success("✅ **All Clear:** Your farm is healthy and the forecast is stable.", icon="👍")
 
-def create_soil_condition_chart(dates, moisture_data):
-    fig = go.Figure()
-    fig.add_trace(go.Scatter(x=dates, y=moisture_data, mode='lines', fill='tozeroy', name='Soil Moisture', line=dict(color='#966919', width=2)))
-    fig.update_layout(
-        title_text='<b>Historical Soil Moisture</b>',
-        xaxis_title='Date', yaxis_title='Soil Moisture Level',
-        paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font=dict(color='white')
-    )
-    return fig
-
-# --- NEW FUNCTION FOR TEMPERATURE CHART ---
-def create_temperature_chart(dates, temp_data):
-    """Creates a themed Plotly line chart for temperature."""
-    fig = go.Figure()
-    fig.add_trace(go.Scatter(x=dates, y=temp_data, mode='lines', name='Temperature', line=dict(color='#FF5733', width=2)))
-    fig.update_layout(
-        title_text='<b>Historical Temperature</b>',
-        xaxis_title='Date', yaxis_title='Temperature (°C)',
-        paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font=dict(color='white')
-    )
-    return fig
+def display_field_breakdown(fields):
+    """One row per field plus the combined totals, for analyses covering several fields."""
+    rows = [{
+        "Field": f['name'], "Area (ha)": round(f['area_ha'], 2),
+        **{f"{name} %": pct for name, pct in f['health_distribution'].items()},
+        "Declining %": round(f['declining_pct'], 1), "Anomalies": f['anomaly_count'],
+    } for f in fields]
+    st.dataframe(rows, hide_index=True, use_container_width=True)
+    total_ha = sum(f['area_ha'] for f in fields)
+    st.caption(f"{len(fields)} fields · {total_ha:.2f} ha combined · "
+               f"{sum(f['anomaly_count'] for f in fields)} anomalies")
+
+def display_change_summary(change):
+    """Change since the comparison period: headline shares and the class transitions pie."""
+    dist = change['change_distribution']
+    st.markdown(f"**Since {format_period(change['compare_range'])}:** {dist['Degraded']}% degraded, "
+                f"{dist['Improved']}% improved, {dist['Unchanged']}% unchanged.")
+    st.plotly_chart(create_transition_pie_chart(change['transitions']), use_container_width=True)
+    st.caption(f"{change['tiles_changed']} of {change['tiles_total']} scene tiles changed; "
+               f"{change['tiles_recomputed']} had to be reclassified. Toggle the change layer on the map.")
+
+# Each panel is a fragment: interacting with one reruns only that panel, not the whole script.
+@st.fragment
+def display_map_panel(data, aoi):
+    with st.container(border=True):
+        st.subheader("📍 Spectral Health Map & Anomaly Finder")
+        display_spectral_health_map(data['stress_map_array'], data['aoi_bounds'], aoi, data['detected_anomalies'], data['change'])
+
+@st.fragment
+def display_insights_panel(data):
+    with st.container(border=True):
+        st.subheader("💡 Key Insights & Alerts")
+        display_anomaly_alert_system(data['ndvi_pred'], data['health_distribution'], data['detected_anomalies'], data['declining_mask'])
+        
+        yield_val = estimate_yield(data['ndvi_hist'])
+        st.metric(label="Estimated Yield", value=f"{yield_val:.2f} Tonnes/Hectare", delta=f"{(yield_val - 4.5):.2f} vs. avg")
+        distribution = data['health_distribution']
+        if len(data['fields']) > 1:
+            display_field_breakdown(data['fields'])
+            # The pie shows all fields together or any single one.
+            names = ["All fields"] + [f['name'] for f in data['fields']]
+            choice = st.selectbox("Health distribution for", names)
+            if choice != names[0]:
+                distribution = data['fields'][names.index(choice) - 1]['health_distribution']
+        st.plotly_chart(create_health_pie_chart(distribution), use_container_width=True)
+        if data['change'] is not None:
+            display_change_summary(data['change'])
+
+@st.fragment
+def display_temporal_panel(data):
+    with st.container(border=True):
+        st.subheader("📈 Temporal Analytics")
+        st.plotly_chart(create_temporal_trend_chart(data['ndvi_hist'], data['ndvi_pred']), use_container_width=True)
+    
+        with st.expander("View Environmental Data"):
+            dates, window = data['dates'], None
+            if len(dates) > ENV_CHART_MAX_POINTS:
+                # Charts show a reduced series; narrowing the period re-reduces just that range at full detail.
+                first, last = dates[0].astype(object), dates[-1].astype(object)
+                window = st.slider("Zoom to period", min_value=first, max_value=last, value=(first, last), format="YYYY-MM-DD")
+            # --- UPDATED TO DISPLAY CHARTS SIDE-BY-SIDE ---
+            env_col1, env_col2 = st.columns(2)
+            with env_col1:
+                st.plotly_chart(create_soil_condition_chart(dates, data['soil_moisture_hist'], window), use_container_width=True)
+            with env_col2:
+                st.plotly_chart(create_temperature_chart(dates, data['temperature_hist'], window), use_container_width=True)
+
+@memoize_figure
+def prescription_files(zone_labels, bounds, zone_stats, rates):
+    """GeoJSON and CSV downloads for the zones; rebuilt only when the zones or rates change."""
+    geojson = json.dumps(prescription_geojson(zone_labels, bounds, zone_stats, rates))
+    table = prescription_table(zone_stats, rates)
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=list(table[0]) if table else ["ZONE"])
+    writer.writeheader()
+    writer.writerows(table)
+    return geojson, out.getvalue()
+
+@st.fragment
+def display_zones_panel(data):
+    """Per-zone statistics and a variable-rate prescription for the whole field."""
+    with st.container(border=True):
+        st.subheader("🧭 Management Zones & Prescription")
+        method_col, size_col, rate_col = st.columns(3)
+        method = ZONE_METHODS[method_col.radio("Zones from", list(ZONE_METHODS), horizontal=True)]
+        if method == "grid":
+            size = size_col.number_input("Cell size (m)", min_value=5, max_value=500, value=DEFAULT_CELL_M, step=5)
+        else:
+            size = size_col.slider("Number of zones", min_value=2, max_value=8, value=DEFAULT_ZONE_COUNT)
+        base_rate = rate_col.number_input("Base rate (kg/ha)", min_value=0.0, value=DEFAULT_BASE_RATE, step=5.0)
+
+        cube = data['ndvi_forecast_cube']
+        zone_labels, zone_stats = build_management_zones(
+            data['stress_map_array'], data['ndvi_map_array'], data['aoi_bounds'], method, size, trend=cube[-1] - cube[0]
+        )
+        table = prescription_table(zone_stats, prescription_rates(zone_stats, base_rate))
+        map_col, table_col = st.columns([2, 3])
+        with map_col:
+            st.plotly_chart(create_zone_map(zone_labels, zone_stats), use_container_width=True)
+        with table_col:
+            # Only the rate is editable; the key resets edits whenever the zones themselves change.
+            table = st.data_editor(
+                table, hide_index=True, use_container_width=True, height=320,
+                disabled=[name for name in (table[0] if table else {}) if name != "RATE"],
+                key=f"zone_rates-{method}-{size}-{base_rate}",
+            )
+        rates = [row['RATE'] for row in table]
+        total_t = sum(z['yield_t_ha'] * z['area_ha'] for z in zone_stats if not np.isnan(z['yield_t_ha']))
+        total_input = sum(rate * z['area_ha'] for rate, z in zip(rates, zone_stats) if rate is not None)
+        st.caption(f"{len(zone_stats)} zones · estimated production {total_t:.1f} t · "
+                   f"total input {total_input:.0f} kg at the rates above")
+
+        geojson, table_csv = prescription_files(zone_labels, data['aoi_bounds'], zone_stats, rates)
+        geojson_col, csv_col = st.columns(2)
+        geojson_col.download_button("Download prescription (GeoJSON)", geojson, file_name="prescription.geojson",
+                                    mime="application/geo+json", use_container_width=True)
+        csv_col.download_button("Download zone table (CSV)", table_csv, file_name="prescription_zones.csv",
+                                mime="text/csv", use_container_width=True)
 
 # --- 6. STREAMLIT APP LAYOUT ---
 
@@ -293,8 +376,8 @@ with st.sidebar:
         st.header("How to Use")
         st.markdown("""
         1. **Find your farm** using the search bar.
-        2. **Draw the boundary** using the polygon tool.
-        3. **Select a date range** for analysis.
+        2. **Draw the boundary** using the polygon tool (one polygon per field; draw them all).
+        3. **Select a date range** for analysis (optionally, an earlier one to compare with).
         4. Click **Analyze Farm**.
         """)
     
@@ -304,23 +387,42 @@ with st.sidebar:
         (datetime.now().date() - timedelta(days=30), datetime.now().date())
     )
     
+    compare_range = ()
+    if st.checkbox("Compare with an earlier period"):
+        compare_range = st.date_input(
+            "Earlier period",
+            tuple(d - timedelta(days=COMPARE_OFFSET_DAYS) for d in date_range) if len(date_range) == 2 else ()
+        )
+    
     if st.button("Analyze Farm", type="primary", use_container_width=True):
-        if st.session_state.drawn_aoi:
-            with st.spinner("🛰️ Fetching satellite data & running analysis..."):
-                time.sleep(1.5)
-                st.session_state.mock_data = generate_mock_data(st.session_state.drawn_aoi)
-                time.sleep(1.5)
-            st.session_state.view_state = 'dashboard'
-            st.rerun()
-        else:
+        if not st.session_state.drawn_aoi:
             st.error("Please draw a farm boundary on the map first.")
+        elif len(date_range) != 2 or len(compare_range) not in (0, 2):
+            st.error("Please select both a start and an end date.")
+        else:
+            # Runs on the shared worker pool; the main panel polls the job until it finishes.
+            previous_job = ANALYSIS_JOBS.get(st.session_state.analysis_job_id)
+            if previous_job is not None:
+                previous_job.cancel()
+            # A comparison adds the earlier period's two dates to the cache key.
+            aoi, dates, session_id = st.session_state.drawn_aoi, tuple(date_range) + tuple(compare_range), current_session_id()
+            job = ANALYSIS_JOBS.submit(
+                lambda job: SESSION_RESULTS.attach(session_id, aoi_cache_key(aoi, dates), ANALYSIS_CACHE.get_or_compute(
+                    aoi, dates, lambda aoi, dates: run_farm_analysis(
+                        aoi, dates[:2], progress=job.report, compare_range=dates[2:] or None
+                    )
+                ))
+            )
+            st.session_state.analysis_job_id = job.id
+            st.session_state.analysis_message = None
             
     if st.session_state.view_state == 'dashboard':
         st.markdown("---")
         if st.button("Start New Analysis", use_container_width=True):
             st.session_state.view_state = 'initial'
             st.session_state.drawn_aoi = None
-            st.session_state.mock_data = None
+            st.session_state.result_key = None
+            SESSION_RESULTS.release(current_session_id())
             st.rerun()
 
 # --- MAIN PANEL ---
@@ -330,13 +432,21 @@ st.markdown("---")
 # --- INITIAL VIEW ---
 if st.session_state.view_state == 'initial':
     st.info("🎯 **Get Started:** Draw your farm boundary using the polygon tool 툴 on the map.", icon="🗺️")
+    if st.session_state.analysis_job_id:
+        display_analysis_progress()
+    elif st.session_state.analysis_message:
+        level, message = st.session_state.analysis_message
+        getattr(st, level)(message)
     
-    initial_map = folium.Map(location=[22.3, 73.1], zoom_start=12, tiles="CartoDB dark_matter", attr="CartoDB")
+    # Basemaps come through the local caching proxy (see basemap.py), so they keep working offline.
+    initial_map = folium.Map(location=[22.3, 73.1], zoom_start=12, tiles=None)
     
-    folium.TileLayer('https://mt1.google.com/vt/lyrs=s&x={x}&y={y}&z={z}', attr='Google', name='Google Satellite').add_to(initial_map)
-    folium.TileLayer('https://mt1.google.com/vt/lyrs=y&x={x}&y={y}&z={z}', attr='Google', name='Google Hybrid').add_to(initial_map)
+    basemap_layer("carto-dark").add_to(initial_map)
+    basemap_layer("google-satellite").add_to(initial_map)
+    basemap_layer("google-hybrid").add_to(initial_map)
     
-    Geocoder(collapsed=False, position='topleft', add_marker=False).add_to(initial_map)
+    # Searches go to the local village gazetteer when one is configured (see gazetteer.py).
+    Geocoder(collapsed=False, position='topleft', add_marker=False, **geocoder_options()).add_to(initial_map)
     Draw(
         export=False,
         draw_options={'polyline': False, 'marker': False, 'circlemarker': False, 'circle': False, 'polygon': {'shapeOptions': {'color': '#33bbff'}}}
@@ -345,53 +455,39 @@ if st.session_state.view_state == 'initial':
     
     map_output = st_folium(initial_map, width="100%", height=600)
     
-    if map_output and map_output.get("all_drawings"):
-        if map_output["all_drawings"]:
-            st.session_state.drawn_aoi = map_output["all_drawings"][0]['geometry']
-            st.success("✅ Farm boundary captured! Click 'Analyze Farm' in the sidebar to proceed.")
+    # Every drawn field is analysed together in one pass.
+    fields = drawn_fields(map_output.get("all_drawings")) if map_output else []
+    if fields:
+        aoi = combine_fields(fields)
+        if aoi != st.session_state.drawn_aoi:
+            # Warm the basemap cache around the new boundary while the analysis runs.
+            aoi_bounds = geometry_bounds(aoi)
+            prefetch_aoi(aoi_bounds, min(fit_zoom(aoi_bounds), figures.MAP_ZOOM_START))
+        st.session_state.drawn_aoi = aoi
+        captured = "Farm boundary" if len(fields) == 1 else f"{len(fields)} field boundaries"
+        st.success(f"✅ {captured} captured! Click 'Analyze Farm' in the sidebar to proceed.")
 
 # --- DASHBOARD VIEW ---
 elif st.session_state.view_state == 'dashboard':
-    data = st.session_state.mock_data
+    data = SESSION_RESULTS.get(current_session_id(), st.session_state.result_key)
+    if data is None:
+        # The shared store dropped this result (e.g. the session was idle past its TTL).
+        st.session_state.view_state = 'initial'
+        st.session_state.analysis_message = ('info', "Your previous analysis expired; please run it again.")
+        st.rerun()
     
     col1, col2 = st.columns([3, 2], gap="large")
     
     with col1:
-        with st.container(border=True):
-            st.subheader("📍 Spectral Health Map & Anomaly Finder")
-            display_spectral_health_map(data['stress_map_array'], data['aoi_bounds'], st.session_state.drawn_aoi['coordinates'][0], data['detected_anomaly'])
+        display_map_panel(data, st.session_state.drawn_aoi)
     
     with col2:
-        with st.container(border=True):
-            st.subheader("💡 Key Insights & Alerts")
-            display_anomaly_alert_system(data['ndvi_pred'], data['health_distribution'], data['detected_anomaly'])
-            
-            yield_val = float(np.mean(data['ndvi_hist']) * 6.5)
-            st.metric(label="Estimated Yield", value=f"{yield_val:.2f} Tonnes/Hectare", delta=f"{(yield_val - 4.5):.2f} vs. avg")
-            
-            pie_fig = go.Figure(data=[go.Pie(
-                labels=list(data['health_distribution'].keys()), 
-                values=list(data['health_distribution'].values()), 
-                hole=.4, marker_colors=['#2ca02c', '#ff7f0e', '#d62728'],
-                pull=[0, 0, 0.1]
-            )])
-            pie_fig.update_layout(
-                title_text='<b>Farm Health Distribution</b>', showlegend=True, height=280, 
-                margin=dict(t=50, b=10, l=10, r=10),
-                paper_bgcolor='rgba(0,0,0,0)', font=dict(color='white')
-            )
-            st.plotly_chart(pie_fig, use_container_width=True)
+        display_insights_panel(data)
 
     st.markdown("---")
     
-    with st.container(border=True):
-        st.subheader("📈 Temporal Analytics")
-        st.plotly_chart(create_temporal_trend_chart(data['ndvi_hist'], data['ndvi_pred']), use_container_width=True)
-    
-        with st.expander("View Environmental Data"):
-            # --- UPDATED TO DISPLAY CHARTS SIDE-BY-SIDE ---
-            env_col1, env_col2 = st.columns(2)
-            with env_col1:
-                st.plotly_chart(create_soil_condition_chart(data['dates'], data['soil_moisture_hist']), use_container_width=True)
-            with env_col2:
-                st.plotly_chart(create_temperature_chart(data['dates'], data['temperature_hist']), use_container_width=True)
\ No newline at end of file
+    display_temporal_panel(data)
+
+    display_zones_panel(data)
+
+end_rerun(rerun_timer)
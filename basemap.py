@@ -0,0 +1,428 @@
+"""Caching proxy for the basemap tiles (satellite, hybrid, dark) under the maps.
+
+Leaflet fetches basemap tiles from the local server at
+`/basemap/<name>/<z>/<x>/<y>` instead of the remote tile servers. Each basemap
+is cached in its own MBTiles file (SQLite; the standard `tiles` and
+`metadata` tables plus a last-access column), so a field office with a slow
+link downloads every tile once, and the files can be opened by any MBTiles
+viewer or copied to another machine. Each file is kept under a size limit
+by evicting the least recently used tiles.
+
+`prefetch_aoi` queues the tiles around a drawn field, at the zoom levels
+around the one the map opens at, on a background thread. With
+KRISHI_OFFLINE=1 the proxy never contacts the upstream servers and serves
+only what is cached. KRISHI_BASEMAP_UPSTREAM replaces every upstream with
+`<url>/<name>/{z}/{x}/{y}`, e.g. a `FakeUpstream` for development without a
+network:
+
+    python basemap.py prefetch 22.30 73.10 22.31 73.11 --zooms 12-18
+    python basemap.py stats
+"""
+import argparse
+import os
+import queue
+import sqlite3
+import struct
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import folium
+
+import local_server
+from tiling import tile_range
+
+CACHE_DIR = os.environ.get(
+    "KRISHI_BASEMAP_CACHE", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".krishi_cache", "basemaps")
+)
+MAX_BYTES = int(float(os.environ.get("KRISHI_BASEMAP_MAX_MB", "256")) * 1024 * 1024)  # per basemap
+OFFLINE = os.environ.get("KRISHI_OFFLINE", "") not in ("", "0")
+UPSTREAM_OVERRIDE = os.environ.get("KRISHI_BASEMAP_UPSTREAM", "").rstrip("/")
+FETCH_TIMEOUT = 10
+EVICT_TO = 0.9  # after going over the limit, evict down to this share of it
+TOUCH_SECONDS = 60  # last-access updates coarser than this are skipped
+PREFETCH_ZOOM_RADIUS = 2
+PREFETCH_MARGIN = 0.5  # of the AOI's extent, on each side
+MAX_PREFETCH_TILES = 400
+USER_AGENT = "Krishi-Drishti tile cache"
+
+BASEMAPS = {
+    "carto-dark": {
+        "url": "https://a.basemaps.cartocdn.com/dark_all/{z}/{x}/{y}.png",
+        "attr": "CartoDB", "name": "CartoDB dark_matter",
+    },
+    "google-satellite": {
+        "url": "https://mt1.google.com/vt/lyrs=s&x={x}&y={y}&z={z}",
+        "attr": "Google", "name": "Google Satellite",
+    },
+    "google-hybrid": {
+        "url": "https://mt1.google.com/vt/lyrs=y&x={x}&y={y}&z={z}",
+        "attr": "Google", "name": "Google Hybrid",
+    },
+    "openstreetmap": {
+        "url": "https://tile.openstreetmap.org/{z}/{x}/{y}.png",
+        "attr": "&copy; OpenStreetMap contributors", "name": "OpenStreetMap",
+    },
+}
+PREFETCH_BASEMAPS = ("carto-dark", "google-satellite")
+
+_SIGNATURES = [(b"\x89PNG", "png", "image/png"), (b"\xff\xd8", "jpg", "image/jpeg"), (b"RIFF", "webp", "image/webp")]
+
+
+def tile_format(data):
+    """(MBTiles format name, MIME type) of an encoded tile, from its magic bytes."""
+    for magic, fmt, mime in _SIGNATURES:
+        if data.startswith(magic):
+            return fmt, mime
+    return "png", "application/octet-stream"
+
+
+def is_tile_image(data):
+    """True if `data` starts with a PNG, JPEG or WebP signature (not, say, a captive portal's HTML)."""
+    return any(data.startswith(magic) for magic, _, _ in _SIGNATURES)
+
+
+class TileStore:
+    """One MBTiles file with least-recently-used eviction past `max_bytes`."""
+
+    def __init__(self, path, name, max_bytes=MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT)")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER,"
+                " tile_data BLOB, last_access INTEGER)"
+            )
+            self._db.execute("CREATE UNIQUE INDEX IF NOT EXISTS tile_index ON tiles (zoom_level, tile_column, tile_row)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS tile_access ON tiles (last_access)")
+            self._db.execute("INSERT OR IGNORE INTO metadata VALUES ('name', ?), ('type', 'baselayer')", (name,))
+            self._bytes = self._db.execute("SELECT COALESCE(SUM(LENGTH(tile_data)), 0) FROM tiles").fetchone()[0]
+        self.hits = self.misses = 0
+
+    @staticmethod
+    def _key(z, x, y):
+        # MBTiles rows count from the south (TMS); XYZ rows count from the north.
+        return z, x, (1 << z) - 1 - y
+
+    def get(self, z, x, y):
+        now = int(time.time())
+        with self._lock:
+            row = self._db.execute(
+                "SELECT tile_data, last_access FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+                self._key(z, x, y),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if now - row[1] > TOUCH_SECONDS:
+                self._db.execute(
+                    "UPDATE tiles SET last_access=? WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+                    (now,) + self._key(z, x, y),
+                )
+            return row[0]
+
+    def __contains__(self, zxy):
+        with self._lock:
+            return self._db.execute(
+                "SELECT 1 FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?", self._key(*zxy)
+            ).fetchone() is not None
+
+    def put(self, z, x, y, data):
+        with self._lock:
+            old = self._db.execute(
+                "SELECT LENGTH(tile_data) FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+                self._key(z, x, y),
+            ).fetchone()
+            self._db.execute("INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?, ?)",
+                             self._key(z, x, y) + (sqlite3.Binary(data), int(time.time())))
+            self._db.execute("INSERT OR IGNORE INTO metadata VALUES ('format', ?)", (tile_format(data)[0],))
+            self._bytes += len(data) - (old[0] if old else 0)
+            if self._bytes > self.max_bytes:
+                self._evict(int(self.max_bytes * EVICT_TO))
+
+    def _evict(self, target):
+        # Oldest first, in batches, until the file's tiles fit the target again.
+        while self._bytes > target:
+            rows = self._db.execute(
+                "SELECT rowid, LENGTH(tile_data) FROM tiles ORDER BY last_access LIMIT 256"
+            ).fetchall()
+            if not rows:
+                self._bytes = 0
+                return
+            for rowid, size in rows:
+                self._db.execute("DELETE FROM tiles WHERE rowid=?", (rowid,))
+                self._bytes -= size
+                if self._bytes <= target:
+                    break
+
+    def stats(self):
+        with self._lock:
+            count = self._db.execute("SELECT COUNT(*) FROM tiles").fetchone()[0]
+        return {"tiles": count, "bytes": self._bytes, "max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class TileProxy:
+    """Serves one basemap from its TileStore, filling misses from `upstream` unless offline."""
+
+    def __init__(self, name, upstream, store, offline=OFFLINE, timeout=FETCH_TIMEOUT):
+        self.name = name
+        self.upstream = upstream
+        self.store = store
+        self.offline = offline
+        self.timeout = timeout
+        self.upstream_errors = 0
+
+    def fetch(self, z, x, y):
+        request = urllib.request.Request(self.upstream.format(z=z, x=x, y=y), headers={"User-Agent": USER_AGENT})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return response.read()
+
+    def tile(self, z, x, y):
+        """Tile bytes from the cache, or fetched and cached; None when unavailable."""
+        data = self.store.get(z, x, y)
+        if data is not None or self.offline:
+            return data
+        try:
+            data = self.fetch(z, x, y)
+        except (urllib.error.URLError, OSError):
+            self.upstream_errors += 1
+            return None
+        if not is_tile_image(data):
+            # A 200 that is not an image (proxy or login page) must never be cached as a tile.
+            self.upstream_errors += 1
+            return None
+        self.store.put(z, x, y, data)
+        return data
+
+    def ensure(self, z, x, y):
+        """Fetches a tile into the cache if it is not there yet (for prefetching)."""
+        if self.offline or (z, x, y) in self.store:
+            return
+        self.tile(z, x, y)
+
+
+_proxies = {}
+_proxies_lock = threading.Lock()
+
+
+def get_proxy(name):
+    """The shared TileProxy for basemap `name`, opened on first use."""
+    with _proxies_lock:
+        proxy = _proxies.get(name)
+        if proxy is None:
+            upstream = f"{UPSTREAM_OVERRIDE}/{name}/{{z}}/{{x}}/{{y}}" if UPSTREAM_OVERRIDE else BASEMAPS[name]['url']
+            store = TileStore(os.path.join(CACHE_DIR, f"{name}.mbtiles"), BASEMAPS[name]['name'])
+            proxy = _proxies[name] = TileProxy(name, upstream, store)
+        return proxy
+
+
+def _serve_basemap(parts, query):
+    """Handles /basemap/<name>/<z>/<x>/<y>."""
+    if len(parts) != 4 or parts[0] not in BASEMAPS or not all(p.isdigit() for p in parts[1:]):
+        return 404, "text/plain", b"bad basemap tile path"
+    z, x, y = (int(p) for p in parts[1:])
+    if z > 22 or x >= 1 << z or y >= 1 << z:
+        return 404, "text/plain", b"tile out of range"
+    data = get_proxy(parts[0]).tile(z, x, y)
+    if data is None:
+        # Offline and not cached, or upstream unreachable; Leaflet leaves the tile blank.
+        return 404, "text/plain", b"tile not available"
+    return 200, tile_format(data)[1], data, {"Cache-Control": "public, max-age=604800"}
+
+
+local_server.register_route("basemap", _serve_basemap)
+
+
+def tile_url(name):
+    """Leaflet URL template for basemap `name` through the local proxy."""
+    return local_server.public_url(f"basemap/{name}") + "/{z}/{x}/{y}"
+
+
+def basemap_layer(name, **kwargs):
+    """folium.TileLayer for basemap `name`, served through the proxy."""
+    info = BASEMAPS[name]
+    return folium.TileLayer(tiles=tile_url(name), attr=info['attr'], name=info['name'], **kwargs)
+
+
+def prefetch_tiles(bounds, zooms, margin=PREFETCH_MARGIN, max_tiles=MAX_PREFETCH_TILES):
+    """(z, x, y) tiles covering `bounds` plus `margin` at each zoom, finest zooms last, at most `max_tiles`."""
+    (min_lat, min_lon), (max_lat, max_lon) = bounds
+    pad_lat, pad_lon = (max_lat - min_lat) * margin, (max_lon - min_lon) * margin
+    padded = [[min_lat - pad_lat, min_lon - pad_lon], [max_lat + pad_lat, max_lon + pad_lon]]
+    tiles = []
+    for z in sorted(zooms):
+        tx0, tx1, ty0, ty1 = tile_range(padded, z)
+        level = [(z, x, y) for x in range(tx0, tx1 + 1) for y in range(ty0, ty1 + 1)]
+        if len(tiles) + len(level) > max_tiles:
+            break
+        tiles.extend(level)
+    return tiles
+
+
+class Prefetcher:
+    """Background thread filling the basemap caches from a queue of tiles."""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._queued = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, name, tiles):
+        with self._lock:
+            for tile in tiles:
+                if (name, tile) not in self._queued:
+                    self._queued.add((name, tile))
+                    self._queue.put((name, tile))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="krishi-basemap-prefetch", daemon=True)
+                self._thread.start()
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _run(self):
+        while True:
+            name, tile = self._queue.get()
+            try:
+                get_proxy(name).ensure(*tile)
+            except Exception:
+                pass  # prefetching is best effort
+            with self._lock:
+                self._queued.discard((name, tile))
+
+
+PREFETCHER = Prefetcher()
+
+
+def fit_zoom(bounds, viewport_px=600):
+    """Largest zoom at which `bounds` fits in a `viewport_px` square map."""
+    for z in range(22, 0, -1):
+        tx0, tx1, ty0, ty1 = tile_range(bounds, z)
+        if max(tx1 - tx0, ty1 - ty0) + 1 <= viewport_px / 256:
+            return z
+    return 0
+
+
+def prefetch_aoi(bounds, zoom, names=PREFETCH_BASEMAPS, radius=PREFETCH_ZOOM_RADIUS):
+    """Queues the basemap tiles around `bounds` for zooms `zoom - radius` to `zoom + radius`."""
+    if OFFLINE:
+        return 0
+    tiles = prefetch_tiles(bounds, range(max(zoom - radius, 0), min(zoom + radius, 22) + 1))
+    for name in names:
+        PREFETCHER.submit(name, tiles)
+    return len(tiles) * len(names)
+
+
+def _png(width, height, rgb):
+    """Minimal solid-colour truecolour PNG."""
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+    raw = b"".join(b"\x00" + bytes(rgb) * width for _ in range(height))
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b"")
+
+
+class FakeUpstream:
+    """Local stand-in for a remote tile server: `/<anything>/<z>/<x>/<y>` returns a solid tile.
+
+    Counts requests and can be switched to fail, or to answer 200 with an
+    HTML page like a captive portal, so the proxy's caching and offline
+    behaviour can be exercised without a network.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0):
+        fake = self
+        self.requests = 0
+        self.failing = False
+        self.portal = False
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                fake.requests += 1
+                parts = [p for p in self.path.split("/") if p]
+                if fake.failing or len(parts) < 3 or not all(p.isdigit() for p in parts[-3:]):
+                    self.send_response(503)
+                    self.end_headers()
+                    return
+                z, x, y = (int(p) for p in parts[-3:])
+                if fake.portal:
+                    body, content_type = b"<html><body>Sign in to continue</body></html>", "text/html"
+                else:
+                    body, content_type = _png(256, 256, ((x * 37) % 256, (y * 59) % 256, (z * 16) % 256)), "image/png"
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="krishi-fake-upstream", daemon=True).start()
+        self.url = f"http://{host}:{self._server.server_address[1]}"
+
+    def template(self, name="tiles"):
+        return f"{self.url}/{name}/{{z}}/{{x}}/{{y}}"
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Seed or inspect the offline basemap cache.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    seed = commands.add_parser("prefetch", help="download the tiles around an area into the cache")
+    seed.add_argument("bounds", nargs=4, type=float, metavar=("MIN_LAT", "MIN_LON", "MAX_LAT", "MAX_LON"))
+    seed.add_argument("--zooms", default="12-18", help="zoom range, e.g. 12-18")
+    seed.add_argument("--basemaps", default=",".join(BASEMAPS), help="comma-separated basemap names")
+    seed.add_argument("--max-tiles", type=int, default=5000)
+    commands.add_parser("serve-fake", help="run a fake upstream tile server until interrupted")
+    commands.add_parser("stats", help="print the size of each basemap cache")
+    args = parser.parse_args(argv)
+
+    if args.command == "prefetch":
+        lo, _, hi = args.zooms.partition("-")
+        min_lat, min_lon, max_lat, max_lon = args.bounds
+        tiles = prefetch_tiles([[min_lat, min_lon], [max_lat, max_lon]], range(int(lo), int(hi or lo) + 1),
+                               margin=0, max_tiles=args.max_tiles)
+        for name in args.basemaps.split(","):
+            proxy = get_proxy(name)
+            for i, tile in enumerate(tiles, start=1):
+                proxy.ensure(*tile)
+                if i % 100 == 0 or i == len(tiles):
+                    print(f"{name}: {i}/{len(tiles)} tiles", file=sys.stderr)
+            print(name, proxy.store.stats())
+    elif args.command == "serve-fake":
+        fake = FakeUpstream(port=8599)
+        print(f"fake upstream at {fake.url}; set KRISHI_BASEMAP_UPSTREAM={fake.url}", file=sys.stderr)
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            fake.close()
+    else:
+        for name in BASEMAPS:
+            print(name, get_proxy(name).store.stats())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,234 @@
+"""Headless batch analysis of many farm boundaries.
+
+Reads a GeoJSON FeatureCollection of field polygons and runs the dashboard's
+analysis path (`analysis.generate_mock_data`) for each one in a process pool.
+Results are streamed to the output directory as each field finishes:
+
+    parts/<name>.parquet      one summary row per field (see `part_name`)
+    fields.geojsonl           one GeoJSON Feature per line (field + summary);
+                              also the resume journal
+    errors.jsonl              fields that failed, retried on the next run
+
+and once every field is done, `summary.parquet` and `results.geojson` (fields
+plus anomaly polygons) are consolidated from those. Re-running the same
+command after a crash skips every field already in `fields.geojsonl`.
+
+    python batch_analyze.py farms.geojson --out results/ --workers 8
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import date, timedelta
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from analysis import estimate_yield, generate_mock_data
+from analysis_cache import aoi_fingerprint
+
+JOURNAL = "fields.geojsonl"
+ERRORS = "errors.jsonl"
+PARTS_DIR = "parts"
+MAX_IN_FLIGHT_PER_WORKER = 4
+PART_NAME_CHARS = 48
+_UNSAFE_NAME_CHARS = re.compile(r"[^A-Za-z0-9_-]+")
+
+
+def feature_id(feature):
+    """Stable id for a field: its `farm_id` property, the feature id, or a geometry hash."""
+    props = feature.get('properties') or {}
+    fid = props.get('farm_id') or feature.get('id')
+    return str(fid) if fid is not None else aoi_fingerprint(feature['geometry'])[:16]
+
+
+def completed_ids(out_dir):
+    """Ids already written to the journal; a torn last line from a crash is ignored."""
+    done = set()
+    path = os.path.join(out_dir, JOURNAL)
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)['properties']['farm_id'])
+            except (ValueError, KeyError):
+                continue
+    return done
+
+
+def _drop_torn_tail(path):
+    """Truncates a partially written last line so new records start on a clean line."""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+
+
+def _init_worker():
+    # Forked workers inherit the parent's RNG state; reseed so fields don't share random draws.
+    np.random.seed()
+
+
+def analyze_feature(farm_id, feature, date_range):
+    """Worker entry point: full analysis for one field, reduced to a picklable summary."""
+    data = generate_mock_data(feature['geometry'], date_range)
+    declining = data['declining_mask']
+    return {
+        "farm_id": farm_id,
+        "healthy_pct": data['health_distribution']['Healthy'],
+        "stressed_pct": data['health_distribution']['Stressed'],
+        "severe_pct": data['health_distribution']['Severe'],
+        "anomaly_count": len(data['detected_anomalies']),
+        "anomaly_area_ha": float(sum(a['area_ha'] for a in data['detected_anomalies'])),
+        "declining_pct": float(declining.mean() * 100) if declining.count() else 0.0,
+        "estimated_yield": estimate_yield(data['ndvi_hist']),
+        "ndvi_forecast": [float(v) for v in data['ndvi_pred']],
+        "anomalies": [
+            {"type": a['type'], "area_ha": a['area_ha'], "severe_fraction": a['severe_fraction'],
+             "centroid": list(a['centroid']), "coordinates": [list(c) for c in a['coordinates']]}
+            for a in data['detected_anomalies']
+        ],
+    }
+
+
+def part_name(farm_id):
+    """File name of a field's summary part: a sanitised prefix of the id plus a hash of the whole id.
+
+    Ids come straight from the GeoJSON, so they may hold path separators or
+    characters the filesystem rejects; the hash keeps ids that sanitise (or
+    case-fold) to the same prefix apart. The original id is kept in the row.
+    """
+    prefix = _UNSAFE_NAME_CHARS.sub("_", farm_id)[:PART_NAME_CHARS].strip("_")
+    return f"{prefix}-{hashlib.sha1(farm_id.encode('utf-8')).hexdigest()[:16]}.parquet"
+
+
+def _write_part(out_dir, summary, date_range):
+    row = {k: v for k, v in summary.items() if k != "anomalies"}
+    row["start_date"], row["end_date"] = date_range
+    table = pa.Table.from_pylist([row])
+    path = os.path.join(out_dir, PARTS_DIR, part_name(summary['farm_id']))
+    pq.write_table(table, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
+def _append_line(path, record):
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, separators=(",", ":")) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def consolidate(out_dir):
+    """Merges per-field parts into summary.parquet and the journal into results.geojson."""
+    parts_dir = os.path.join(out_dir, PARTS_DIR)
+    # Parts and the journal only exist once a field has succeeded.
+    names = os.listdir(parts_dir) if os.path.isdir(parts_dir) else []
+    parts = sorted(p for p in names if p.endswith(".parquet"))
+    if parts:
+        tables = [pq.read_table(os.path.join(parts_dir, p)) for p in parts]
+        pq.write_table(pa.concat_tables(tables, promote_options="default"), os.path.join(out_dir, "summary.parquet"))
+
+    features = []
+    journal = os.path.join(out_dir, JOURNAL)
+    if os.path.exists(journal):
+        with open(journal, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    field = json.loads(line)
+                except ValueError:
+                    continue
+                anomalies = field['properties'].pop('anomalies', [])
+                features.append(field)
+                for a in anomalies:
+                    features.append({
+                        "type": "Feature",
+                        "geometry": {"type": "Polygon", "coordinates": [a.pop('coordinates')]},
+                        "properties": dict(a, farm_id=field['properties']['farm_id'], kind="anomaly"),
+                    })
+    with open(os.path.join(out_dir, "results.geojson"), "w", encoding="utf-8") as f:
+        json.dump({"type": "FeatureCollection", "features": features}, f)
+
+
+def run_batch(features, out_dir, date_range, workers=None):
+    """Analyses every not-yet-completed feature; returns (processed, failed) counts."""
+    os.makedirs(os.path.join(out_dir, PARTS_DIR), exist_ok=True)
+    done = completed_ids(out_dir)
+    pending = [(feature_id(f), f) for f in features]
+    pending = [(fid, f) for fid, f in pending if fid not in done]
+    print(f"{len(done)} fields already done, {len(pending)} to go", file=sys.stderr)
+
+    journal = os.path.join(out_dir, JOURNAL)
+    errors = os.path.join(out_dir, ERRORS)
+    _drop_torn_tail(journal)
+    _drop_torn_tail(errors)
+    processed = failed = 0
+    started = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = workers * MAX_IN_FLIGHT_PER_WORKER
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        queue = iter(pending)
+        in_flight = {}
+        while True:
+            # Keep a bounded number of fields queued so thousands of features don't sit in memory as futures.
+            for fid, feature in queue:
+                in_flight[pool.submit(analyze_feature, fid, feature, date_range)] = (fid, feature)
+                if len(in_flight) >= max_in_flight:
+                    break
+            if not in_flight:
+                break
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                fid, feature = in_flight.pop(future)
+                try:
+                    summary = future.result()
+                except Exception as exc:
+                    failed += 1
+                    _append_line(errors, {"farm_id": fid, "error": repr(exc), "at": time.time()})
+                    continue
+                _write_part(out_dir, summary, date_range)
+                _append_line(journal, {
+                    "type": "Feature",
+                    "geometry": feature['geometry'],
+                    "properties": dict(feature.get('properties') or {}, **summary),
+                })
+                processed += 1
+                if processed % 50 == 0:
+                    rate = processed / (time.perf_counter() - started)
+                    print(f"{processed}/{len(pending)} fields ({rate:.1f}/s)", file=sys.stderr)
+    return processed, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch-analyse farm boundaries from a GeoJSON FeatureCollection.")
+    parser.add_argument("geojson", help="FeatureCollection of Polygon/MultiPolygon farm boundaries")
+    parser.add_argument("--out", required=True, help="output directory (re-use it to resume)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--start", type=date.fromisoformat, default=None, help="start date, YYYY-MM-DD")
+    parser.add_argument("--end", type=date.fromisoformat, default=None, help="end date, YYYY-MM-DD (default: today)")
+    args = parser.parse_args(argv)
+
+    end = args.end or date.today()
+    start = args.start or end - timedelta(days=30)
+    with open(args.geojson, encoding="utf-8") as f:
+        collection = json.load(f)
+    features = [f for f in collection.get('features', []) if f.get('geometry')]
+
+    processed, failed = run_batch(features, args.out, (start, end), args.workers)
+    if failed:
+        print(f"{failed} field(s) failed, see {os.path.join(args.out, ERRORS)}; re-run to retry", file=sys.stderr)
+    else:
+        consolidate(args.out)
+    print(f"processed {processed} field(s), {failed} failed", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
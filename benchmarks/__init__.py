@@ -0,0 +1,16 @@
+"""Benchmark suite for the dashboard's hot paths.
+
+Runs every case in `benchmarks.cases` headless, records time and peak memory
+per parameter value and compares them with the stored `baseline.json`:
+
+    python -m benchmarks                  # full sweep, fail on regressions
+    python -m benchmarks --quick          # small sizes only (CI)
+    python -m benchmarks -k encode        # cases whose name contains "encode"
+    python -m benchmarks --save-baseline  # record this machine's numbers
+
+Timings are machine specific: refresh the baseline on the machine that runs
+the comparison.
+
+`python -m benchmarks.loadtest` load-tests a whole dashboard server with
+many concurrent simulated sessions (see `benchmarks.loadtest`).
+"""
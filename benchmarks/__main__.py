@@ -0,0 +1,156 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+# Caches and the tile server must not touch the developer's real state; set before the app modules load.
+from benchmarks import scratch  # noqa: F401
+
+import numpy as np  # noqa: E402
+
+from benchmarks.cases import CASES  # noqa: E402
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+TIME_TOLERANCE = 0.5     # fail when more than 50% slower than the baseline...
+MIN_TIME_DELTA = 0.005   # ...and slower by more than 5 ms
+MEMORY_TOLERANCE = 0.2
+MIN_MEMORY_DELTA = 1024 * 1024
+TARGET_SECONDS = 1.0
+MAX_REPEAT = 20
+CONFIRM_RUNS = 2
+
+
+def environment():
+    return {"python": platform.python_version(), "numpy": np.__version__,
+            "machine": platform.machine(), "system": platform.system(), "cpus": os.cpu_count()}
+
+
+def _timed(run, state):
+    # Like timeit: collect first and keep the cyclic GC out of the measured call.
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        run(state)
+        return time.perf_counter() - start
+    finally:
+        gc.enable()
+
+
+def measure(run, state):
+    """Best-of-N wall time (N sized to ~TARGET_SECONDS) and peak traced memory of one call."""
+    first = _timed(run, state)
+    times = [first]
+    if first < TARGET_SECONDS:
+        # The first call was the warm-up; repeat enough to smooth out scheduler noise.
+        repeat = min(MAX_REPEAT, max(1, int(TARGET_SECONDS / max(first, 1e-6))))
+        times = [_timed(run, state) for _ in range(repeat)]
+
+    # Separate pass: tracemalloc slows Python-heavy code, so it must not skew the timing.
+    tracemalloc.start()
+    run(state)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": min(times), "peak_bytes": peak, "repeat": len(times)}
+
+
+def select_cases(cases, quick=False, pattern=None):
+    """{result key: (case, parameter value)} for the cases and values to run."""
+    selected = {}
+    for case in cases:
+        if pattern and pattern not in case['name']:
+            continue
+        for value in case['quick'] if quick else case['values']:
+            selected[f"{case['name']}[{case['param']}={value}]"] = (case, value)
+    return selected
+
+
+def measure_case(case, value):
+    state = case['setup'](value)
+    return measure(case['run'], state)
+
+
+def run_cases(selected):
+    results = {}
+    for key, (case, value) in selected.items():
+        row = results[key] = measure_case(case, value)
+        print(f"{key:<58}{row['seconds'] * 1000:>11.2f} ms{row['peak_bytes'] / 2**20:>10.1f} MiB", flush=True)
+    return results
+
+
+def compare(results, baseline, time_tolerance=TIME_TOLERANCE, memory_tolerance=MEMORY_TOLERANCE):
+    """(key, message) for every result that regressed past the tolerances; missing baselines are skipped."""
+    regressions = []
+    for key, row in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        slower = row['seconds'] - base['seconds']
+        if slower > MIN_TIME_DELTA and row['seconds'] > base['seconds'] * (1 + time_tolerance):
+            regressions.append((key, f"{key}: {row['seconds'] * 1000:.2f} ms vs {base['seconds'] * 1000:.2f} ms baseline"))
+        grown = row['peak_bytes'] - base['peak_bytes']
+        if grown > MIN_MEMORY_DELTA and row['peak_bytes'] > base['peak_bytes'] * (1 + memory_tolerance):
+            regressions.append((key, f"{key}: peak {row['peak_bytes'] / 2**20:.1f} MiB vs {base['peak_bytes'] / 2**20:.1f} MiB baseline"))
+    return regressions
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {"environment": None, "results": {}}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Benchmark the dashboard's hot paths.")
+    parser.add_argument("--quick", action="store_true", help="run only the small parameter values")
+    parser.add_argument("-k", dest="pattern", default=None, help="only cases whose name contains this text")
+    parser.add_argument("--baseline", default=BASELINE, help="baseline JSON to compare with / save to")
+    parser.add_argument("--save-baseline", action="store_true", help="merge this run's results into the baseline")
+    parser.add_argument("--time-tolerance", type=float, default=TIME_TOLERANCE)
+    parser.add_argument("--memory-tolerance", type=float, default=MEMORY_TOLERANCE)
+    parser.add_argument("--output", default=None, help="also write this run's results to a JSON file")
+    args = parser.parse_args(argv)
+
+    selected = select_cases(CASES, quick=args.quick, pattern=args.pattern)
+    results = run_cases(selected)
+    baseline = load_baseline(args.baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"environment": environment(), "results": results}, f, indent=1, sort_keys=True)
+
+    if args.save_baseline:
+        baseline['results'].update(results)
+        baseline['environment'] = environment()
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=1, sort_keys=True)
+            f.write("\n")
+        print(f"saved {len(results)} result(s) to {args.baseline}")
+        return 0
+
+    if baseline['environment'] and baseline['environment'] != environment():
+        print(f"note: baseline recorded on {baseline['environment']}, this is {environment()}", file=sys.stderr)
+    missing = sorted(set(results) - set(baseline['results']))
+    if missing:
+        print(f"{len(missing)} result(s) have no baseline yet: {', '.join(missing)}", file=sys.stderr)
+    regressions = compare(results, baseline['results'], args.time_tolerance, args.memory_tolerance)
+    for _ in range(CONFIRM_RUNS):
+        if not regressions:
+            break
+        # A regression has to reproduce: re-measure the suspects and keep their best numbers.
+        for key in sorted({key for key, _ in regressions}):
+            again = measure_case(*selected[key])
+            print(f"re-measured {key}: {again['seconds'] * 1000:.2f} ms, {again['peak_bytes'] / 2**20:.1f} MiB", file=sys.stderr)
+            results[key] = {name: min(results[key][name], again[name]) for name in ("seconds", "peak_bytes")}
+        regressions = compare(results, baseline['results'], args.time_tolerance, args.memory_tolerance)
+    for _, message in regressions:
+        print(f"REGRESSION {message}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
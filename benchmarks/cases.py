@@ -0,0 +1,243 @@
+"""Benchmark cases: the hot paths of the dashboard, run headless.
+
+Each case is a dict with a `name`, the swept parameter (`param`), the values
+to run (`values`, plus the `quick` subset used in CI), `setup(value)`
+returning the state for one parameter value (not timed), and `run(state)`,
+the timed call. Inputs are seeded so every run sees the same data.
+"""
+import os
+import shutil
+import tempfile
+from datetime import date
+
+import numpy as np
+
+from analysis import generate_mock_data, get_aoi_bounds
+from ndvi_engine import CLASS_NAMES, NODATA, classify_ndvi
+from overlay_encoder import ENCODED_IMAGES, encode_classes
+from tiling import COLORMAP, build_tile_pyramid
+from geometry import area_centroid, map_tolerance, simplify_geometry
+from zones import build_zones, grid_zones, prescription_geojson
+from gazetteer import PlaceIndex
+import figures
+
+RASTER_SIZES = [100, 1000, 3000, 10000]
+# generate_mock_data and build_zones return full-resolution float32 rasters: at 10000x10000 the
+# 14-day forecast cube alone is 5.6 GB (plus a 2.4 GB NDVI stack), and k-means zoning extrapolates
+# to about 6 GiB from 531 MiB at 3000x3000, so that size would measure swapping, not the code.
+SCENE_SIZES = RASTER_SIZES[:3]
+VERTEX_COUNTS = [4, 100, 10000, 100000]
+SERIES_LENGTHS = [30, 10000, 1000000]
+PLACE_COUNTS = [1000, 100000, 600000]  # about as many villages as India has
+NAME_SYLLABLES = "ra ma na ga ka ha li ni sa ta bha dha chha wa va ee oo sha kha pa ba la ja de go ro su".split()
+NAME_SUFFIXES = ["pur", "pura", "nagar", "gaon", "wadi", "abad", "garh", "khera", "palli", ""]
+DATE_RANGE = (date(2025, 6, 1), date(2025, 6, 30))
+FIELD_CENTER = (73.105, 22.305)
+FIELD_RADIUS_DEG = 0.005
+
+
+def field_ring(n_vertices, seed=0):
+    """Closed, star-shaped lon/lat ring with `n_vertices` distinct vertices, as GeoJSON lists."""
+    rng = np.random.default_rng(seed)
+    angles = np.sort(rng.uniform(0, 2 * np.pi, n_vertices))
+    radius = FIELD_RADIUS_DEG * rng.uniform(0.7, 1.0, n_vertices)
+    lons = FIELD_CENTER[0] + radius * np.cos(angles)
+    lats = FIELD_CENTER[1] + radius * np.sin(angles)
+    ring = np.column_stack([lons, lats]).tolist()
+    return ring + ring[:1]
+
+
+def class_raster(size, seed=0):
+    """Patchy healthy/stressed/severe raster with a NODATA margin, like a classified field."""
+    rng = np.random.default_rng(seed)
+    block = max(size // 32, 1)
+    coarse = rng.uniform(0.1, 0.8, (size // block + 2, size // block + 2))
+    ndvi = np.kron(coarse, np.ones((block, block), dtype=np.float32))[:size, :size]
+    classes = classify_ndvi(ndvi)
+    classes[:, : size // 8] = NODATA
+    return classes
+
+
+def field_bounds(size):
+    # About 1 m per pixel, so the tile pyramid's native zoom tracks the raster size.
+    span = size / 111_000
+    return [[22.3, 73.1], [22.3 + span, 73.1 + span]]
+
+
+def _setup_mock_data(size):
+    np.random.seed(0)
+    aoi = {"type": "Polygon", "coordinates": [field_ring(64)]}
+    # Warm the time-series store so the timed runs measure steady state, not the first fetch.
+    generate_mock_data(aoi, DATE_RANGE, scene_shape=(size, size))
+    return aoi, (size, size)
+
+
+def _run_mock_data(state):
+    aoi, shape = state
+    generate_mock_data(aoi, DATE_RANGE, scene_shape=shape)
+
+
+def _setup_pyramid(size):
+    return class_raster(size), field_bounds(size), tempfile.mkdtemp(prefix="krishi-bench-tiles-")
+
+
+def _run_pyramid(state):
+    classes, bounds, root = state
+    # A fresh directory and an empty byte cache each time, so every run is a full build.
+    ENCODED_IMAGES.clear()
+    shutil.rmtree(root, ignore_errors=True)
+    os.makedirs(root)
+    build_tile_pyramid(classes, bounds, root)
+
+
+def _setup_map(n_vertices):
+    classes = class_raster(100)
+    bounds = field_bounds(100)
+    build_tile_pyramid(classes, bounds)  # tiles on disk already; the case times the folium build
+    anomalies = [
+        {"coordinates": field_ring(64, seed=i), "centroid": FIELD_CENTER, "color": "#8B4513",
+         "type": "Drydown", "area_ha": 0.5}
+        for i in range(10)
+    ]
+    return classes, bounds, _field_polygon(n_vertices), anomalies
+
+
+def _field_polygon(n_vertices):
+    return {"type": "Polygon", "coordinates": [field_ring(n_vertices)]}
+
+
+def _setup_zones(size):
+    classes = class_raster(size)
+    rng = np.random.default_rng(0)
+    ndvi = (np.array([0.7, 0.4, 0.2, np.nan], dtype=np.float32)[np.minimum(classes, 3)]
+            + rng.normal(0, 0.03, classes.shape).astype(np.float32))
+    return classes, ndvi, field_bounds(size)
+
+
+def _run_zones(method, size):
+    def run(state):
+        classes, ndvi, bounds = state
+        labels, stats = build_zones(classes, ndvi, bounds, method, size)
+        prescription_geojson(labels, bounds, stats)
+    return run
+
+
+def _setup_zone_map(size):
+    """30 m grid zones over a `size` raster, with made-up zone means (the figure only reads `mean_ndvi`)."""
+    classes = class_raster(size)
+    labels, n_zones = grid_zones(classes != NODATA, field_bounds(size), 30)
+    rng = np.random.default_rng(0)
+    return labels, [{"mean_ndvi": float(v)} for v in rng.uniform(0.2, 0.9, n_zones)]
+
+
+def _setup_transitions(n_classes):
+    """Pixel counts for every before → after pair of the first `n_classes` classes."""
+    names = CLASS_NAMES[:n_classes]
+    return {f"{a} → {b}": 1000 * (i + 1) for i, (a, b) in enumerate((a, b) for a in names for b in names)}
+
+
+def _setup_series(n):
+    rng = np.random.default_rng(0)
+    dates = np.datetime64("2024-01-01T00") + np.arange(n).astype("timedelta64[h]")
+    return dates, (25 + rng.normal(0, 3, n)).astype(np.float32)
+
+
+def _setup_gazetteer(n):
+    """Index of `n` made-up villages, plus queries: name prefixes, misspellings and district qualifiers."""
+    rng = np.random.default_rng(0)
+    names = ["".join(rng.choice(NAME_SYLLABLES, rng.integers(1, 4))).capitalize() + rng.choice(NAME_SUFFIXES)
+             for _ in range(n)]
+    index = PlaceIndex({
+        "name": name, "lat": 20 + 8 * rng.random(), "lon": 72 + 10 * rng.random(),
+        "admin": (f"Tehsil {i % 5000}", f"District {i % 700}", f"State {i % 30}"),
+        "population": int(rng.pareto(1.5) * 500), "alt_names": [],
+    } for i, name in enumerate(names))
+    picks = rng.integers(0, n, 100)
+    queries = ([names[i][:rng.integers(1, len(names[i]) + 1)] for i in picks[:60]]
+               + [names[i].replace("a", "aa", 1) + "h" for i in picks[60:90]]
+               + [f"{names[i]}, district {i % 700}" for i in picks[90:]])
+    return index, queries
+
+
+def _run_gazetteer(state):
+    index, queries = state
+    for query in queries:
+        index.search(query)
+
+
+CASES = [
+    {
+        "name": "generate_mock_data", "param": "raster", "values": SCENE_SIZES, "quick": [100, 1000],
+        "setup": _setup_mock_data, "run": _run_mock_data,
+    },
+    {
+        "name": "get_aoi_bounds", "param": "vertices", "values": VERTEX_COUNTS, "quick": VERTEX_COUNTS[:3],
+        "setup": lambda n: np.asarray(field_ring(n)), "run": get_aoi_bounds,
+    },
+    {
+        "name": "area_centroid", "param": "vertices", "values": VERTEX_COUNTS, "quick": VERTEX_COUNTS[:3],
+        "setup": _field_polygon, "run": area_centroid,
+    },
+    {
+        "name": "simplify_geometry[zoom=16]", "param": "vertices", "values": VERTEX_COUNTS, "quick": VERTEX_COUNTS[:3],
+        "setup": _field_polygon, "run": lambda g: simplify_geometry(g, map_tolerance(16, FIELD_CENTER[1])),
+    },
+    {
+        "name": "encode_overlay[png]", "param": "raster", "values": RASTER_SIZES, "quick": [100, 1000],
+        "setup": class_raster, "run": lambda c: encode_classes(c, COLORMAP, "png", cache=False),
+    },
+    {
+        "name": "encode_overlay[png-rgba]", "param": "raster", "values": RASTER_SIZES, "quick": [100, 1000],
+        "setup": class_raster, "run": lambda c: encode_classes(c, COLORMAP, "png-rgba", cache=False),
+    },
+    {
+        "name": "encode_overlay[webp]", "param": "raster", "values": RASTER_SIZES, "quick": [100, 1000],
+        "setup": class_raster, "run": lambda c: encode_classes(c, COLORMAP, "webp", cache=False),
+    },
+    {
+        "name": "build_tile_pyramid", "param": "raster", "values": RASTER_SIZES, "quick": [100, 1000],
+        "setup": _setup_pyramid, "run": _run_pyramid,
+    },
+    {
+        "name": "build_zones[grid=30m]", "param": "raster", "values": SCENE_SIZES, "quick": [100, 1000],
+        "setup": _setup_zones, "run": _run_zones("grid", 30),
+    },
+    {
+        "name": "build_zones[kmeans=4]", "param": "raster", "values": SCENE_SIZES, "quick": [100, 1000],
+        "setup": _setup_zones, "run": _run_zones("kmeans", 4),
+    },
+    {
+        "name": "gazetteer_search[100 queries]", "param": "places", "values": PLACE_COUNTS, "quick": PLACE_COUNTS[:2],
+        "setup": _setup_gazetteer, "run": _run_gazetteer,
+    },
+    {
+        "name": "build_spectral_health_map", "param": "vertices", "values": VERTEX_COUNTS, "quick": VERTEX_COUNTS[:3],
+        "setup": _setup_map, "run": lambda state: figures.build_spectral_health_map(*state),
+    },
+    {
+        "name": "create_temporal_trend_chart", "param": "points", "values": SERIES_LENGTHS, "quick": SERIES_LENGTHS[:2],
+        "setup": lambda n: _setup_series(n)[1],
+        "run": lambda hist: figures.create_temporal_trend_chart(hist, hist[-14:]),
+    },
+    {
+        "name": "create_soil_condition_chart", "param": "points", "values": SERIES_LENGTHS, "quick": SERIES_LENGTHS[:2],
+        "setup": _setup_series, "run": lambda state: figures.create_soil_condition_chart(*state),
+    },
+    {
+        "name": "create_temperature_chart", "param": "points", "values": SERIES_LENGTHS, "quick": SERIES_LENGTHS[:2],
+        "setup": _setup_series, "run": lambda state: figures.create_temperature_chart(*state),
+    },
+    {
+        "name": "create_health_pie_chart", "param": "classes", "values": [3], "quick": [3],
+        "setup": lambda n: {"Healthy": 60.0, "Stressed": 25.0, "Severe": 15.0},
+        "run": figures.create_health_pie_chart,
+    },
+    {
+        "name": "create_transition_pie_chart", "param": "classes", "values": [3], "quick": [3],
+        "setup": _setup_transitions, "run": figures.create_transition_pie_chart,
+    },
+    {
+        "name": "create_zone_map", "param": "raster", "values": RASTER_SIZES, "quick": [100, 1000],
+        "setup": _setup_zone_map, "run": lambda state: figures.create_zone_map(*state),
+    },
+]
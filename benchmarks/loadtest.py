@@ -0,0 +1,419 @@
+"""Concurrent-session load test for the dashboard (app4.py).
+
+Starts `streamlit run app4.py` headless on a free port with scratch caches
+and drives simulated farmers over the websocket protocol the browser uses.
+AppTest cannot do this: it runs each script in-process and swaps a global
+runtime on every run, so it cannot model many parallel sessions of one
+server. Each session goes through these steps:
+
+    load              first page load
+    draw              draws its field (sets the map component's value)
+    analyze           clicks "Analyze Farm" (on a result-cache hit the
+                      dashboard may already come up in this rerun)
+    poll              the progress fragment's auto-reruns while the job runs
+    dashboard         the rerun that brings up the dashboard
+    zones-*           changes the management-zone controls (fragment reruns)
+    dashboard-rerun   a full rerun of the finished dashboard
+
+Every rerun is timed from the message that requests it to the server's
+`script_finished` reply.
+
+The report gives:
+- throughput;
+- p50/p95/p99 rerun latency, per step and overall;
+- the time from click to dashboard;
+- the server's resident memory (RSS), sampled while the test runs.
+
+Examples:
+
+    python -m benchmarks.loadtest --sessions 200 --concurrency 50
+    python -m benchmarks.loadtest --sessions 20 --fields 5 --output load.json
+    python -m benchmarks.loadtest --url http://127.0.0.1:8501 --pid 1234
+
+Sessions are split over several client processes, so the client's own
+protobuf parsing does not become the bottleneck. The command exits non-zero
+when a session fails, or when overall p95 latency exceeds --max-p95-ms.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+
+# Caches and the tile server must not touch the developer's real state; set before the server starts.
+from benchmarks import scratch  # noqa: F401
+
+import numpy as np  # noqa: E402
+from streamlit.proto.BackMsg_pb2 import BackMsg  # noqa: E402
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg  # noqa: E402
+from streamlit.proto.WidgetStates_pb2 import WidgetState  # noqa: E402
+from tornado.websocket import websocket_connect  # noqa: E402
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app4.py")
+FIELD_ORIGIN = (73.105, 22.305)
+FIELD_SIZE_DEG = 0.004
+FIELD_SPACING_DEG = 0.01
+FIELDS_PER_ROW = 20
+SERVER_START_TIMEOUT = 60
+SESSION_TIMEOUT = 600
+RSS_SAMPLE_SECONDS = 0.5
+PERCENTILES = (50, 95, 99)
+MAX_MESSAGE_BYTES = 256 * 1024 * 1024
+FINISHED = (ForwardMsg.FINISHED_SUCCESSFULLY, ForwardMsg.FINISHED_FRAGMENT_RUN_SUCCESSFULLY)
+
+# Dashboard interactions, in order: (step, widget label, WidgetState value).
+DASHBOARD_STEPS = [
+    ("zones-cell-size", "Cell size (m)", {"int_value": 60}),
+    ("zones-kmeans", "Zones from", {"int_value": 1}),
+    ("zones-count", "Number of zones", {"double_array_value": {"data": [6]}}),
+]
+
+
+def field_feature(i):
+    """Drawn polygon Feature for field `i`; fields sit on a grid, so different indices never overlap."""
+    lon = FIELD_ORIGIN[0] + (i % FIELDS_PER_ROW) * FIELD_SPACING_DEG
+    lat = FIELD_ORIGIN[1] + (i // FIELDS_PER_ROW) * FIELD_SPACING_DEG
+    ring = [[lon, lat], [lon + FIELD_SIZE_DEG, lat], [lon + FIELD_SIZE_DEG, lat + 0.7 * FIELD_SIZE_DEG],
+            [lon + 0.5 * FIELD_SIZE_DEG, lat + FIELD_SIZE_DEG], [lon, lat + FIELD_SIZE_DEG], [lon, lat]]
+    return {"type": "Feature", "properties": {}, "geometry": {"type": "Polygon", "coordinates": [ring]}}
+
+
+class Session:
+    """One simulated browser tab.
+
+    Like the frontend, it keeps the value of every widget it has set and
+    sends all of them with each rerun.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.timings = {}    # step -> [seconds]
+        self.widgets = {}    # label (component name for components) -> (widget id, fragment id)
+        self.values = {}     # widget id -> WidgetState
+        self.auto_rerun = None  # (interval, fragment id) of the page's run_every fragment
+        self.page_hash = ""
+        self.ws = None
+
+    async def connect(self):
+        ws_url = "ws" + self.url[len("http"):].rstrip("/") + "/_stcore/stream"
+        self.ws = await websocket_connect(ws_url, subprotocols=["streamlit"], max_message_size=MAX_MESSAGE_BYTES)
+
+    def close(self):
+        if self.ws is not None:
+            self.ws.close()
+
+    def set_widget(self, label, **value):
+        """Gives the widget labelled `label` a new value; returns the id of the fragment it lives in."""
+        if label not in self.widgets:
+            raise LookupError(f"no widget {label!r} on the page")
+        widget_id, fragment_id = self.widgets[label]
+        state = WidgetState(id=widget_id)
+        for field, v in value.items():
+            if isinstance(v, dict):
+                getattr(state, field).data.extend(v['data'])
+            else:
+                setattr(state, field, v)
+        self.values[widget_id] = state
+        return fragment_id
+
+    async def rerun(self, step=None, click=None, fragment_id="", auto=False):
+        """Requests a rerun (a fragment rerun with `fragment_id`) and waits for it to finish; returns seconds."""
+        msg = BackMsg()
+        client = msg.rerun_script
+        client.page_script_hash = self.page_hash
+        client.fragment_id = fragment_id
+        client.is_auto_rerun = auto
+        client.widget_states.widgets.extend(self.values.values())
+        if click is not None:
+            widget_id, _ = self.widgets[click]
+            client.widget_states.widgets.add(id=widget_id, trigger_value=True)
+        start = time.perf_counter()
+        await self.ws.write_message(msg.SerializeToString(), binary=True)
+        await self._read_until_finished()
+        seconds = time.perf_counter() - start
+        if step is not None:
+            self.timings.setdefault(step, []).append(seconds)
+        return seconds
+
+    async def _read_until_finished(self):
+        while True:
+            payload = await self.ws.read_message()
+            if payload is None:
+                raise ConnectionError("server closed the websocket")
+            msg = ForwardMsg()
+            msg.ParseFromString(payload)
+            kind = msg.WhichOneof("type")
+            if kind == "new_session":
+                self.page_hash = msg.new_session.page_script_hash
+                if not msg.new_session.fragment_ids_this_run:
+                    # A full run rebuilds the page: forget the previous run's widgets.
+                    self.widgets.clear()
+                    self.auto_rerun = None
+            elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+                self._register(msg.delta.new_element, msg.delta.fragment_id)
+            elif kind == "auto_rerun":
+                self.auto_rerun = (msg.auto_rerun.interval, msg.auto_rerun.fragment_id)
+            elif kind == "script_finished":
+                if msg.script_finished == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                    raise RuntimeError("the app failed to compile")
+                if msg.script_finished in FINISHED:
+                    return
+
+    def _register(self, element, fragment_id):
+        kind = element.WhichOneof("type")
+        if kind == "exception":
+            raise RuntimeError(f"app raised {element.exception.type}: {element.exception.message}")
+        widget = getattr(element, kind)
+        widget_id = getattr(widget, "id", "")
+        if widget_id:
+            label = widget.component_name if kind == "component_instance" else getattr(widget, "label", kind)
+            self.widgets[label] = (widget_id, fragment_id)
+
+
+async def run_session(url, field_index):
+    """One farmer's visit; returns `(timings, seconds from click to dashboard)`."""
+    session = Session(url)
+    await session.connect()
+    try:
+        await session.rerun("load")
+        drawn = {"all_drawings": [field_feature(field_index)]}
+        (map_label,) = [label for label in session.widgets if "folium" in label]
+        session.set_widget(map_label, json_value=json.dumps(drawn))
+        await session.rerun("draw")
+
+        clicked = time.perf_counter()
+        await session.rerun("analyze", click="Analyze Farm")
+        while "Start New Analysis" not in session.widgets:
+            if session.auto_rerun is None:
+                raise RuntimeError("analysis neither finished nor shows progress")
+            interval, fragment_id = session.auto_rerun
+            await asyncio.sleep(interval)
+            seconds = await session.rerun(fragment_id=fragment_id, auto=True)
+            step = "dashboard" if "Start New Analysis" in session.widgets else "poll"
+            session.timings.setdefault(step, []).append(seconds)
+        to_dashboard = time.perf_counter() - clicked
+
+        for step, label, value in DASHBOARD_STEPS:
+            fragment_id = session.set_widget(label, **value)
+            await session.rerun(step, fragment_id=fragment_id)
+        await session.rerun("dashboard-rerun")
+        return session.timings, to_dashboard
+    finally:
+        session.close()
+
+
+async def warm_up(url):
+    """One page load, so the server has imported the app before RSS and timings are taken."""
+    session = Session(url)
+    await session.connect()
+    try:
+        await session.rerun()
+    finally:
+        session.close()
+
+
+async def run_clients(url, indices, fields, concurrency, ramp_seconds, total):
+    """Runs the sessions numbered `indices`, at most `concurrency` at a time; returns `(results, failures)`."""
+    slots = asyncio.Semaphore(concurrency)
+    results, failures = [], []
+
+    async def one(i):
+        await asyncio.sleep(ramp_seconds * i / max(total, 1))
+        async with slots:
+            try:
+                results.append(await asyncio.wait_for(run_session(url, i % fields), SESSION_TIMEOUT))
+            except Exception as exc:
+                failures.append(f"session {i}: {type(exc).__name__}: {exc}")
+
+    await asyncio.gather(*(one(i) for i in indices))
+    return results, failures
+
+
+def _client_process(args):
+    return asyncio.run(run_clients(*args))
+
+
+def read_rss(pid):
+    """Resident set size of `pid` in bytes, from /proc (Linux); None where unavailable."""
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class RssSampler:
+    """Samples a process's RSS every `interval` seconds on a helper thread."""
+
+    def __init__(self, pid, interval=RSS_SAMPLE_SECONDS):
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name="krishi-rss", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.samples
+
+    def _sample(self):
+        while True:
+            rss = read_rss(self.pid)
+            if rss is not None:
+                self.samples.append(rss)
+            if self._stop.wait(self.interval):
+                return
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port, log_path):
+    """`streamlit run app4.py` in the background; returns the process once /_stcore/health answers."""
+    env = dict(os.environ)
+    # Simulated farmers must not pull basemap tiles from the real providers.
+    env.setdefault("KRISHI_OFFLINE", "1")
+    cmd = [sys.executable, "-m", "streamlit", "run", APP, "--server.headless=true", f"--server.port={port}",
+           "--server.address=127.0.0.1", "--server.fileWatcherType=none", "--browser.gatherUsageStats=false"]
+    log = open(log_path, "w", encoding="utf-8")
+    proc = subprocess.Popen(cmd, env=env, cwd=os.path.dirname(APP), stdout=log, stderr=subprocess.STDOUT)
+    log.close()
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with {proc.returncode}; see {log_path}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1) as r:
+                if r.status == 200:
+                    return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError(f"server did not come up within {SERVER_START_TIMEOUT} s; see {log_path}")
+
+
+def latency_summary(seconds):
+    values = np.asarray(seconds) * 1000
+    return {"count": int(values.size),
+            **{f"p{p}_ms": round(float(np.percentile(values, p)), 1) for p in PERCENTILES},
+            "max_ms": round(float(values.max()), 1)}
+
+
+def summarize(results, failures, sessions, elapsed, rss_samples):
+    steps = {}
+    for timings, _ in results:
+        for step, seconds in timings.items():
+            steps.setdefault(step, []).extend(seconds)
+    reruns = [s for seconds in steps.values() for s in seconds]
+    report = {
+        "sessions": sessions,
+        "completed": len(results),
+        "failed": len(failures),
+        "elapsed_seconds": round(elapsed, 2),
+        "sessions_per_minute": round(60 * len(results) / elapsed, 2) if elapsed else 0.0,
+        "reruns_per_second": round(len(reruns) / elapsed, 2) if elapsed else 0.0,
+        "steps": {step: latency_summary(seconds) for step, seconds in steps.items()},
+        "all_reruns": latency_summary(reruns) if reruns else None,
+        "click_to_dashboard": latency_summary([t for _, t in results]) if results else None,
+        "failures": failures,
+    }
+    if rss_samples:
+        start, peak, end = rss_samples[0], max(rss_samples), rss_samples[-1]
+        report["server_rss_mib"] = {
+            "start": round(start / 2**20, 1), "peak": round(peak / 2**20, 1), "end": round(end / 2**20, 1),
+            "per_session": round((peak - start) / 2**20 / max(len(results), 1), 2),
+        }
+    return report
+
+
+def print_report(report):
+    print(f"{report['completed']}/{report['sessions']} sessions in {report['elapsed_seconds']:.1f} s: "
+          f"{report['sessions_per_minute']:.1f} sessions/min, {report['reruns_per_second']:.1f} reruns/s")
+    print(f"{'step':<20}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    rows = list(report['steps'].items()) + [("all reruns", report['all_reruns']),
+                                            ("click→dashboard", report['click_to_dashboard'])]
+    for step, row in rows:
+        if row:
+            print(f"{step:<20}{row['count']:>7}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}"
+                  f"{row['p99_ms']:>10.1f}{row['max_ms']:>10.1f}")
+    rss = report.get("server_rss_mib")
+    if rss:
+        print(f"server RSS: {rss['start']:.0f} MiB at start, {rss['peak']:.0f} MiB peak, {rss['end']:.0f} MiB at end "
+              f"(~{rss['per_session']:.2f} MiB per session)")
+    for failure in report['failures']:
+        print(f"FAILED {failure}", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.loadtest",
+                                     description="Load-test the dashboard with concurrent simulated sessions.")
+    parser.add_argument("--sessions", type=int, default=20, help="simulated farmers in total")
+    parser.add_argument("--concurrency", type=int, default=10, help="sessions open at the same time")
+    parser.add_argument("--fields", type=int, default=None,
+                        help="distinct fields drawn (default: one per session; fewer means more result-cache hits)")
+    parser.add_argument("--ramp", type=float, default=0.0, help="seconds over which session starts are spread")
+    parser.add_argument("--clients", type=int, default=min(4, os.cpu_count() or 1), help="client processes")
+    parser.add_argument("--url", default=None, help="test a running server instead of starting one")
+    parser.add_argument("--pid", type=int, default=None, help="server process to sample RSS from (with --url)")
+    parser.add_argument("--max-p95-ms", type=float, default=None, help="fail when overall p95 rerun latency exceeds this")
+    parser.add_argument("--output", default=None, help="also write the report to a JSON file")
+    args = parser.parse_args(argv)
+
+    server, pid, url = None, args.pid, args.url
+    if url is None:
+        port = free_port()
+        log_path = os.path.join(scratch.SCRATCH, "server.log")
+        server = start_server(port, log_path)
+        pid, url = server.pid, f"http://127.0.0.1:{port}"
+    try:
+        asyncio.run(warm_up(url))
+        sampler = RssSampler(pid).start() if pid else None
+        fields = args.fields or args.sessions
+        clients = max(1, min(args.clients, args.sessions))
+        per_client = max(1, -(-args.concurrency // clients))
+        chunks = [list(range(c, args.sessions, clients)) for c in range(clients)]
+        start = time.perf_counter()
+        with ProcessPoolExecutor(clients) as pool:
+            outcomes = list(pool.map(_client_process, [
+                (url, chunk, fields, per_client, args.ramp, args.sessions) for chunk in chunks
+            ]))
+        elapsed = time.perf_counter() - start
+        rss_samples = sampler.stop() if sampler else []
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+    results = [r for chunk_results, _ in outcomes for r in chunk_results]
+    failures = [f for _, chunk_failures in outcomes for f in chunk_failures]
+    report = summarize(results, failures, args.sessions, elapsed, rss_samples)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+    too_slow = (args.max_p95_ms is not None and report['all_reruns'] is not None
+                and report['all_reruns']['p95_ms'] > args.max_p95_ms)
+    if too_slow:
+        print(f"p95 rerun latency {report['all_reruns']['p95_ms']:.0f} ms exceeds {args.max_p95_ms:.0f} ms", file=sys.stderr)
+    return 1 if failures or too_slow else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,21 @@
+"""Scratch state for benchmark, load-test and test runs.
+
+Importing this module points every cache and the local tile server at a
+temporary directory, removed at exit, so runs never touch the developer's
+real state. Import it before any app module (or server process) starts.
+"""
+import atexit
+import os
+import shutil
+import tempfile
+
+SCRATCH = tempfile.mkdtemp(prefix="krishi-bench-")
+for _var, _sub in (("KRISHI_TIMESERIES_DIR", "timeseries"), ("KRISHI_TILE_CACHE", "tiles"),
+                   ("KRISHI_ANALYSIS_CACHE", "analysis"), ("KRISHI_BASEMAP_CACHE", "basemaps"),
+                   ("KRISHI_SCENE_TILE_CACHE", "scene_tiles"), ("KRISHI_SESSION_SPILL", "sessions"),
+                   ("KRISHI_GAZETTEER_CACHE", "gazetteer"), ("KRISHI_PROFILE_DIR", "profiles"),
+                   ("KRISHI_METRICS_LOG", os.path.join("metrics", "spans.jsonl"))):
+    os.environ.setdefault(_var, os.path.join(SCRATCH, _sub))
+os.environ.setdefault("KRISHI_LOCAL_PORT", "0")
+tempfile.tempdir = SCRATCH
+atexit.register(shutil.rmtree, SCRATCH, ignore_errors=True)
@@ -0,0 +1,256 @@
+"""Tile-level scene classification and change detection between two periods.
+
+A scene is classified in CHANGE_TILE_PX square tiles. Each tile is
+identified by a hash of its source data (both bands, the field mask and the
+thresholds) and its classes are stored on disk under that hash, so any tile
+whose source data did not change since an earlier analysis (the same
+period re-run, or the parts of a field where nothing happened since last
+week) is read back instead of classified again. The grid of hashes of every
+analysed period is recorded as well, so a past period is reassembled from
+stored tiles without fetching its bands at all, and comparing two periods
+only looks at the tiles whose hashes differ.
+
+`detect_changes` turns two class rasters into a per-pixel change raster
+(improved / unchanged / degraded) and counts the class transitions.
+"""
+import hashlib
+import os
+import threading
+import uuid
+from datetime import date
+
+import numpy as np
+
+from ndvi_engine import CLASS_NAMES, DEFAULT_THRESHOLDS, NODATA, classify_scene, open_band, synthesize_bands
+
+CACHE_DIR = os.environ.get(
+    "KRISHI_SCENE_TILE_CACHE", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".krishi_cache", "scene_tiles")
+)
+DISK_MAX_BYTES = 256 * 1024 * 1024
+PRUNE_EVERY_WRITES = 512
+CHANGE_TILE_PX = 32
+
+IMPROVED, UNCHANGED, DEGRADED = 0, 1, 2
+CHANGE_NAMES = ['Improved', 'Unchanged', 'Degraded']
+# RGBA per change class for the map layer; unchanged pixels are nearly transparent.
+CHANGE_COLORMAP = np.array([[0, 200, 255, 200], [128, 128, 128, 40], [255, 0, 255, 200]], dtype=np.uint8)
+
+# Mock imagery: each week a share of the field's tiles gets better or worse.
+MOCK_EVENT_TILE_SHARE = 0.15
+MOCK_EVENT_RED_FACTORS = (0.6, 1.8)  # improve, degrade
+
+
+def tile_grid(shape, tile_px=CHANGE_TILE_PX):
+    """(row slice, col slice) of every tile of a raster, row by row."""
+    rows, cols = shape
+    return [(slice(r, min(r + tile_px, rows)), slice(c, min(c + tile_px, cols)))
+            for r in range(0, rows, tile_px) for c in range(0, cols, tile_px)]
+
+
+def tile_hash(red, nir, mask, thresholds=DEFAULT_THRESHOLDS):
+    """Content hash of one tile's source data; equal hashes classify identically."""
+    h = hashlib.sha1(f"{red.shape}|{sorted(thresholds.items())}".encode())
+    for block in (red, nir, mask):
+        h.update(np.ascontiguousarray(block).tobytes())
+    return h.hexdigest().encode()
+
+
+class SceneTileCache:
+    """Classified tiles on disk keyed by source hash, plus the hash grid of each analysed period."""
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=DISK_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def _tile_path(self, key):
+        key = key.decode()
+        return os.path.join(self.cache_dir, "tiles", key[:2], f"{key}.npy")
+
+    def _period_path(self, scene_id, period):
+        return os.path.join(self.cache_dir, "periods", scene_id, "_".join(d.isoformat() for d in period) + ".npy")
+
+    def get(self, key):
+        path = self._tile_path(key)
+        try:
+            tile = np.load(path)
+        except (OSError, ValueError):
+            return None
+        try:
+            os.utime(path)  # mtime doubles as last access for pruning
+        except OSError:
+            pass
+        return tile
+
+    def put(self, key, tile):
+        path = self._tile_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp.npy"
+        np.save(tmp_path, tile)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % PRUNE_EVERY_WRITES == 0
+        if prune:
+            self.prune()
+
+    def save_period(self, scene_id, period, hashes):
+        path = self._period_path(scene_id, period)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp.npy"
+        np.save(tmp_path, hashes)
+        os.replace(tmp_path, path)
+
+    def load_period(self, scene_id, period, shape, tile_px=CHANGE_TILE_PX):
+        """(classes, hashes) of a recorded period rebuilt from stored tiles; None if any piece is missing."""
+        try:
+            hashes = np.load(self._period_path(scene_id, period))
+        except (OSError, ValueError):
+            return None
+        grid = tile_grid(shape, tile_px)
+        if hashes.size != len(grid):
+            return None
+        classes = np.full(shape, NODATA, dtype=np.uint8)
+        for window, key in zip(grid, hashes.ravel()):
+            if not key:
+                continue
+            tile = self.get(key)
+            if tile is None or tile.shape != classes[window].shape:
+                return None
+            classes[window] = tile
+        return classes, hashes
+
+    def prune(self):
+        """Deletes the least recently used tiles until the cache fits `max_bytes`."""
+        entries = []
+        for root, _, files in os.walk(os.path.join(self.cache_dir, "tiles")):
+            for name in files:
+                try:
+                    st = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, os.path.join(root, name)))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+
+def classify_tiles(red_path, nir_path, mask, cache, thresholds=DEFAULT_THRESHOLDS, tile_px=CHANGE_TILE_PX, progress=None):
+    """Classifies a scene tile by tile, reusing every tile whose source hash is cached.
+
+    Returns `(classes, hashes, computed)`: the class raster, the grid of tile
+    hashes (empty for tiles with no field pixel) and how many tiles had to be
+    classified. `progress(done, total)` is called after every tile.
+    """
+    red, nir = open_band(red_path), open_band(nir_path)
+    classes = np.full(red.shape, NODATA, dtype=np.uint8)
+    grid = tile_grid(red.shape, tile_px)
+    hashes = np.zeros(len(grid), dtype="S40")
+    computed = 0
+    for i, window in enumerate(grid, start=1):
+        tile_mask = mask[window]
+        if tile_mask.any():
+            red_tile, nir_tile = np.asarray(red[window]), np.asarray(nir[window])
+            key = hashes[i - 1] = tile_hash(red_tile, nir_tile, tile_mask, thresholds)
+            tile = cache.get(key)
+            if tile is None:
+                tile = classify_scene(red_tile, nir_tile, thresholds, mask=tile_mask)
+                cache.put(key, tile)
+                computed += 1
+            classes[window] = tile
+        if progress is not None:
+            progress(i, len(grid))
+    return classes, hashes, computed
+
+
+def classify_period(scene_id, period, mask, fetch_bands, cache, tile_px=CHANGE_TILE_PX, progress=None):
+    """Class raster of one period, from recorded tiles when possible.
+
+    `fetch_bands()` returns `(red_path, nir_path)` and is only called when the
+    period has not been analysed before (or still runs until today, when new
+    imagery may have arrived). Returns `(classes, hashes, computed)`.
+    """
+    if period[1] < date.today():
+        recorded = cache.load_period(scene_id, period, mask.shape, tile_px)
+        if recorded is not None:
+            if progress is not None:
+                progress(1, 1)
+            return recorded + (0,)
+    classes, hashes, computed = classify_tiles(*fetch_bands(), mask, cache, tile_px=tile_px, progress=progress)
+    cache.save_period(scene_id, period, hashes)
+    return classes, hashes, computed
+
+
+def synthesize_period_bands(directory, shape, seed, period, tile_px=CHANGE_TILE_PX):
+    """Mock bands for one field and period, reproducible from `seed` and the period's end date.
+
+    The field's base scene depends on `seed` only; on top of it, the week the
+    period ends in improves or degrades a random MOCK_EVENT_TILE_SHARE of the
+    tiles, so two periods differ in a minority of tiles, as real imagery does.
+    """
+    rng = np.random.default_rng(seed)
+    severe, stressed = rng.integers(5, 25), rng.integers(10, 30)
+    class_probs = [(100 - severe - stressed) / 100, stressed / 100, severe / 100]
+    red_path, nir_path = synthesize_bands(directory, shape, class_probs, seed=seed)
+
+    week = period[1].toordinal() // 7
+    events = np.random.default_rng([seed, week])
+    grid = tile_grid(shape, tile_px)
+    picked = events.random(len(grid)) < MOCK_EVENT_TILE_SHARE
+    if picked.any():
+        red = np.load(red_path, mmap_mode='r+')
+        for i in np.flatnonzero(picked):
+            factor = MOCK_EVENT_RED_FACTORS[int(events.integers(0, 2))]
+            red[grid[i]] = np.minimum(red[grid[i]] * factor, np.iinfo(np.uint16).max).astype(np.uint16)
+        red.flush()
+        del red
+    return red_path, nir_path
+
+
+def detect_changes(before, after, before_hashes=None, after_hashes=None, tile_px=CHANGE_TILE_PX):
+    """Per-pixel change between two class rasters, plus class transition counts.
+
+    Returns `(change, transitions)`: a uint8 raster of IMPROVED / UNCHANGED /
+    DEGRADED (NODATA where either period has no data) and
+    `{"Healthy → Stressed": pixels, ...}` for every transition that occurs.
+    With the tile hash grids of both periods, only tiles whose hashes
+    differ are compared pixel by pixel; the rest are unchanged by construction.
+    """
+    valid = (before != NODATA) & (after != NODATA)
+    change = np.where(valid, UNCHANGED, NODATA).astype(np.uint8)
+    if before_hashes is not None and after_hashes is not None and before_hashes.shape == after_hashes.shape:
+        grid = tile_grid(before.shape, tile_px)
+        windows = [grid[i] for i in np.flatnonzero(before_hashes.ravel() != after_hashes.ravel())]
+    else:
+        windows = [(slice(None), slice(None))]
+    for window in windows:
+        b, a, v = before[window], after[window], valid[window]
+        tile = change[window]
+        tile[v & (a > b)] = DEGRADED  # higher class code = more stress
+        tile[v & (a < b)] = IMPROVED
+
+    n = len(CLASS_NAMES)
+    counts = np.bincount(before[valid].astype(np.int64) * n + after[valid], minlength=n * n)
+    transitions = {
+        f"{CLASS_NAMES[i // n]} → {CLASS_NAMES[i % n]}": int(count)
+        for i, count in enumerate(counts) if count
+    }
+    return change, transitions
+
+
+def change_distribution(change):
+    """Percentage of comparable pixels per change class."""
+    counts = np.bincount(change.ravel(), minlength=NODATA + 1)[:len(CHANGE_NAMES)]
+    total = counts.sum()
+    return {name: round(float(100.0 * c / total), 1) if total else 0.0 for name, c in zip(CHANGE_NAMES, counts)}
+
+
+# Shared by every analysis in this process.
+SCENE_TILES = SceneTileCache()
@@ -0,0 +1,102 @@
+"""Shape-preserving reduction of long time series before they are charted.
+
+A chart can only show about one point per horizontal pixel, so sending it
+hundreds of thousands of sensor readings costs JSON size and browser time
+without adding detail. `reduce_series` cuts a series down to a point budget
+with either Largest-Triangle-Three-Buckets (keeps the visual shape, including
+isolated spikes) or min/max buckets (keeps every bucket's extremes; fully
+vectorized). Series already within budget are returned unchanged.
+"""
+import numpy as np
+
+MIN_BUCKET_POINTS = 3
+
+
+def _as_float(x):
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype('datetime64[ns]').astype(np.int64).astype(np.float64)
+    return x.astype(np.float64)
+
+
+def lttb_indices(x, y, n_out):
+    """Indices of the `n_out` points chosen by Largest-Triangle-Three-Buckets.
+
+    The first and last points are always kept; every bucket in between
+    contributes the point forming the largest triangle with the previously
+    chosen point and the mean of the next bucket.
+    """
+    n = len(y)
+    if n_out >= n or n_out < MIN_BUCKET_POINTS:
+        return np.arange(n)
+    x = _as_float(x)
+    y = np.asarray(y, dtype=np.float64)
+    # Bucket edges over the interior points [1, n - 1).
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    # Mean of every bucket, used as the third vertex for the bucket before it.
+    counts = np.diff(edges)
+    mean_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / counts
+    mean_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / counts
+    mean_x = np.append(mean_x, x[-1])
+    mean_y = np.append(mean_y, y[-1])
+
+    chosen = np.empty(n_out, dtype=np.int64)
+    chosen[0], chosen[-1] = 0, n - 1
+    prev = 0
+    for b in range(n_out - 2):
+        lo, hi = edges[b], edges[b + 1]
+        ax, ay = x[prev], y[prev]
+        area = np.abs((ax - mean_x[b + 1]) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (mean_y[b + 1] - ay))
+        prev = lo + int(np.argmax(area))
+        chosen[b + 1] = prev
+    return chosen
+
+
+def minmax_indices(y, n_out):
+    """Indices of each bucket's minimum and maximum, in order; about `n_out` points."""
+    n = len(y)
+    if n_out >= n or n_out < 2 * MIN_BUCKET_POINTS:
+        return np.arange(n)
+    y = np.asarray(y, dtype=np.float64)
+    n_buckets = (n_out - 2) // 2
+    edges = np.linspace(1, n - 1, n_buckets + 1).astype(np.int64)
+    width = int(np.diff(edges).max())
+    # Pad every bucket to the same width so argmin/argmax run over one 2-D array.
+    offsets = edges[:-1, None] + np.arange(width)
+    valid = offsets < edges[1:, None]
+    offsets = np.where(valid, offsets, edges[:-1, None])
+    values = y[offsets]
+    lows = offsets[np.arange(n_buckets), np.argmin(np.where(valid, values, np.inf), axis=1)]
+    highs = offsets[np.arange(n_buckets), np.argmax(np.where(valid, values, -np.inf), axis=1)]
+    picks = np.sort(np.stack([lows, highs], axis=1), axis=1).ravel()
+    return np.unique(np.concatenate([[0], picks, [n - 1]]))
+
+
+def reduce_series(x, y, max_points, method="lttb"):
+    """Returns `(x, y)` reduced to at most about `max_points` points.
+
+    Non-finite values are dropped before reducing; a series already within
+    budget is returned as given.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if len(y) <= max_points:
+        return x, y
+    finite = np.isfinite(y)
+    if not finite.all():
+        x, y = x[finite], y[finite]
+    if method == "lttb":
+        keep = lttb_indices(x, y, max_points)
+    elif method == "minmax":
+        keep = minmax_indices(y, max_points)
+    else:
+        raise ValueError(f"unknown reduction method: {method!r}")
+    return x[keep], y[keep]
+
+
+def window_slice(x, start=None, end=None):
+    """Slice of a sorted `x` covering [start, end]; either bound may be None."""
+    x = np.asarray(x)
+    lo = 0 if start is None else int(np.searchsorted(x, np.asarray(start, dtype=x.dtype), side="left"))
+    hi = len(x) if end is None else int(np.searchsorted(x, np.asarray(end, dtype=x.dtype), side="right"))
+    return slice(lo, hi)
@@ -0,0 +1,168 @@
+"""Several fields analysed in one pass.
+
+A farmer's plots are drawn as separate polygons (or MultiPolygons). Rather
+than running the pipeline once per plot, the plots are combined into one
+GeometryCollection AOI, the scene covering all of them is fetched and
+classified once, and every pixel is then assigned to the field containing it.
+
+A uniform grid over the field bounding boxes answers "which fields touch
+this raster block", so each field is rasterised only in the blocks it
+overlaps, blocks no field touches are skipped, and strips without any field
+pixel are never read by the classifier.
+"""
+import numpy as np
+
+from geometry import geometry_bounds, polygon_mask
+from ndvi_engine import CLASS_NAMES, NODATA
+
+FIELD_BLOCK_PX = 256
+FIELD_GEOMETRY_TYPES = ("Polygon", "MultiPolygon")
+MAX_GRID_CELLS_PER_SIDE = 64
+
+
+def drawn_fields(drawings):
+    """Polygon and MultiPolygon geometries among the map's drawn features, in drawing order."""
+    return [d['geometry'] for d in drawings or () if (d.get('geometry') or {}).get('type') in FIELD_GEOMETRY_TYPES]
+
+
+def combine_fields(fields):
+    """One AOI for a list of fields: the field itself, or a GeometryCollection of all of them."""
+    if len(fields) == 1:
+        return fields[0]
+    return {"type": "GeometryCollection", "geometries": list(fields)}
+
+
+def field_geometries(aoi):
+    """The fields making up an AOI built by `combine_fields`."""
+    if aoi['type'] == 'GeometryCollection':
+        return list(aoi['geometries'])
+    return [aoi]
+
+
+def field_boxes(fields):
+    """(N, 4) array of `min_lon, min_lat, max_lon, max_lat` per field."""
+    boxes = np.empty((len(fields), 4))
+    for i, field in enumerate(fields):
+        (min_lat, min_lon), (max_lat, max_lon) = geometry_bounds(field)
+        boxes[i] = min_lon, min_lat, max_lon, max_lat
+    return boxes
+
+
+class FieldGrid:
+    """Uniform-grid spatial index over field bounding boxes.
+
+    Cells are about the size of a typical field (never more than
+    MAX_GRID_CELLS_PER_SIDE across the largest one), and each cell lists the
+    fields whose box overlaps it.
+    """
+
+    def __init__(self, boxes, cell_size=None):
+        self.boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        extent = np.maximum(self.boxes[:, 2] - self.boxes[:, 0], self.boxes[:, 3] - self.boxes[:, 1])
+        if cell_size is None and len(extent):
+            cell_size = max(float(np.median(extent)), float(extent.max()) / MAX_GRID_CELLS_PER_SIDE)
+        self.cell_size = cell_size or 1e-6
+        self.origin = self.boxes[:, :2].min(axis=0) if len(self.boxes) else np.zeros(2)
+        self._cells = {}
+        lo, hi = self._cell_range(self.boxes)
+        for i, ((cx0, cy0), (cx1, cy1)) in enumerate(zip(lo.tolist(), hi.tolist())):
+            for cx in range(cx0, cx1 + 1):
+                for cy in range(cy0, cy1 + 1):
+                    self._cells.setdefault((cx, cy), []).append(i)
+
+    def _cell_range(self, boxes):
+        lo = np.floor((boxes[:, :2] - self.origin) / self.cell_size).astype(np.int64)
+        hi = np.floor((boxes[:, 2:] - self.origin) / self.cell_size).astype(np.int64)
+        return lo, hi
+
+    def query(self, box):
+        """Indices (ascending) of the fields whose bounding box intersects `box` (min_lon, min_lat, max_lon, max_lat)."""
+        box = np.asarray(box, dtype=np.float64)
+        (cx0, cy0), (cx1, cy1) = (r[0].tolist() for r in self._cell_range(box[None, :]))
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(self._cells):
+            cells = [ids for (cx, cy), ids in self._cells.items() if cx0 <= cx <= cx1 and cy0 <= cy <= cy1]
+        else:
+            cells = [self._cells.get((cx, cy), ()) for cx in range(cx0, cx1 + 1) for cy in range(cy0, cy1 + 1)]
+        candidates = np.unique(np.fromiter((i for ids in cells for i in ids), dtype=np.int64))
+        b = self.boxes[candidates]
+        overlaps = (b[:, 0] <= box[2]) & (b[:, 2] >= box[0]) & (b[:, 1] <= box[3]) & (b[:, 3] >= box[1])
+        return candidates[overlaps]
+
+
+def label_fields(fields, bounds, shape, block_px=FIELD_BLOCK_PX, index=None):
+    """uint16 raster of field numbers: 0 outside every field, i + 1 inside `fields[i]`.
+
+    `bounds` and `shape` describe the scene as for `geometry.polygon_mask`.
+    Where fields overlap, the pixel belongs to the earlier field, so every
+    pixel is counted once in the combined statistics.
+    """
+    (min_lat, min_lon), (max_lat, max_lon) = bounds
+    rows, cols = shape
+    px_w = (max_lon - min_lon) / cols
+    px_h = (max_lat - min_lat) / rows
+    index = index or FieldGrid(field_boxes(fields))
+    labels = np.zeros(shape, dtype=np.uint16)
+    for r0 in range(0, rows, block_px):
+        r1 = min(r0 + block_px, rows)
+        for c0 in range(0, cols, block_px):
+            c1 = min(c0 + block_px, cols)
+            block_bounds = [[max_lat - r1 * px_h, min_lon + c0 * px_w], [max_lat - r0 * px_h, min_lon + c1 * px_w]]
+            (south, west), (north, east) = block_bounds
+            window = labels[r0:r1, c0:c1]
+            for i in index.query((west, south, east, north)):
+                inside = polygon_mask(fields[i], block_bounds, window.shape)
+                window[inside & (window == 0)] = i + 1
+    return labels
+
+
+def field_statistics(stress_array, labels, n_fields, bounds, declining=None):
+    """Per-field area, class shares and forecast decline, from one bincount over the scene.
+
+    Returns one dict per field with `area_ha`, `health_distribution` (keyed
+    like `ndvi_engine.health_distribution`) and `declining_pct`.
+    """
+    (min_lat, min_lon), (max_lat, max_lon) = bounds
+    rows, cols = labels.shape
+    px_area_ha = ((max_lon - min_lon) / cols * 111320 * np.cos(np.radians((min_lat + max_lat) / 2))
+                  * (max_lat - min_lat) / rows * 110540 / 10000)
+    n_codes = len(CLASS_NAMES) + 1  # the classes plus one slot for NODATA
+    codes = np.minimum(np.asarray(stress_array, dtype=np.uint8), len(CLASS_NAMES)).astype(np.int64)
+    counts = np.bincount((labels.astype(np.int64) * n_codes + codes).ravel(),
+                         minlength=(n_fields + 1) * n_codes).reshape(n_fields + 1, n_codes)[1:]
+    if declining is not None:
+        declining_px = np.bincount(labels[np.ma.filled(declining, False) & (stress_array != NODATA)],
+                                   minlength=n_fields + 1)[1:]
+    else:
+        declining_px = np.zeros(n_fields, dtype=np.int64)
+
+    stats = []
+    for i in range(n_fields):
+        classified = counts[i, :len(CLASS_NAMES)]
+        total = classified.sum()
+        stats.append({
+            "name": f"Field {i + 1}",
+            "area_ha": float(counts[i].sum() * px_area_ha),
+            "health_distribution": {
+                name: round(float(100.0 * n / total), 1) if total else 0.0 for name, n in zip(CLASS_NAMES, classified)
+            },
+            "declining_pct": float(100.0 * declining_px[i] / total) if total else 0.0,
+        })
+    return stats
+
+
+def assign_anomalies(anomalies, labels, bounds, index):
+    """Field index (or None) for each anomaly: the field under its centroid, else the one whose box holds it."""
+    (min_lat, min_lon), (max_lat, max_lon) = bounds
+    rows, cols = labels.shape
+    owners = []
+    for anomaly in anomalies:
+        lon, lat = anomaly['centroid']
+        r = min(max(int((max_lat - lat) / (max_lat - min_lat) * rows), 0), rows - 1)
+        c = min(max(int((lon - min_lon) / (max_lon - min_lon) * cols), 0), cols - 1)
+        if labels[r, c]:
+            owners.append(int(labels[r, c]) - 1)
+            continue
+        # Centroid outside every field (e.g. a crescent-shaped patch): fall back to bounding boxes.
+        hits = index.query((lon, lat, lon, lat))
+        owners.append(int(hits[0]) if len(hits) else None)
+    return owners
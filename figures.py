@@ -0,0 +1,192 @@
+"""Figure builders for the dashboard: the folium health map and the Plotly charts.
+
+Pure functions of their inputs with no Streamlit calls, so the app can
+memoize them and benchmarks can run them headless.
+"""
+import folium
+import numpy as np
+import plotly.graph_objects as go
+
+from basemap import basemap_layer
+from change_detection import CHANGE_COLORMAP
+from downsampling import reduce_series, window_slice
+from fields import field_geometries
+from geometry import area_centroid, geometry_rings, map_tolerance, simplify_geometry
+from ndvi_engine import CLASS_NAMES
+from telemetry import timed
+from tiling import build_tile_pyramid, tile_url_template
+
+# Long environmental series are reduced to about two points per pixel of chart
+# width, and drawn with WebGL once a trace still has more points than SVG handles well.
+ENV_CHART_WIDTH_PX = 600
+ENV_CHART_MAX_POINTS = 2 * ENV_CHART_WIDTH_PX
+WEBGL_POINT_THRESHOLD = 1000
+MAP_ZOOM_START = 16
+ZONE_MAP_MAX_PX = 300
+
+
+@timed("render.folium_build")
+def build_spectral_health_map(stress_array, bounds, aoi, detected_anomalies=(), change_array=None, change_label=None):
+    """Health overlay, field boundaries and anomaly outlines; `aoi` is one field or a GeometryCollection.
+
+    A `change_array` (see `change_detection.detect_changes`) adds a change
+    layer, hidden until switched on in the layer control.
+    """
+    _, (center_lon, center_lat) = area_centroid(aoi)
+    health_map = folium.Map(location=[center_lat, center_lon], zoom_start=MAP_ZOOM_START, tiles=None)
+    basemap_layer("carto-dark").add_to(health_map)
+    
+    # Overlay is served as XYZ tiles from the local server; only visible tiles are fetched.
+    pyramid = build_tile_pyramid(stress_array, bounds)
+    folium.TileLayer(
+        tiles=tile_url_template(pyramid), attr="Krishi-Drishti", name='Spectral Health Map',
+        overlay=True, opacity=0.7, max_native_zoom=pyramid['max_zoom'], max_zoom=22
+    ).add_to(health_map)
+    
+    if change_array is not None:
+        change_pyramid = build_tile_pyramid(change_array, bounds, colormap=CHANGE_COLORMAP)
+        folium.TileLayer(
+            tiles=tile_url_template(change_pyramid), attr="Krishi-Drishti", name=change_label or "Change",
+            overlay=True, show=False, opacity=0.8, max_native_zoom=change_pyramid['max_zoom'], max_zoom=22
+        ).add_to(health_map)
+        folium.LayerControl(collapsed=False).add_to(health_map)
+
+    # Boundaries carry no more detail than half a screen pixel at the overlay's finest zoom.
+    detail_zoom = max(pyramid['max_zoom'], MAP_ZOOM_START)
+    aoi = simplify_geometry(aoi, map_tolerance(detail_zoom, center_lat))
+    fields = field_geometries(aoi)
+    for i, field in enumerate(fields):
+        tooltip = "Your Farm Boundary" if len(fields) == 1 else f"Field {i + 1}"
+        for ring in geometry_rings(field):
+            folium.Polygon(
+                locations=ring[:, ::-1].tolist(), color='#33bbff',
+                weight=3, fill=False, tooltip=tooltip
+            ).add_to(health_map)
+    if len(fields) > 1:
+        health_map.fit_bounds(bounds)
+
+    for anomaly in detected_anomalies:
+        folium.Polygon(
+            locations=np.asarray(anomaly['coordinates'])[:, ::-1].tolist(), color=anomaly['color'], weight=4,
+            fill=True, fill_color=anomaly['color'], fill_opacity=0.4,
+            tooltip=f"Anomaly Detected: {anomaly['type']} ({anomaly['area_ha']:.2f} ha)"
+        ).add_to(health_map)
+        folium.Marker(
+            location=(anomaly['centroid'][1], anomaly['centroid'][0]),
+            icon=folium.Icon(color='red', icon='exclamation-triangle', prefix='fa'),
+            tooltip=f"Anomaly: {anomaly['type']}"
+        ).add_to(health_map)
+
+    # Render once here so cache hits skip folium's HTML templating.
+    health_map.get_root().render()
+    return health_map
+
+
+@timed("render.figure.temporal_trend")
+def create_temporal_trend_chart(hist_data, pred_data):
+    fig = go.Figure()
+    hist_len = len(hist_data)
+    
+    fig.add_trace(go.Scatter(x=list(range(hist_len)), y=hist_data, mode='lines+markers', name='Historical NDVI', line=dict(color='#33bbff', width=3)))
+    fig.add_trace(go.Scatter(x=list(range(hist_len - 1, hist_len + len(pred_data))), y=[hist_data[-1]] + list(pred_data), mode='lines', name='14-Day Forecast', line=dict(color='#ff6a6a', dash='dash', width=3)))
+    
+    fig.update_layout(
+        title_text='<b>Crop Health Forecast (NDVI)</b>',
+        xaxis_title='Time', yaxis_title='NDVI Value',
+        legend=dict(x=0.01, y=0.99, bgcolor='rgba(0,0,0,0.5)', bordercolor='white', borderwidth=1),
+        paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font=dict(color='white')
+    )
+    return fig
+
+
+def series_trace(x, y, window=None, max_points=ENV_CHART_MAX_POINTS, **kwargs):
+    """Line trace of `y` over `x` (optionally cut to a (start, end) window), reduced to `max_points`."""
+    if window is not None:
+        visible = window_slice(x, *window)
+        x, y = np.asarray(x)[visible], np.asarray(y)[visible]
+    x, y = reduce_series(x, y, max_points)
+    trace = go.Scattergl if len(y) > WEBGL_POINT_THRESHOLD else go.Scatter
+    return trace(x=x, y=y, **kwargs)
+
+
+@timed("render.figure.soil_condition")
+def create_soil_condition_chart(dates, moisture_data, window=None):
+    fig = go.Figure()
+    fig.add_trace(series_trace(dates, moisture_data, window, mode='lines', fill='tozeroy', name='Soil Moisture', line=dict(color='#966919', width=2)))
+    fig.update_layout(
+        title_text='<b>Historical Soil Moisture</b>',
+        xaxis_title='Date', yaxis_title='Soil Moisture Level',
+        paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font=dict(color='white')
+    )
+    return fig
+
+
+@timed("render.figure.health_pie")
+def create_health_pie_chart(health_distribution):
+    fig = go.Figure(data=[go.Pie(
+        labels=list(health_distribution.keys()), 
+        values=list(health_distribution.values()), 
+        hole=.4, marker_colors=['#2ca02c', '#ff7f0e', '#d62728'],
+        pull=[0, 0, 0.1]
+    )])
+    fig.update_layout(
+        title_text='<b>Farm Health Distribution</b>', showlegend=True, height=280, 
+        margin=dict(t=50, b=10, l=10, r=10),
+        paper_bgcolor='rgba(0,0,0,0)', font=dict(color='white')
+    )
+    return fig
+
+
+@timed("render.figure.transition_pie")
+def create_transition_pie_chart(transitions, title='<b>Health Changes</b>'):
+    """Pie of class transitions ("Healthy → Stressed": pixels); worse in red shades, better in blue, same in grey."""
+    order = {name: i for i, name in enumerate(CLASS_NAMES)}
+    colors = []
+    for label in transitions:
+        before, after = (order[name] for name in label.split(" → "))
+        colors.append('#d62728' if after - before == 2 else '#ff7f0e' if after > before
+                      else '#1f77b4' if after < before else '#7f7f7f')
+    fig = go.Figure(data=[go.Pie(
+        labels=list(transitions.keys()), values=list(transitions.values()),
+        hole=.4, marker_colors=colors, sort=False
+    )])
+    fig.update_layout(
+        title_text=title, showlegend=True, height=300,
+        margin=dict(t=50, b=10, l=10, r=10),
+        paper_bgcolor='rgba(0,0,0,0)', font=dict(color='white')
+    )
+    return fig
+
+
+@timed("render.figure.zone_map")
+def create_zone_map(zone_labels, zone_stats):
+    """Heatmap of each zone's mean NDVI (see `zones.build_zones`), sampled down to ZONE_MAP_MAX_PX a side."""
+    step = max(-(-max(zone_labels.shape) // ZONE_MAP_MAX_PX), 1)
+    labels = zone_labels[::step, ::step]
+    zone_ndvi = np.array([np.nan] + [z['mean_ndvi'] for z in zone_stats])
+    fig = go.Figure(data=[go.Heatmap(
+        z=zone_ndvi[labels][::-1], customdata=labels[::-1], colorscale='RdYlGn', zmin=0.2, zmax=0.9,
+        hovertemplate='Zone %{customdata}<br>Mean NDVI %{z:.3f}<extra></extra>',
+        colorbar=dict(title='NDVI')
+    )])
+    fig.update_layout(
+        title_text='<b>Management Zones (mean NDVI)</b>', height=360,
+        margin=dict(t=50, b=10, l=10, r=10),
+        xaxis=dict(visible=False), yaxis=dict(visible=False, scaleanchor='x'),
+        paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font=dict(color='white')
+    )
+    return fig
+
+
+# --- NEW FUNCTION FOR TEMPERATURE CHART ---
+@timed("render.figure.temperature")
+def create_temperature_chart(dates, temp_data, window=None):
+    """Creates a themed Plotly line chart for temperature."""
+    fig = go.Figure()
+    fig.add_trace(series_trace(dates, temp_data, window, mode='lines', name='Temperature', line=dict(color='#FF5733', width=2)))
+    fig.update_layout(
+        title_text='<b>Historical Temperature</b>',
+        xaxis_title='Date', yaxis_title='Temperature (°C)',
+        paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font=dict(color='white')
+    )
+    return fig
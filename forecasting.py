@@ -0,0 +1,99 @@
+"""Batched NDVI forecasting for every pixel (or zone) at once.
+
+Each series is fitted with the same small linear model, an intercept and a
+trend plus optional annual harmonics, so the whole field is one least-squares
+problem over a (time x pixels) matrix. Without gaps that is a single
+`lstsq` call sharing one design matrix. With cloud gaps (NaN) every pixel
+gets its own weighted normal equations, built with two matrix products and
+solved as a batch of k x k systems. Pixels are read, converted to float64,
+fitted and forecast one PIXEL_CHUNK at a time, so the (T, pixels) input is
+never copied whole and may be a memory-mapped array.
+"""
+import numpy as np
+
+PERIOD_DAYS = 365.25
+RIDGE = 1e-6
+PIXEL_CHUNK = 262144
+DECLINE_THRESHOLD = 0.05
+
+
+def design_matrix(t, harmonics=1, period=PERIOD_DAYS):
+    """Columns: 1, t, then sin/cos pairs of the annual cycle for each harmonic."""
+    t = np.asarray(t, dtype=np.float64)
+    columns = [np.ones_like(t), t]
+    for h in range(1, harmonics + 1):
+        angle = 2 * np.pi * h * t / period
+        columns += [np.sin(angle), np.cos(angle)]
+    return np.stack(columns, axis=1)
+
+
+def _auto_harmonics(t, period=PERIOD_DAYS):
+    # A seasonal term is only identifiable once the history spans a good part of a cycle.
+    span = float(np.max(t) - np.min(t)) if len(t) else 0.0
+    return 1 if span >= period / 2 else 0
+
+
+def fit_coefficients(t, values, harmonics=None):
+    """Least-squares coefficients for every column of `values` (T, P); NaNs are treated as gaps.
+
+    `values` is read PIXEL_CHUNK columns at a time, so it can be float32 or
+    memory-mapped. Returns `(coefficients (k, P), harmonics)`. Series with
+    fewer valid observations than coefficients come back as NaN.
+    """
+    t = np.asarray(t, dtype=np.float64)
+    if harmonics is None:
+        harmonics = _auto_harmonics(t)
+    X = design_matrix(t, harmonics)
+    k = X.shape[1]
+    coef = np.full((k, values.shape[1]), np.nan)
+
+    eye = RIDGE * np.eye(k)
+    # Outer products of the design rows, so each pixel's X'WX is one matrix product row.
+    outer = (X[:, :, None] * X[:, None, :]).reshape(len(t), k * k)
+    for start in range(0, values.shape[1], PIXEL_CHUNK):
+        cols = slice(start, start + PIXEL_CHUNK)
+        chunk = np.asarray(values[:, cols], dtype=np.float64)
+        valid = ~np.isnan(chunk)
+        if valid.all():
+            if len(t) >= k:
+                coef[:, cols] = np.linalg.lstsq(X, chunk, rcond=None)[0]
+            continue
+        w = valid.astype(np.float64)
+        y = np.where(valid, chunk, 0.0)
+        xtx = (w.T @ outer).reshape(-1, k, k) + eye
+        xty = y.T @ X
+        enough = w.sum(axis=0) >= k
+        block = np.full((k, xtx.shape[0]), np.nan)
+        if enough.any():
+            block[:, enough] = np.linalg.solve(xtx[enough], xty[enough][..., None])[..., 0].T
+        coef[:, cols] = block
+    return coef, harmonics
+
+
+def forecast_cube(dates, stack, horizon=14):
+    """Daily forecast for every pixel of an NDVI stack.
+
+    `dates` are the T observation dates and `stack` a (T, ...) array of NDVI
+    (NaN = no valid observation). Returns `(future_dates, cube)` where cube has
+    shape (horizon, ...) and is float32.
+    """
+    dates = np.asarray(dates, dtype='datetime64[D]')
+    spatial_shape = stack.shape[1:]
+    pixels = stack.reshape(len(dates), -1)  # a view for a contiguous stack; read one chunk at a time below
+    t = (dates - dates[0]).astype(np.float64)
+    harmonics = _auto_harmonics(t)
+
+    future_dates = dates[-1] + np.arange(1, horizon + 1)
+    X_future = design_matrix((future_dates - dates[0]).astype(np.float64), harmonics)
+    cube = np.empty((horizon, pixels.shape[1]), dtype=np.float32)
+    for start in range(0, pixels.shape[1], PIXEL_CHUNK):
+        cols = slice(start, start + PIXEL_CHUNK)
+        coef, _ = fit_coefficients(t, pixels[:, cols], harmonics)
+        cube[:, cols] = X_future @ coef
+    return future_dates, cube.reshape((horizon,) + spatial_shape)
+
+
+def declining_mask(cube, threshold=DECLINE_THRESHOLD):
+    """Pixels whose forecast NDVI drops by more than `threshold` over the horizon."""
+    with np.errstate(invalid='ignore'):
+        return (cube[0] - cube[-1]) > threshold
@@ -0,0 +1,549 @@
+"""Local place search for the map's search box, from a village gazetteer.
+
+The search box on the initial map queries `/geocode/search` on the local
+server instead of a public geocoding service, so it answers in milliseconds
+over a slow rural link and keeps working offline. Places are read from the
+file named by KRISHI_GAZETTEER, either
+
+- a CSV with a header row: `name`, `lat`, `lon` and optionally `state`,
+  `district`, `subdistrict` (or `tehsil` / `taluk` / `block`), `population`
+  and `alt_names` (separated by `;`), such as a village directory export; or
+- a GeoNames country dump (`IN.txt`, tab separated, no header), with state
+  and district names taken from `admin1CodesASCII.txt` / `admin2Codes.txt`
+  beside it when present.
+
+Every name is indexed under a phonetic key that folds the usual spelling
+variants of romanised Indian place names (aspirates, long vowels, v/w, z/j,
+the unwritten inherent "a") and transliterates the Indic scripts, so
+"Chhindwara", "Chindwara" and "छिंदवाड़ा" share a key. The keys form a
+prefix trie flattened into one sorted array, where every trie node is a
+contiguous range found by two bisections; the nodes of the top levels, whose
+ranges are large, keep their best completions precomputed. Misspellings the
+keys do not fold are caught by a trigram index over the keys. Places rank by
+population. The compiled index is cached on disk under a fingerprint of the
+source file, and recent lookups in an in-process LRU.
+
+A query may name the district or state after a comma ("rampur, bareilly").
+The endpoint returns the subset of Nominatim's `/search` JSON the Leaflet
+geocoder control reads, so the stock control is simply pointed at it:
+
+    python gazetteer.py build villages.csv
+    python gazetteer.py search "chindwara, madhya"
+"""
+import argparse
+import csv
+import hashlib
+import json
+import math
+import os
+import pickle
+import re
+import sys
+import threading
+import time
+import unicodedata
+import uuid
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+import numpy as np
+
+import local_server
+
+GAZETTEER_PATH = os.environ.get("KRISHI_GAZETTEER", "")
+CACHE_DIR = os.environ.get(
+    "KRISHI_GAZETTEER_CACHE", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".krishi_cache", "gazetteer")
+)
+INDEX_VERSION = 1  # bump when the key function or the index layout changes
+LOOKUP_CACHE_ENTRIES = 2048
+DEFAULT_LIMIT = 5
+MAX_LIMIT = 50
+TOP_DEPTH = 2  # trie levels whose best MAX_LIMIT completions are precomputed
+FUZZY_MIN_KEY = 3  # shorter keys only match by prefix
+FUZZY_MIN_SCORE = 0.5  # Dice similarity of the padded keys' trigrams
+FUZZY_MAX_POSTINGS = 20000  # trigrams shared by more keys than this carry no signal
+PLACE_RADIUS_M = 1500  # half-size of the box returned around a place
+RESULT_ZOOM = 15  # the map jumps to the chosen place at this zoom
+
+CSV_COLUMNS = {
+    "name": ("name", "village", "village_name", "place", "place_name"),
+    "lat": ("lat", "latitude", "y"),
+    "lon": ("lon", "lng", "long", "longitude", "x"),
+    "state": ("state", "state_name"),
+    "district": ("district", "district_name"),
+    "subdistrict": ("subdistrict", "sub_district", "subdistrict_name", "tehsil", "taluk", "taluka", "block", "mandal"),
+    "population": ("population", "pop", "total_population"),
+    "alt_names": ("alt_names", "alternate_names", "alternatenames", "other_names"),
+}
+GEONAMES_FIELDS = 19
+GEONAMES_CLASSES = ("P", "A")  # populated places and administrative areas
+
+# Indic scripts share Devanagari's layout, one 128-codepoint block per script
+# from Devanagari (U+0900) to Malayalam (U+0D00), so one table by offset
+# transliterates all of them, roughly.
+INDIC_FIRST, INDIC_END = 0x0900, 0x0D80
+INDIC_CONSONANTS = dict(zip(range(0x15, 0x3A), (
+    "k kh g gh n ch chh j jh n t th d dh n t th d dh n n p ph b bh m y r r l l l v sh sh s h".split()
+)))
+INDIC_CONSONANTS.update(zip(range(0x58, 0x60), "q kh g z r r f y".split()))
+INDIC_VOWEL_SIGNS = dict(zip(range(0x3E, 0x4D), "aa i ii u uu ri ri e e e ai o o o au".split()))
+INDIC_OTHERS = dict(zip(range(0x05, 0x15), "a aa i ii u uu ri li e e e ai o o o au".split()))
+INDIC_OTHERS.update({0x01: "n", 0x02: "n", 0x03: "h"})
+INDIC_OTHERS.update((0x66 + d, str(d)) for d in range(10))
+INDIC_VIRAMA, INDIC_NUKTA = 0x4D, 0x3C
+NUKTA_FORMS = {"d": "r", "dh": "r", "k": "q", "j": "z", "ph": "f", "g": "g", "kh": "kh"}
+
+# Applied in order to the lowercased Latin name; each pair folds spellings that
+# are used interchangeably when Indian place names are romanised.
+KEY_REPLACEMENTS = (
+    ("chh", "c"), ("ch", "c"), ("sh", "s"), ("ph", "f"), ("w", "v"), ("z", "j"), ("q", "k"), ("x", "ks"),
+    ("ck", "k"), ("ee", "i"), ("ii", "i"), ("oo", "u"), ("uu", "u"), ("aa", "a"),
+)
+_NOT_ALNUM = re.compile(r"[^a-z0-9]+")
+_ASPIRATE = re.compile(r"([bdgjkpt])h")
+_REPEAT = re.compile(r"(.)\1+")
+# The inherent "a" is written or not at will ("Rampur" / "Ramapura"), so it is dropped after a consonant.
+_SCHWA = re.compile(r"(?<=[b-df-hj-np-tv-z])a(?=[b-df-hj-np-tv-z]|$)")
+
+
+def transliterate(text):
+    """Latin spelling of any Indic-script characters in `text`; other characters pass through."""
+    out = []
+    pending = False  # a consonant's inherent "a", written unless a sign or virama follows
+    for ch in text:
+        cp = ord(ch)
+        if not INDIC_FIRST <= cp < INDIC_END:
+            if pending:
+                out.append("a")
+                pending = False
+            out.append(ch)
+            continue
+        offset = (cp - INDIC_FIRST) % 0x80
+        if offset in INDIC_CONSONANTS:
+            if pending:
+                out.append("a")
+            out.append(INDIC_CONSONANTS[offset])
+            pending = True
+        elif offset in INDIC_VOWEL_SIGNS:
+            out.append(INDIC_VOWEL_SIGNS[offset])
+            pending = False
+        elif offset == INDIC_VIRAMA:
+            pending = False
+        elif offset == INDIC_NUKTA:
+            if out and out[-1] in NUKTA_FORMS:
+                out[-1] = NUKTA_FORMS[out[-1]]
+        else:
+            if pending:
+                out.append("a")
+                pending = False
+            out.append(INDIC_OTHERS.get(offset, ""))
+    if pending:
+        out.append("a")
+    return "".join(out)
+
+
+def fold_text(text):
+    """Lowercase ASCII form of a name: Indic scripts transliterated, accents and punctuation dropped."""
+    if text.isascii():
+        return text.lower()
+    text = unicodedata.normalize("NFKD", transliterate(unicodedata.normalize("NFC", text)))
+    return "".join(ch for ch in text if not unicodedata.combining(ch)).lower()
+
+
+def plain_text(name):
+    """A name's letters and digits only, folded as by `fold_text`."""
+    return _NOT_ALNUM.sub("", fold_text(name))
+
+
+def place_key(name):
+    """Phonetic search key of a place name; spelling variants of one name share a key."""
+    key = plain_text(name)
+    folded = key
+    for old, new in KEY_REPLACEMENTS:
+        folded = folded.replace(old, new)
+    folded = _SCHWA.sub("", _REPEAT.sub(r"\1", _ASPIRATE.sub(r"\1", folded)))
+    return _REPEAT.sub(r"\1", folded) or key
+
+
+def key_trigrams(key):
+    """Distinct trigrams of a key padded with `^` and `$`."""
+    padded = f"^{key}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _column(header, field):
+    for alias in CSV_COLUMNS[field]:
+        if alias in header:
+            return header[alias]
+    return None
+
+
+def _number(text, default=0.0):
+    try:
+        value = float(text)
+    except (TypeError, ValueError):
+        return default
+    return value if math.isfinite(value) else default
+
+
+def read_csv_places(path):
+    """Place dicts (`name`, `lat`, `lon`, `admin`, `population`, `alt_names`) from a gazetteer CSV."""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        header = {name.strip().lower(): i for i, name in enumerate(next(reader, []))}
+        columns = {field: _column(header, field) for field in CSV_COLUMNS}
+        if columns["name"] is None or columns["lat"] is None or columns["lon"] is None:
+            raise ValueError(f"{path}: a gazetteer CSV needs name, lat and lon columns")
+
+        def cell(row, field):
+            i = columns[field]
+            return row[i].strip() if i is not None and i < len(row) else ""
+
+        for row in reader:
+            name, lat, lon = cell(row, "name"), _number(cell(row, "lat"), None), _number(cell(row, "lon"), None)
+            if not name or lat is None or lon is None:
+                continue
+            yield {
+                "name": name, "lat": lat, "lon": lon,
+                "admin": (cell(row, "subdistrict"), cell(row, "district"), cell(row, "state")),
+                "population": int(_number(cell(row, "population"))),
+                "alt_names": [n.strip() for n in cell(row, "alt_names").split(";") if n.strip()],
+            }
+
+
+def _admin_codes(path):
+    names = {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                fields = line.rstrip("\n").split("\t")
+                if len(fields) >= 2:
+                    names[fields[0]] = fields[1]
+    except OSError:
+        pass
+    return names
+
+
+def read_geonames_places(path):
+    """Place dicts from a GeoNames dump, keeping populated places and administrative areas."""
+    directory = os.path.dirname(os.path.abspath(path))
+    states = _admin_codes(os.path.join(directory, "admin1CodesASCII.txt"))
+    districts = _admin_codes(os.path.join(directory, "admin2Codes.txt"))
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) < GEONAMES_FIELDS or fields[6] not in GEONAMES_CLASSES:
+                continue
+            country, admin1, admin2 = fields[8], fields[10], fields[11]
+            yield {
+                "name": fields[1], "lat": _number(fields[4]), "lon": _number(fields[5]),
+                "admin": ("", districts.get(f"{country}.{admin1}.{admin2}", ""), states.get(f"{country}.{admin1}", "")),
+                "population": int(_number(fields[14])),
+                "alt_names": [n for n in fields[3].split(",") if n and n != fields[1]] + [fields[2]],
+            }
+
+
+def read_places(path):
+    """Places from a gazetteer file; GeoNames dumps are told apart from CSVs by their tab-separated rows."""
+    with open(path, encoding="utf-8-sig") as f:
+        first = f.readline()
+    if first.count("\t") >= GEONAMES_FIELDS - 1:
+        return read_geonames_places(path)
+    return read_csv_places(path)
+
+
+class PlaceIndex:
+    """Prefix trie and trigram index over the phonetic keys of a list of places."""
+
+    def __init__(self, places):
+        names, lats, lons, populations, entry_admin = [], [], [], [], []
+        admin_ids = {}
+        known_keys = {}  # village names repeat a lot, so each distinct name is keyed once
+        key_pairs = []  # (key, entry) for every distinct key of every place
+        for place in places:
+            entry = len(names)
+            names.append(place["name"])
+            lats.append(place["lat"])
+            lons.append(place["lon"])
+            populations.append(place["population"])
+            entry_admin.append(admin_ids.setdefault(tuple(place["admin"]), len(admin_ids)))
+            keys = {known_keys.get(n) or known_keys.setdefault(n, place_key(n))
+                    for n in [place["name"]] + list(place["alt_names"])}
+            key_pairs.extend((key, entry) for key in keys if key)
+
+        self.names = names
+        self.lat = np.array(lats, dtype=np.float64)
+        self.lon = np.array(lons, dtype=np.float64)
+        self.population = np.array(populations, dtype=np.int64)
+        self.admins = list(admin_ids)
+        self.entry_admin = np.array(entry_admin, dtype=np.int32)
+        # Rank 0 is the most important place: largest population, then shortest name.
+        order = sorted(range(len(names)), key=lambda i: (-populations[i], len(names[i]), names[i]))
+        self.entry_rank = np.empty(len(names), dtype=np.int32)
+        self.entry_rank[order] = np.arange(len(names), dtype=np.int32)
+
+        # The trie: keys sorted, each key's places by rank, so every prefix is one contiguous range.
+        key_pairs.sort(key=lambda pair: (pair[0], int(self.entry_rank[pair[1]])))
+        self.keys = [key for key, _ in key_pairs]
+        self.key_entry = np.array([entry for _, entry in key_pairs], dtype=np.int32)
+        self.top = {}
+        prefixes = {key[:depth] for key in self.keys for depth in range(1, TOP_DEPTH + 1)}
+        for prefix in prefixes:
+            self.top[prefix] = self._best(*self._prefix_range(prefix), MAX_LIMIT)
+
+        # The trigram index, over distinct keys: postings in CSR form.
+        starts = [i for i in range(len(self.keys)) if i == 0 or self.keys[i] != self.keys[i - 1]]
+        self.key_start = np.array(starts + [len(self.keys)], dtype=np.int64)
+        trigram_ids, pair_trigrams, pair_keys, counts = {}, [], [], []
+        for k, start in enumerate(starts):
+            trigrams = key_trigrams(self.keys[start])
+            counts.append(len(trigrams))
+            for trigram in trigrams:
+                pair_trigrams.append(trigram_ids.setdefault(trigram, len(trigram_ids)))
+                pair_keys.append(k)
+        pair_trigrams = np.array(pair_trigrams, dtype=np.int32)
+        by_trigram = np.argsort(pair_trigrams, kind="stable")
+        self.postings = np.array(pair_keys, dtype=np.int32)[by_trigram]
+        self.posting_start = np.searchsorted(pair_trigrams[by_trigram], np.arange(len(trigram_ids) + 1))
+        self.trigram_ids = trigram_ids
+        self.key_trigram_count = np.array(counts, dtype=np.int32)
+
+        # Admin names as a sorted key list too, for the qualifiers after a comma.
+        admin_pairs = sorted({(known_keys.get(n) or known_keys.setdefault(n, place_key(n)), a)
+                              for a, admin in enumerate(self.admins) for n in admin if n})
+        self.admin_keys = [key for key, _ in admin_pairs]
+        self.admin_key_ids = np.array([a for _, a in admin_pairs], dtype=np.int32)
+
+    def __len__(self):
+        return len(self.names)
+
+    def _prefix_range(self, prefix):
+        lo = bisect_left(self.keys, prefix)
+        return lo, bisect_left(self.keys, prefix + "~", lo)  # "~" sorts after every key character
+
+    def _best(self, lo, hi, limit, allowed=None):
+        """Entries of trie range [lo, hi) in rank order, without repeats, at most `limit`."""
+        entries = self.key_entry[lo:hi]
+        if allowed is not None:
+            entries = entries[allowed[self.entry_admin[entries]]]
+        return self._ranked(entries, limit)
+
+    def _ranked(self, entries, limit):
+        if len(entries) > 4 * limit:  # a place appears once per distinct key of its names
+            entries = entries[np.argpartition(self.entry_rank[entries], 4 * limit)[:4 * limit]]
+        entries = entries[np.argsort(self.entry_rank[entries], kind="stable")]
+        _, first = np.unique(entries, return_index=True)
+        return entries[np.sort(first)][:limit]
+
+    def allowed_admins(self, qualifiers):
+        """Boolean mask over admin units matching every qualifier, or None without qualifiers."""
+        allowed = None
+        for qualifier in qualifiers:
+            key = place_key(qualifier)
+            if not key:
+                continue
+            lo = bisect_left(self.admin_keys, key)
+            hi = bisect_left(self.admin_keys, key + "~", lo)
+            match = np.zeros(len(self.admins), dtype=bool)
+            match[self.admin_key_ids[lo:hi]] = True
+            allowed = match if allowed is None else allowed & match
+        return allowed
+
+    def fuzzy(self, key, limit, allowed=None):
+        """Entries whose key shares at least FUZZY_MIN_SCORE of its trigrams with `key`, best first."""
+        trigrams = key_trigrams(key)
+        lists = []
+        for trigram in trigrams:
+            t = self.trigram_ids.get(trigram)
+            if t is not None:
+                lists.append(self.postings[self.posting_start[t]:self.posting_start[t + 1]])
+        if not lists:
+            return np.zeros(0, dtype=np.int32)
+        lists.sort(key=len)
+        useful = [p for p in lists if len(p) <= FUZZY_MAX_POSTINGS] or lists[:1]
+        candidates, shared = np.unique(np.concatenate(useful), return_counts=True)
+        score = 2.0 * shared / (len(trigrams) + self.key_trigram_count[candidates])
+        keep = score >= FUZZY_MIN_SCORE
+        candidates, score = candidates[keep], score[keep]
+        # Each key's best place (its first in the trie), ordered by similarity, then rank.
+        entries = self.key_entry[self.key_start[candidates]]
+        order = np.lexsort((self.entry_rank[entries], -score))
+        entries = entries[order]
+        if allowed is not None:
+            entries = entries[allowed[self.entry_admin[entries]]]
+        _, first = np.unique(entries, return_index=True)
+        return entries[np.sort(first)][:limit]
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        """Entry numbers of the places best matching `query`.
+
+        Places named exactly as typed come first, then the completions of the
+        query's key in rank order, then near misses from the trigram index.
+        """
+        name, *qualifiers = query.split(",")
+        key = place_key(name)
+        if not key:
+            return []
+        allowed = self.allowed_admins(qualifiers)
+        lo, hi = self._prefix_range(key)
+        typed = plain_text(name)
+        same_key = self._best(lo, bisect_right(self.keys, key, lo, hi), 4 * limit, allowed).tolist()
+        found = [entry for entry in same_key if plain_text(self.names[entry]) == typed]
+        if len(key) <= TOP_DEPTH and allowed is None:
+            found += self.top.get(key, self.key_entry[:0])[:2 * limit].tolist()
+        else:
+            found += self._best(lo, hi, 2 * limit, allowed).tolist()
+        if len(set(found)) < limit and len(key) >= FUZZY_MIN_KEY:
+            found += self.fuzzy(key, 2 * limit, allowed).tolist()
+        return list(dict.fromkeys(found))[:limit]
+
+    def describe(self, entry):
+        """Nominatim-style result dict for one place."""
+        name = self.names[entry]
+        subdistrict, district, state = self.admins[self.entry_admin[entry]]
+        lat, lon = float(self.lat[entry]), float(self.lon[entry])
+        dlat = PLACE_RADIUS_M / 110540
+        dlon = PLACE_RADIUS_M / (111320 * max(math.cos(math.radians(lat)), 0.01))
+        return {
+            "place_id": entry,
+            "lat": f"{lat:.6f}", "lon": f"{lon:.6f}",
+            "display_name": ", ".join(part for part in (name, subdistrict, district, state) if part),
+            "boundingbox": [f"{lat - dlat:.6f}", f"{lat + dlat:.6f}", f"{lon - dlon:.6f}", f"{lon + dlon:.6f}"],
+            "class": "place", "type": "village",
+            "importance": round(1.0 - float(self.entry_rank[entry]) / max(len(self), 1), 4),
+            "address": {"village": name, "county": subdistrict, "state_district": district, "state": state},
+        }
+
+
+def source_fingerprint(path):
+    """Cache key of a gazetteer file: its path, size, modification time and the index version."""
+    st = os.stat(path)
+    return hashlib.sha1(f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}|{INDEX_VERSION}".encode()).hexdigest()
+
+
+def build_index(path, cache_dir=CACHE_DIR):
+    """PlaceIndex of a gazetteer file, compiled once and then read back from the cache directory."""
+    cached = os.path.join(cache_dir, f"{source_fingerprint(path)}.pkl")
+    try:
+        with open(cached, "rb") as f:
+            state = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        pass
+    else:
+        index = PlaceIndex.__new__(PlaceIndex)
+        index.__dict__.update(state)
+        return index
+    index = PlaceIndex(read_places(path))
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{cached}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "wb") as f:
+        # The attributes rather than the object, so the file loads whichever module name wrote it.
+        pickle.dump(vars(index), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, cached)
+    return index
+
+
+class Gazetteer:
+    """The configured gazetteer, loaded on first use, with an LRU of recent lookups."""
+
+    def __init__(self, path=GAZETTEER_PATH, cache_dir=CACHE_DIR, lookup_entries=LOOKUP_CACHE_ENTRIES):
+        self.path = path
+        self.cache_dir = cache_dir
+        self.lookup_entries = lookup_entries
+        self._index = None
+        self._lookups = OrderedDict()
+        self._load_lock = threading.Lock()
+        self._lock = threading.Lock()
+
+    @property
+    def available(self):
+        return bool(self.path) and os.path.isfile(self.path)
+
+    def index(self):
+        with self._load_lock:
+            if self._index is None:
+                self._index = build_index(self.path, self.cache_dir)
+            return self._index
+
+    def load_async(self):
+        """Loads the index on a background thread, so the first search does not wait for it."""
+        if self._index is None and self.available:
+            threading.Thread(target=self.index, name="krishi-gazetteer-load", daemon=True).start()
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        """Nominatim-style result dicts for `query`, served from the LRU when it was asked recently."""
+        lookup = (" ".join(query.lower().split()), limit)
+        with self._lock:
+            if lookup in self._lookups:
+                self._lookups.move_to_end(lookup)
+                return self._lookups[lookup]
+        index = self.index()
+        results = [index.describe(entry) for entry in index.search(lookup[0], limit)]
+        with self._lock:
+            self._lookups[lookup] = results
+            while len(self._lookups) > self.lookup_entries:
+                self._lookups.popitem(last=False)
+        return results
+
+
+# Shared by every session in this server process.
+GAZETTEER = Gazetteer()
+
+
+def _serve_geocode(parts, query):
+    """Handles /geocode/search?q=<text>&limit=<n>, answering like Nominatim's JSON search."""
+    if parts != ["search"]:
+        return 404, "text/plain", b"unknown geocode path"
+    if not GAZETTEER.available:
+        return 503, "text/plain", b"no gazetteer configured"
+    text = (query.get("q") or [""])[0]
+    try:
+        limit = min(max(int((query.get("limit") or [DEFAULT_LIMIT])[0]), 1), MAX_LIMIT)
+    except ValueError:
+        limit = DEFAULT_LIMIT
+    body = json.dumps(GAZETTEER.search(text, limit), ensure_ascii=False).encode("utf-8")
+    return 200, "application/json; charset=utf-8", body
+
+
+local_server.register_route("geocode", _serve_geocode)
+
+
+def geocoder_options():
+    """Keyword arguments for folium's Geocoder: the local search when a gazetteer is configured, else none."""
+    if not GAZETTEER.available:
+        return {}
+    GAZETTEER.load_async()
+    # Leaflet's Nominatim geocoder requests `<serviceUrl>search?q=...&format=json`.
+    return {"provider": "nominatim", "provider_options": {"serviceUrl": local_server.public_url("geocode") + "/"},
+            "zoom": RESULT_ZOOM}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query the local place search index.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="compile a gazetteer file into the index cache")
+    build.add_argument("path", nargs="?", default=GAZETTEER_PATH)
+    search = commands.add_parser("search", help="print the places matching a query")
+    search.add_argument("query")
+    search.add_argument("--path", default=GAZETTEER_PATH)
+    search.add_argument("--limit", type=int, default=DEFAULT_LIMIT)
+    args = parser.parse_args(argv)
+    if not args.path:
+        parser.error("no gazetteer file: pass one or set KRISHI_GAZETTEER")
+
+    started = time.perf_counter()
+    index = build_index(args.path)
+    print(f"{len(index)} places, {len(index.keys)} keys in {time.perf_counter() - started:.2f}s", file=sys.stderr)
+    if args.command == "search":
+        started = time.perf_counter()
+        entries = index.search(args.query, args.limit)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        for entry in entries:
+            place = index.describe(entry)
+            print(f"{place['display_name']}  ({place['lat']}, {place['lon']})")
+        print(f"{len(entries)} results in {elapsed_ms:.2f} ms", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+"""Geometry helpers for drawn AOIs (GeoJSON Polygon / MultiPolygon dicts).
+
+Several fields analysed together are a GeometryCollection of those.
+Coordinates are handled as (N, 2) lon/lat NumPy arrays throughout: bounds,
+area and centroid are computed over all vertices at once, and boundaries are
+simplified to the detail a map can show at a given zoom before they are sent
+to the browser.
+"""
+import numpy as np
+
+M_PER_DEG_LAT = 110540
+M_PER_DEG_LON = 111320  # at the equator; scaled by cos(latitude)
+MAP_TILE_PX = 256
+MAP_TOLERANCE_PX = 0.5
+
+
+def geometry_polygons(geometry):
+    """Every polygon of a Polygon, MultiPolygon or GeometryCollection as a list of (N, 2) ring arrays, outer ring first."""
+    if geometry['type'] == 'GeometryCollection':
+        return [polygon for member in geometry['geometries'] for polygon in geometry_polygons(member)]
+    if geometry['type'] == 'Polygon':
+        polygons = [geometry['coordinates']]
+    elif geometry['type'] == 'MultiPolygon':
+        polygons = geometry['coordinates']
+    else:
+        raise ValueError(f"unsupported geometry type: {geometry['type']}")
+    return [[np.asarray(ring, dtype=np.float64)[:, :2] for ring in polygon] for polygon in polygons]
+
+
+def geometry_rings(geometry):
+    """Returns every ring (outer and holes) of a Polygon or MultiPolygon as (N, 2) lon/lat arrays.
+
+    A GeometryCollection yields the rings of all its members, in order.
+    """
+    return [ring for polygon in geometry_polygons(geometry) for ring in polygon]
+
+
+def points_bounds(points):
+    """`[[min_lat, min_lon], [max_lat, max_lon]]` of an (N, 2) lon/lat array or list of pairs."""
+    points = np.asarray(points, dtype=np.float64)
+    # Per-column reductions: much faster than min(axis=0) over a two-column array.
+    lons, lats = points[:, 0], points[:, 1]
+    return [[float(lats.min()), float(lons.min())], [float(lats.max()), float(lons.max())]]
+
+
+def geometry_bounds(geometry):
+    """`[[min_lat, min_lon], [max_lat, max_lon]]` over every vertex of `geometry`."""
+    return points_bounds(np.concatenate(geometry_rings(geometry)))
+
+
+def area_centroid(geometry):
+    """Area in hectares and area-weighted `(lon, lat)` centroid of a geometry.
+
+    Rings are projected to local metres (equirectangular about the first
+    vertex) and the shoelace sums of every ring are taken in one pass, split
+    per ring with `np.add.reduceat`. Outer rings add and holes subtract
+    whichever way they are wound. A geometry with no area falls back to the
+    mean of its vertices.
+    """
+    polygons = geometry_polygons(geometry)
+    rings = [ring for polygon in polygons for ring in polygon]
+    is_hole = np.array([i > 0 for polygon in polygons for i in range(len(polygon))])
+    points = np.concatenate(rings)
+    lon0, lat0 = points[0]
+    scale = np.array([M_PER_DEG_LON * np.cos(np.radians(lat0)), M_PER_DEG_LAT])
+    xy = (points - (lon0, lat0)) * scale
+
+    lengths = np.array([len(ring) for ring in rings])
+    starts = np.cumsum(lengths) - lengths
+    # Next vertex within the same ring, wrapping to the ring's first vertex.
+    nxt = np.arange(len(xy)) + 1
+    nxt[starts + lengths - 1] = starts
+    x0, y0 = xy[:, 0], xy[:, 1]
+    x1, y1 = xy[nxt, 0], xy[nxt, 1]
+    cross = x0 * y1 - x1 * y0
+    signed = np.add.reduceat(cross, starts) / 2
+    cx = np.add.reduceat((x0 + x1) * cross, starts) / 6
+    cy = np.add.reduceat((y0 + y1) * cross, starts) / 6
+
+    # Orient each ring's contribution by its role rather than by its winding.
+    weight = np.where(is_hole, -1.0, 1.0) * np.sign(signed)
+    area = float(np.sum(weight * signed))
+    if area <= 0:
+        lon, lat = points.mean(axis=0)
+        return 0.0, (float(lon), float(lat))
+    centroid = np.array([np.sum(weight * cx), np.sum(weight * cy)]) / area / scale + (lon0, lat0)
+    return area / 10000, (float(centroid[0]), float(centroid[1]))
+
+
+def map_tolerance(zoom, latitude, pixels=MAP_TOLERANCE_PX):
+    """Distance in degrees covered by `pixels` screen pixels of a Web Mercator map at `zoom`."""
+    return pixels * 360.0 / (MAP_TILE_PX * 2 ** zoom) * np.cos(np.radians(latitude))
+
+
+def simplify_geometry(geometry, tolerance):
+    """Copy of a Polygon, MultiPolygon or GeometryCollection with every ring simplified to `tolerance` degrees."""
+    if geometry['type'] == 'GeometryCollection':
+        return {"type": "GeometryCollection",
+                "geometries": [simplify_geometry(member, tolerance) for member in geometry['geometries']]}
+    polygons = [[simplify_ring(ring, tolerance).tolist() for ring in polygon] for polygon in geometry_polygons(geometry)]
+    return {"type": geometry['type'], "coordinates": polygons[0] if geometry['type'] == 'Polygon' else polygons}
+
+
+def polygon_mask(geometry, bounds, shape):
+    """Boolean raster mask of the pixels whose centres fall inside `geometry`.
+
+    `bounds` is `[[min_lat, min_lon], [max_lat, max_lon]]` and row 0 is the
+    northern edge, matching the stress raster. Uses even-odd scanline filling:
+    every edge/row-centre crossing toggles the parity of all pixels to its
+    right, so holes and MultiPolygons need no special casing and the cost is
+    one pass over the crossings plus one cumulative sum over the grid.
+    Overlapping members of a GeometryCollection cancel out for the same
+    reason; use `fields.label_fields` for those.
+    """
+    (min_lat, min_lon), (max_lat, max_lon) = bounds
+    rows, cols = shape
+    px_w = (max_lon - min_lon) / cols
+    px_h = (max_lat - min_lat) / rows
+
+    x0s, y0s, x1s, y1s = [], [], [], []
+    for ring in geometry_rings(geometry):
+        x = (ring[:, 0] - min_lon) / px_w  # fractional column, pixel centres at j + 0.5
+        y = (max_lat - ring[:, 1]) / px_h  # fractional row
+        x0s.append(x)
+        y0s.append(y)
+        x1s.append(np.roll(x, -1))  # closes the ring whether or not it repeats its first vertex
+        y1s.append(np.roll(y, -1))
+    x0, y0, x1, y1 = (np.concatenate(a) for a in (x0s, y0s, x1s, y1s))
+
+    # Row centres i + 0.5 inside the half-open span [min(y0, y1), max(y0, y1)).
+    y_lo, y_hi = np.minimum(y0, y1), np.maximum(y0, y1)
+    start = np.clip(np.ceil(y_lo - 0.5), 0, rows).astype(np.int64)
+    stop = np.clip(np.ceil(y_hi - 0.5), 0, rows).astype(np.int64)
+    counts = np.maximum(stop - start, 0)
+
+    toggles = np.zeros((rows, cols + 1), dtype=np.uint8)
+    total = int(counts.sum())
+    if total:
+        edge = np.repeat(np.arange(counts.size), counts)
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        row = start[edge] + offsets
+        t = (row + 0.5 - y0[edge]) / (y1[edge] - y0[edge])
+        x_cross = x0[edge] + t * (x1[edge] - x0[edge])
+        # First pixel whose centre lies right of the crossing.
+        col = np.clip(np.floor(x_cross - 0.5).astype(np.int64) + 1, 0, cols)
+        np.add.at(toggles, (row, col), 1)
+
+    # uint8 wrap-around keeps parity, so the running sum never needs a wider type.
+    return (np.cumsum(toggles[:, :cols], axis=1, dtype=np.uint8) & 1).astype(bool)
+
+
+def simplify_line(points, tolerance):
+    """Douglas-Peucker simplification of an (N, 2) array; endpoints are always kept."""
+    points = np.asarray(points, dtype=np.float64)
+    n = len(points)
+    if n < 3 or tolerance <= 0:
+        return points
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start, end = points[first], points[last]
+        segment = points[first + 1:last]
+        dx, dy = end - start
+        norm = np.hypot(dx, dy)
+        if norm == 0:
+            dist = np.hypot(segment[:, 0] - start[0], segment[:, 1] - start[1])
+        else:
+            dist = np.abs(dx * (segment[:, 1] - start[1]) - dy * (segment[:, 0] - start[0])) / norm
+        i = int(np.argmax(dist))
+        if dist[i] > tolerance:
+            split = first + 1 + i
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return points[keep]
+
+
+def simplify_ring(ring, tolerance):
+    """Simplifies a closed ring, returning it closed; rings never drop below a triangle."""
+    ring = np.asarray(ring, dtype=np.float64)
+    if len(ring) > 1 and np.array_equal(ring[0], ring[-1]):
+        ring = ring[:-1]
+    if len(ring) <= 3:
+        return np.vstack([ring, ring[:1]])
+    # Split at the vertex farthest from the first so both halves have distinct endpoints.
+    far = int(np.argmax(np.hypot(*(ring - ring[0]).T)))
+    first_half = simplify_line(ring[:far + 1], tolerance)
+    second_half = simplify_line(np.vstack([ring[far:], ring[:1]]), tolerance)
+    simplified = np.vstack([first_half[:-1], second_half[:-1]])
+    if len(simplified) < 3:
+        simplified = ring[[0, far // 2, far]] if far >= 2 else ring[:3]
+    return np.vstack([simplified, simplified[:1]])
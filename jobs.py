@@ -0,0 +1,117 @@
+"""Background execution of long-running analyses.
+
+Jobs run on one worker pool shared by every Streamlit session in the
+process, so a slow analysis never holds a session's script thread: the
+session stores the job id, polls the job's stage and progress, and picks up
+the result when it is done. Cancellation is cooperative; the job function
+receives the `Job` and every `job.report(...)` call is a cancellation point.
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_WORKERS = int(os.environ.get("KRISHI_ANALYSIS_WORKERS", "4"))
+FINISHED_JOB_TTL = 15 * 60
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = 'queued', 'running', 'done', 'failed', 'cancelled'
+
+
+class JobCancelled(Exception):
+    """Raised inside a job at its next progress report after `cancel()`."""
+
+
+class Job:
+    def __init__(self, fn):
+        self.id = uuid.uuid4().hex
+        self.status = QUEUED
+        self.stage = "Waiting for a free worker"
+        self.progress = None
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self._fn = fn
+        self._cancel = threading.Event()
+        self._future = None
+
+    @property
+    def done(self):
+        return self.status in (DONE, FAILED, CANCELLED)
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    def report(self, stage, fraction=None):
+        """Progress callback for the job function; raises JobCancelled once cancelled."""
+        if self._cancel.is_set():
+            raise JobCancelled()
+        self.stage = stage
+        self.progress = fraction
+
+    def cancel(self):
+        """Requests cancellation; a queued job is dropped immediately."""
+        self._cancel.set()
+        if self._future is not None and self._future.cancel():
+            self._finish(CANCELLED)
+
+    def _run(self):
+        if self._cancel.is_set():
+            self._finish(CANCELLED)
+            return
+        self.status = RUNNING
+        try:
+            self.result = self._fn(self)
+        except JobCancelled:
+            self._finish(CANCELLED)
+        except Exception as exc:
+            self.error = exc
+            self._finish(FAILED)
+        else:
+            self._finish(DONE)
+
+    def _finish(self, status):
+        self.status = status
+        self.finished = time.time()
+
+
+class JobManager:
+    """Bounded worker pool plus a registry of jobs by id."""
+
+    def __init__(self, max_workers=MAX_WORKERS, finished_ttl=FINISHED_JOB_TTL):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="krishi-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.finished_ttl = finished_ttl
+
+    def submit(self, fn):
+        """Queues `fn(job)` and returns the new Job."""
+        job = Job(fn)
+        with self._lock:
+            self._purge()
+            self._jobs[job.id] = job
+        job._future = self._pool.submit(job._run)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def queue_position(self, job):
+        """How many queued jobs were submitted before this one (0 when running or done)."""
+        if job.status != QUEUED:
+            return 0
+        with self._lock:
+            return sum(1 for other in self._jobs.values() if other.status == QUEUED and other.created < job.created)
+
+    def _purge(self):
+        now = time.time()
+        expired = [jid for jid, job in self._jobs.items() if job.done and now - job.finished > self.finished_ttl]
+        for jid in expired:
+            del self._jobs[jid]
+
+
+# Shared by every session in this server process.
+ANALYSIS_JOBS = JobManager()
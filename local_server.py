@@ -0,0 +1,107 @@
+"""Small background HTTP server for assets the browser fetches directly.
+
+Streamlit only serves its own script output, so anything Leaflet or the map
+widgets request by URL (overlay tiles, proxied basemaps, search results) is
+served from here. Modules register a handler for a path prefix and the server
+is started lazily, once per process, the first time a URL is handed out.
+"""
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+HOST = os.environ.get("KRISHI_LOCAL_HOST", "127.0.0.1")
+PORT = int(os.environ.get("KRISHI_LOCAL_PORT", "8502"))
+# URL the *browser* uses to reach the server; differs from HOST/PORT behind a proxy.
+PUBLIC_URL = os.environ.get("KRISHI_LOCAL_URL", "").rstrip("/")
+
+_routes = {}
+_server = None
+_start_error = None  # set when the server could not be bound; binding is not retried
+_lock = threading.Lock()
+
+
+def register_route(prefix, handler):
+    """Registers `handler(path_parts, query)` for URLs under `/<prefix>/`.
+
+    The handler returns `(status, content_type, body)` or
+    `(status, content_type, body, headers)`.
+    """
+    _routes[prefix.strip("/")] = handler
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        handler = _routes.get(parts[0]) if parts else None
+        if handler is None:
+            self._reply(404, "text/plain", b"not found")
+            return
+        try:
+            result = handler(parts[1:], parse_qs(url.query))
+        except Exception as exc:  # never let one bad request kill the thread
+            self._reply(500, "text/plain", str(exc).encode("utf-8"))
+            return
+        self._reply(*result)
+
+    def _reply(self, status, content_type, body, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Access-Control-Allow-Origin", "*")
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _bind(port):
+    server = ThreadingHTTPServer((HOST, port), _Handler)
+    server.daemon_threads = True
+    return server
+
+
+def ensure_server():
+    """Starts the shared server thread if it is not running yet; returns the server, or None.
+
+    When PORT is taken (another dashboard process, or a leftover one) the
+    server falls back to a free port, and `public_url` follows it unless
+    KRISHI_LOCAL_URL pins the URL. Binding is attempted once per process: if
+    the fallback fails too, this returns None from then on and
+    `start_error()` says why.
+    """
+    global _server, _start_error
+    with _lock:
+        if _server is None and _start_error is None:
+            try:
+                _server = _bind(PORT)
+            except OSError as exc:
+                try:
+                    _server = _bind(0)
+                except OSError as fallback_exc:
+                    _start_error = f"cannot listen on {HOST}:{PORT} ({exc}) or on a free port ({fallback_exc})"
+                    return None
+                if PUBLIC_URL:
+                    print(f"local server: port {PORT} is taken ({exc}); listening on "
+                          f"{_server.server_address[1]}, which KRISHI_LOCAL_URL={PUBLIC_URL} may not reach",
+                          file=sys.stderr)
+            threading.Thread(target=_server.serve_forever, name="krishi-local-server", daemon=True).start()
+    return _server
+
+
+def start_error():
+    """Why the server could not be started, or None."""
+    return _start_error
+
+
+def public_url(path):
+    """Returns the browser-facing URL for `path`, starting the server if needed."""
+    server = ensure_server()
+    port = server.server_address[1] if server is not None else PORT
+    base = PUBLIC_URL or f"http://localhost:{port}"
+    return f"{base}/{path.lstrip('/')}"
@@ -0,0 +1,175 @@
+"""Chunked NDVI computation and stress classification over memory-mapped bands.
+
+Red (Sentinel-2 B04) and NIR (B08) rasters are opened as memory maps and
+processed in fixed-size row strips, so only one strip of each band is ever
+resident. Every pixel is classified into the dashboard's Healthy / Stressed /
+Severe classes; pixels without a valid NDVI are NODATA.
+"""
+import os
+
+import numpy as np
+
+HEALTHY, STRESSED, SEVERE = 0, 1, 2
+NODATA = 255
+CLASS_NAMES = ['Healthy', 'Stressed', 'Severe']
+
+# NDVI >= healthy_min is Healthy, NDVI < severe_max is Severe, Stressed in between.
+DEFAULT_THRESHOLDS = {"healthy_min": 0.5, "severe_max": 0.3}
+CHUNK_ROWS = 512
+
+
+def open_band(path, shape=None, dtype=np.uint16):
+    """Memory-maps a band read-only: `.npy` files carry their own shape, raw files need `shape`."""
+    if path.endswith(".npy"):
+        return np.load(path, mmap_mode='r')
+    if shape is None:
+        raise ValueError(f"shape is required for raw band file {path}")
+    return np.memmap(path, dtype=dtype, mode='r', shape=shape)
+
+
+def iter_chunks(n_rows, chunk_rows=CHUNK_ROWS):
+    """Yields row slices covering `n_rows` in strips of `chunk_rows`."""
+    for start in range(0, n_rows, chunk_rows):
+        yield slice(start, min(start + chunk_rows, n_rows))
+
+
+def compute_ndvi(red, nir):
+    """NDVI for one block as float32; zero-reflectance pixels become NaN."""
+    red = np.asarray(red, dtype=np.float32)
+    nir = np.asarray(nir, dtype=np.float32)
+    num = nir - red
+    den = nir + red
+    ndvi = np.full(num.shape, np.nan, dtype=np.float32)
+    np.divide(num, den, out=ndvi, where=den != 0)
+    return ndvi
+
+
+def classify_ndvi(ndvi, thresholds=DEFAULT_THRESHOLDS, out=None):
+    """Maps NDVI values to class codes (uint8) using two threshold comparisons."""
+    if out is None:
+        out = np.empty(ndvi.shape, dtype=np.uint8)
+    np.less(ndvi, thresholds["healthy_min"], out=out, casting='unsafe')
+    out += ndvi < thresholds["severe_max"]
+    out[np.isnan(ndvi)] = NODATA
+    return out
+
+
+def classify_scene(red, nir, thresholds=DEFAULT_THRESHOLDS, chunk_rows=CHUNK_ROWS, out=None, mask=None, progress=None):
+    """Classifies a whole scene strip by strip.
+
+    `red` and `nir` are 2-D arrays or memory maps of equal shape. `out` may be
+    a preallocated uint8 array or memmap (e.g. for scenes larger than RAM).
+    With a boolean `mask` (see `geometry.polygon_mask`) only pixels inside it
+    are computed, strips with no masked pixel are never read, and everything
+    outside is NODATA. `progress(done, total)` is called after every strip.
+    """
+    if red.shape != nir.shape:
+        raise ValueError(f"band shapes differ: {red.shape} vs {nir.shape}")
+    if mask is not None and mask.shape != red.shape:
+        raise ValueError(f"mask shape {mask.shape} does not match bands {red.shape}")
+    if out is None:
+        out = np.empty(red.shape, dtype=np.uint8)
+
+    chunks = list(iter_chunks(red.shape[0], chunk_rows))
+    for done, rows in enumerate(chunks, start=1):
+        if mask is None:
+            classify_ndvi(compute_ndvi(red[rows], nir[rows]), thresholds, out=out[rows])
+        else:
+            block_mask = mask[rows]
+            out_block = out[rows]
+            out_block[...] = NODATA
+            if block_mask.any():
+                ndvi = compute_ndvi(red[rows][block_mask], nir[rows][block_mask])
+                out_block[block_mask] = classify_ndvi(ndvi, thresholds)
+        if progress is not None:
+            progress(done, len(chunks))
+    return out
+
+
+def classify_band_files(red_path, nir_path, thresholds=DEFAULT_THRESHOLDS, chunk_rows=CHUNK_ROWS,
+                        out_path=None, mask=None, progress=None):
+    """Runs `classify_scene` on band files; writes the class raster to `out_path` if given."""
+    red = open_band(red_path)
+    nir = open_band(nir_path)
+    out = None
+    if out_path is not None:
+        out = np.lib.format.open_memmap(out_path, mode='w+', dtype=np.uint8, shape=red.shape)
+    return classify_scene(red, nir, thresholds, chunk_rows, out=out, mask=mask, progress=progress)
+
+
+def class_counts(stress_array):
+    """Pixel count per class in one bincount pass; NODATA pixels are ignored."""
+    counts = np.bincount(np.asarray(stress_array, dtype=np.uint8).ravel(), minlength=NODATA + 1)
+    return counts[:len(CLASS_NAMES)]
+
+
+def health_distribution(stress_array):
+    """Percentage of in-field pixels per class, keyed like the dashboard's pie chart."""
+    counts = class_counts(stress_array)
+    total = counts.sum()
+    if total == 0:
+        return {name: 0.0 for name in CLASS_NAMES}
+    return {name: round(float(100.0 * count / total), 1) for name, count in zip(CLASS_NAMES, counts)}
+
+
+def pack_classes(stress_array):
+    """Packs a class raster four pixels per byte (2 bits each; NODATA is stored as 3)."""
+    codes = np.minimum(np.asarray(stress_array, dtype=np.uint8).ravel(), 3)
+    codes = np.concatenate([codes, np.zeros(-codes.size % 4, dtype=np.uint8)]).reshape(-1, 4)
+    return codes[:, 0] | (codes[:, 1] << 2) | (codes[:, 2] << 4) | (codes[:, 3] << 6)
+
+
+def unpack_classes(packed, shape):
+    """Inverse of `pack_classes`: a uint8 class raster of `shape` with NODATA restored."""
+    codes = np.empty((packed.size, 4), dtype=np.uint8)
+    for k in range(4):
+        np.bitwise_and(packed >> (2 * k), 3, out=codes[:, k])
+    stress_array = codes.ravel()[:int(np.prod(shape))].reshape(shape)
+    stress_array[stress_array == 3] = NODATA
+    return stress_array
+
+
+def _bilinear(grid, gy, gx):
+    """Samples `grid` at fractional row positions `gy` x column positions `gx`."""
+    y0, x0 = gy.astype(np.int64), gx.astype(np.int64)
+    fy, fx = (gy - y0)[:, None], (gx - x0)[None, :]
+    return ((1 - fy) * ((1 - fx) * grid[np.ix_(y0, x0)] + fx * grid[np.ix_(y0, x0 + 1)])
+            + fy * ((1 - fx) * grid[np.ix_(y0 + 1, x0)] + fx * grid[np.ix_(y0 + 1, x0 + 1)]))
+
+
+def synthesize_bands(directory, shape, class_probs, seed=None, chunk_rows=CHUNK_ROWS, patch_px=8):
+    """Writes mock B04/B08 reflectance rasters (uint16, x10000) standing in for a satellite fetch.
+
+    Classes follow a smooth random field (features roughly `patch_px` wide),
+    so stress shows up in contiguous patches like real imagery, and pixels get
+    NDVI values inside their class's default threshold band so the engine
+    reproduces the requested class mix.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    red_path = os.path.join(directory, "B04.npy")
+    nir_path = os.path.join(directory, "B08.npy")
+    red = np.lib.format.open_memmap(red_path, mode='w+', dtype=np.uint16, shape=shape)
+    nir = np.lib.format.open_memmap(nir_path, mode='w+', dtype=np.uint16, shape=shape)
+
+    coarse = rng.random((shape[0] // patch_px + 2, shape[1] // patch_px + 2))
+    # Class cut-offs from a regular sample of the interpolated field, not the coarse grid,
+    # since interpolation narrows the value distribution.
+    sample = _bilinear(coarse, np.linspace(0, shape[0] - 1, 256) / patch_px, np.linspace(0, shape[1] - 1, 256) / patch_px)
+    cuts = np.quantile(sample, np.cumsum(class_probs)[:-1])
+    gx = np.arange(shape[1]) / patch_px
+
+    ndvi_ranges = np.array([[0.55, 0.85], [0.32, 0.48], [0.05, 0.28]], dtype=np.float32)
+    for rows in iter_chunks(shape[0], chunk_rows):
+        block_shape = (rows.stop - rows.start, shape[1])
+        field = _bilinear(coarse, np.arange(rows.start, rows.stop) / patch_px, gx)
+        classes = np.digitize(field, cuts)
+        low, high = ndvi_ranges[classes, 0], ndvi_ranges[classes, 1]
+        ndvi = low + (high - low) * rng.random(block_shape, dtype=np.float32)
+        nir_refl = rng.uniform(0.25, 0.45, block_shape).astype(np.float32)
+        red_refl = nir_refl * (1 - ndvi) / (1 + ndvi)
+        nir[rows] = np.round(nir_refl * 10000)
+        red[rows] = np.round(red_refl * 10000)
+    red.flush()
+    nir.flush()
+    return red_path, nir_path
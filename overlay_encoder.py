@@ -0,0 +1,185 @@
+"""Compact image encoding for class rasters (healthy / stressed / severe).
+
+A class raster already is a palette image: one small integer per pixel. The
+encoder writes it straight into a Pillow "P" image with a 4-entry palette and
+a transparency table (NODATA is the transparent entry), which Pillow stores
+as a 2-bit PNG, instead of expanding it to 4-byte RGBA first. PNG compression
+level and lossless WebP are selectable, and encoded bytes are cached by a
+hash of the raster and the options, so identical tiles (uniform field
+interiors, the blank tile) are encoded once.
+
+`encoding_report` measures encode time, peak memory and payload size of each
+option on a given raster:
+
+    python overlay_encoder.py [size]
+"""
+import hashlib
+import io
+import sys
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+from ndvi_engine import NODATA
+
+FORMATS = ("png", "webp")
+DEFAULT_COMPRESS_LEVEL = 6
+CACHE_MAX_BYTES = 32 * 1024 * 1024
+MIME_TYPES = {"png": "image/png", "webp": "image/webp"}
+
+# Options compared by `encoding_report`: the RGBA baseline, then palette PNG at
+# fast / default / smallest compression, then lossless WebP.
+REPORT_OPTIONS = [
+    ("png-rgba", {}),
+    ("png", {"compress_level": 1}),
+    ("png", {"compress_level": 6}),
+    ("png", {"compress_level": 9}),
+    ("webp", {}),
+]
+
+
+def _index_lut(n_classes):
+    # Classes keep their index; NODATA and anything unexpected map to the transparent entry.
+    lut = np.full(256, n_classes, dtype=np.uint8)
+    lut[:n_classes] = np.arange(n_classes, dtype=np.uint8)
+    return lut
+
+
+def palette_image(classes, colormap):
+    """"P" image of a uint8 class raster; `colormap` is (n_classes, 4) RGBA, NODATA is transparent."""
+    colormap = np.asarray(colormap, dtype=np.uint8)
+    n_classes = len(colormap)
+    indices = _index_lut(n_classes)[np.asarray(classes, dtype=np.uint8)]
+    image = Image.fromarray(indices)
+    image.putpalette(np.vstack([colormap[:, :3], [[0, 0, 0]]]).ravel().tolist())
+    image.info["transparency"] = bytes(colormap[:, 3].tolist() + [0])
+    return image
+
+
+def rgba_image(classes, colormap):
+    """Full RGBA expansion of a class raster (the original overlay path, kept for comparison)."""
+    classes = np.asarray(classes, dtype=np.uint8)
+    rgba = np.zeros(classes.shape + (4,), dtype=np.uint8)
+    valid = classes != NODATA
+    rgba[valid] = np.asarray(colormap, dtype=np.uint8)[classes[valid]]
+    return Image.fromarray(rgba)
+
+
+def _encode(classes, colormap, fmt, compress_level):
+    buffer = io.BytesIO()
+    if fmt == "png-rgba":
+        rgba_image(classes, colormap).save(buffer, format="PNG", compress_level=compress_level)
+    elif fmt == "png":
+        palette_image(classes, colormap).save(buffer, format="PNG", compress_level=compress_level)
+    elif fmt == "webp":
+        # WebP has no palette mode; lossless encoding finds the palette itself.
+        palette_image(classes, colormap).convert("RGBA").save(buffer, format="WEBP", lossless=True, quality=100)
+    else:
+        raise ValueError(f"unknown overlay format: {fmt!r}")
+    return buffer.getvalue()
+
+
+class EncodedImageCache:
+    """LRU of encoded bytes keyed by raster content and encoder options, bounded by total size."""
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    @staticmethod
+    def key(classes, colormap, fmt, compress_level):
+        classes = np.ascontiguousarray(classes, dtype=np.uint8)
+        h = hashlib.sha1(f"{fmt}|{compress_level}|{classes.shape}".encode())
+        h.update(np.asarray(colormap, dtype=np.uint8).tobytes())
+        h.update(classes.tobytes())
+        return h.digest()
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = data
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes and self._entries:
+                _, old = self._entries.popitem(last=False)
+                self._bytes -= len(old)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+def encode_classes(classes, colormap, fmt="png", compress_level=DEFAULT_COMPRESS_LEVEL, cache=None):
+    """Encodes a class raster as `fmt` ("png", "webp" or the "png-rgba" baseline); returns bytes.
+
+    Results are looked up in and stored to `cache` (the shared
+    ENCODED_IMAGES by default; pass False to bypass it).
+    """
+    if cache is None:
+        cache = ENCODED_IMAGES
+    if not cache:
+        return _encode(classes, colormap, fmt, compress_level)
+    key = cache.key(classes, colormap, fmt, compress_level)
+    data = cache.get(key)
+    if data is None:
+        data = _encode(classes, colormap, fmt, compress_level)
+        cache.put(key, data)
+    return data
+
+
+def encoding_report(classes, colormap, options=REPORT_OPTIONS, repeat=3):
+    """Encode time (best of `repeat`), Python-side peak memory and size for each option, uncached."""
+    report = []
+    for fmt, kwargs in options:
+        compress_level = kwargs.get("compress_level", DEFAULT_COMPRESS_LEVEL)
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            data = _encode(classes, colormap, fmt, compress_level)
+            best = min(best, time.perf_counter() - start)
+        tracemalloc.start()
+        _encode(classes, colormap, fmt, compress_level)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        label = fmt if fmt == "webp" else f"{fmt} (level {compress_level})"
+        report.append({"option": label, "seconds": best, "peak_bytes": peak, "size_bytes": len(data)})
+    return report
+
+
+# Shared by every session in this server process.
+ENCODED_IMAGES = EncodedImageCache()
+
+
+if __name__ == "__main__":
+    from ndvi_engine import DEFAULT_THRESHOLDS, classify_ndvi
+    from tiling import COLORMAP
+
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 1024
+    rng = np.random.default_rng(0)
+    # Smooth NDVI field so the classes form patches, like a real scene.
+    coarse = rng.uniform(0.1, 0.8, (size // 32 + 2, size // 32 + 2))
+    ndvi = np.kron(coarse, np.ones((32, 32)))[:size, :size] + rng.normal(0, 0.03, (size, size))
+    classes = classify_ndvi(ndvi, DEFAULT_THRESHOLDS)
+    classes[:, : size // 8] = NODATA
+    print(f"{size}x{size} class raster")
+    print(f"{'option':<22}{'ms':>9}{'peak KiB':>11}{'KiB':>9}")
+    for row in encoding_report(classes, COLORMAP):
+        print(f"{row['option']:<22}{row['seconds'] * 1000:>9.1f}{row['peak_bytes'] / 1024:>11.0f}{row['size_bytes'] / 1024:>9.1f}")
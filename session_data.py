@@ -0,0 +1,176 @@
+"""Process-wide store for the analysis results that sessions are viewing.
+
+A session keeps only the result's cache key in `st.session_state`; the
+result itself is held here once, however many sessions view the same AOI
+and dates, and is reference counted by session. A result that no session
+has looked at for `idle_seconds` has its heavy arrays spilled to disk,
+compactly (class raster 2 bits per pixel, declining mask 1 bit per pixel;
+the NDVI map stays float32 so zonal stats and rates match after a reload),
+and they are reloaded the next time a session asks for it. Results with no
+sessions left are dropped; sessions that disappear without releasing
+(closed tabs) are expired after `session_ttl`.
+"""
+import os
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from ndvi_engine import NODATA, pack_classes, unpack_classes
+
+SPILL_DIR = os.environ.get(
+    "KRISHI_SESSION_SPILL", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".krishi_cache", "sessions")
+)
+IDLE_SECONDS = 10 * 60
+SESSION_TTL = 2 * 3600
+HEAVY_KEYS = ("stress_map_array", "ndvi_forecast_cube", "declining_mask", "ndvi_map_array")
+
+
+def spill_result(result, path):
+    """Writes the heavy arrays of `result` to an .npz file in their compact form."""
+    stress = result['stress_map_array']
+    declining = np.ma.filled(result['declining_mask'], False)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp.npz"
+    np.savez(
+        tmp_path,
+        stress_packed=pack_classes(stress), shape=np.array(stress.shape),
+        declining_bits=np.packbits(declining.ravel()),
+        forecast_cube=result['ndvi_forecast_cube'],
+        ndvi_map=result['ndvi_map_array'],
+    )
+    os.replace(tmp_path, path)
+
+
+def load_spilled(path):
+    """Heavy arrays from `spill_result`, expanded back to the shapes the dashboard uses."""
+    with np.load(path) as spilled:
+        shape = tuple(spilled['shape'])
+        stress = unpack_classes(spilled['stress_packed'], shape)
+        declining = np.unpackbits(spilled['declining_bits'], count=stress.size).astype(bool).reshape(shape)
+        cube = spilled['forecast_cube']
+        ndvi_map = spilled['ndvi_map']
+    return {
+        "stress_map_array": stress,
+        "ndvi_forecast_cube": cube,
+        "declining_mask": np.ma.masked_array(declining, mask=stress == NODATA),
+        "ndvi_map_array": ndvi_map,
+    }
+
+
+class SessionResults:
+    """Reference-counted results shared by sessions, with idle spill to disk."""
+
+    def __init__(self, spill_dir=SPILL_DIR, idle_seconds=IDLE_SECONDS, session_ttl=SESSION_TTL):
+        self.spill_dir = spill_dir
+        self.idle_seconds = idle_seconds
+        self.session_ttl = session_ttl
+        self._entries = {}   # key -> {"result", "sessions", "last_access", "spill"}
+        self._sessions = {}  # session id -> (key, last seen)
+        self._lock = threading.Lock()
+
+    def attach(self, session_id, key, result):
+        """Points `session_id` at `result` (stored under `key`, shared if already present); returns `key`."""
+        with self._lock:
+            self._detach(session_id)
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = {"result": dict(result), "sessions": set(), "spill": None}
+            elif entry['spill'] is not None:
+                # A fresh copy of the same result: no need to reload the spilled one.
+                entry['result'] = dict(result)
+                self._drop_spill(entry)
+            entry['sessions'].add(session_id)
+            entry['last_access'] = time.time()
+            self._sessions[session_id] = (key, time.time())
+        self.evict_idle()
+        return key
+
+    def get(self, session_id, key):
+        """The result `session_id` is viewing, reloaded from disk if it was spilled; None if unknown."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._sessions.get(session_id, (key,))[0] != key:
+                self._detach(session_id)
+            if entry['spill'] is not None:
+                entry['result'] = dict(entry['result'], **load_spilled(entry['spill']))
+                self._drop_spill(entry)
+            entry['sessions'].add(session_id)
+            entry['last_access'] = now = time.time()
+            self._sessions[session_id] = (key, now)
+            result = entry['result']
+        self.evict_idle()
+        return result
+
+    def release(self, session_id):
+        """The session no longer views a result; drops the result when it was the last one."""
+        with self._lock:
+            self._detach(session_id)
+
+    def evict_idle(self, now=None):
+        """Expires vanished sessions and spills results nobody has viewed for `idle_seconds`."""
+        now = time.time() if now is None else now
+        idle = []
+        with self._lock:
+            for session_id, (_, seen) in list(self._sessions.items()):
+                if now - seen > self.session_ttl:
+                    self._detach(session_id)
+            for key, entry in self._entries.items():
+                idle_for = now - entry['last_access']
+                if entry['spill'] is None and not entry.get('spilling') and idle_for > self.idle_seconds:
+                    entry['spilling'] = True
+                    idle.append((key, entry, entry['result'], entry['last_access']))
+        # The writes happen outside the lock so other sessions are not held up by the disk.
+        for key, entry, result, last_access in idle:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            path = os.path.join(self.spill_dir, f"{key}-{uuid.uuid4().hex[:8]}.npz")
+            spill_result(result, path)
+            with self._lock:
+                entry['spilling'] = False
+                if (self._entries.get(key) is entry and entry['result'] is result
+                        and entry['last_access'] == last_access):
+                    # New dict rather than popping keys: a session may still hold the old one.
+                    entry['result'] = {k: v for k, v in result.items() if k not in HEAVY_KEYS}
+                    entry['spill'] = path
+                    continue
+            # Viewed, replaced or dropped while it was being written: the file is stale.
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            resident = [e for e in self._entries.values() if e['spill'] is None]
+            return {
+                "results": len(self._entries),
+                "resident": len(resident),
+                "spilled": len(self._entries) - len(resident),
+                "sessions": len(self._sessions),
+                "resident_bytes": sum(e['result'][name].nbytes for e in resident for name in HEAVY_KEYS),
+            }
+
+    def _detach(self, session_id):
+        key, _ = self._sessions.pop(session_id, (None, None))
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        entry['sessions'].discard(session_id)
+        if not entry['sessions']:
+            self._drop_spill(entry)
+            del self._entries[key]
+
+    @staticmethod
+    def _drop_spill(entry):
+        if entry['spill'] is not None:
+            try:
+                os.remove(entry['spill'])
+            except OSError:
+                pass
+            entry['spill'] = None
+
+
+# Shared by every session in this server process.
+SESSION_RESULTS = SessionResults()
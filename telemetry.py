@@ -0,0 +1,238 @@
+"""Lightweight stage timing for the analysis and render pipeline.
+
+Code marks a stage with `with span("classification"):` or the `@timed(...)`
+decorator. Every finished span is added to a per-stage latency histogram,
+served in Prometheus text format at `/metrics` on the local server, and
+appended as one JSON object per line to a span log
+(KRISHI_METRICS_LOG; set it to an empty string to turn the log off). Log
+lines are buffered and written by one background thread about once a
+second; the log rolls over to `<log>.1` once it passes
+KRISHI_METRICS_LOG_MAX_MB.
+
+Whole Streamlit reruns are timed with `begin_rerun()` / `end_rerun()`. When
+KRISHI_PROFILE_SLOW_MS is set, each rerun is also sampled by a small
+stack-sampling profiler, and reruns slower than that threshold leave a
+folded-stack file (flamegraph.pl / speedscope input) in KRISHI_PROFILE_DIR.
+"""
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import local_server
+
+_CACHE_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".krishi_cache")
+SPAN_LOG = os.environ.get("KRISHI_METRICS_LOG", os.path.join(_CACHE_ROOT, "metrics", "spans.jsonl"))
+SPAN_LOG_MAX_BYTES = int(float(os.environ.get("KRISHI_METRICS_LOG_MAX_MB", "16")) * 1024 * 1024)
+SPAN_LOG_FLUSH_SECONDS = 1.0
+PROFILE_DIR = os.environ.get("KRISHI_PROFILE_DIR", os.path.join(_CACHE_ROOT, "profiles"))
+PROFILE_SLOW_MS = float(os.environ.get("KRISHI_PROFILE_SLOW_MS", "0"))  # 0 = profiler off
+PROFILE_INTERVAL = 0.005
+PROFILE_MAX_SECONDS = 120
+# Upper bounds (seconds) of the histogram buckets; +Inf is implicit.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram, Prometheus style."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        i = 0
+        while i < len(self.buckets) and seconds > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.total += seconds
+        self.count += 1
+
+
+class SpanRecorder:
+    """Aggregates finished spans into histograms and appends them to the span log."""
+
+    def __init__(self, log_path=SPAN_LOG, max_bytes=SPAN_LOG_MAX_BYTES, flush_seconds=SPAN_LOG_FLUSH_SECONDS):
+        self.log_path = log_path
+        self.max_bytes = max_bytes
+        self.flush_seconds = flush_seconds
+        self._histograms = {}
+        self._pending = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._writer = None
+
+    def record(self, stage, seconds, **attrs):
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram()
+            histogram.observe(seconds)
+            if self.log_path:
+                self._pending.append(dict(attrs, ts=round(time.time(), 3), stage=stage, seconds=round(seconds, 6),
+                                          pid=os.getpid(), thread=threading.current_thread().name))
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write_loop, name="krishi-span-log", daemon=True)
+                    self._writer.start()
+
+    def flush(self):
+        """Writes the buffered spans to the log, rolling it over to `<log>.1` once it passes `max_bytes`."""
+        with self._write_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            if not pending:
+                return
+            try:
+                os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+                if self.max_bytes and os.path.exists(self.log_path) and os.path.getsize(self.log_path) >= self.max_bytes:
+                    os.replace(self.log_path, self.log_path + ".1")
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.writelines(json.dumps(record, default=str) + "\n" for record in pending)
+            except OSError:
+                pass  # metrics must never break the app
+
+    def _write_loop(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            self.flush()
+
+    def summary(self):
+        """{stage: (count, total_seconds)} of everything recorded so far."""
+        with self._lock:
+            return {stage: (h.count, h.total) for stage, h in self._histograms.items()}
+
+    def prometheus_text(self):
+        lines = [
+            "# HELP krishi_stage_seconds Duration of instrumented pipeline stages.",
+            "# TYPE krishi_stage_seconds histogram",
+        ]
+        with self._lock:
+            for stage, h in sorted(self._histograms.items()):
+                label = stage.replace("\\", "\\\\").replace('"', '\\"')
+                cumulative = 0
+                for bound, n in zip(list(h.buckets) + ["+Inf"], h.counts):
+                    cumulative += n
+                    lines.append(f'krishi_stage_seconds_bucket{{stage="{label}",le="{bound}"}} {cumulative}')
+                lines.append(f'krishi_stage_seconds_sum{{stage="{label}"}} {h.total:.6f}')
+                lines.append(f'krishi_stage_seconds_count{{stage="{label}"}} {h.count}')
+        return "\n".join(lines) + "\n"
+
+
+@contextmanager
+def span(stage, recorder=None, **attrs):
+    """Times the enclosed block as `stage`; spans raising an exception are recorded with `error`."""
+    recorder = recorder or SPANS
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException as exc:
+        recorder.record(stage, time.perf_counter() - start, error=type(exc).__name__, **attrs)
+        raise
+    recorder.record(stage, time.perf_counter() - start, **attrs)
+
+
+def timed(stage):
+    """Decorator form of `span`."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class SamplingProfiler:
+    """Samples one thread's Python stack every `interval` seconds from a helper thread."""
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL, max_seconds=PROFILE_MAX_SECONDS):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name="krishi-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _sample(self):
+        deadline = time.monotonic() + self.max_seconds
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                return  # the profiled thread has finished
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+
+
+def write_folded(stacks, path):
+    """Writes stacks in the folded format read by flamegraph.pl and speedscope."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+
+
+_active_reruns = {}
+_active_lock = threading.Lock()
+
+
+def begin_rerun(name="app.rerun"):
+    """Starts timing a script run on this thread; returns the handle for `end_rerun`."""
+    thread_id = threading.get_ident()
+    handle = {"name": name, "start": time.perf_counter(), "profiler": None}
+    if PROFILE_SLOW_MS > 0:
+        handle["profiler"] = SamplingProfiler(thread_id).start()
+    with _active_lock:
+        # A run interrupted by st.rerun()/st.stop() never reached end_rerun; drop its profiler.
+        stale = _active_reruns.pop(thread_id, None)
+        _active_reruns[thread_id] = handle
+    if stale is not None and stale["profiler"] is not None:
+        stale["profiler"].stop()
+    return handle
+
+
+def end_rerun(handle, recorder=None):
+    """Records the run's span and, if it was slower than the threshold, its flame graph stacks."""
+    seconds = time.perf_counter() - handle["start"]
+    with _active_lock:
+        if _active_reruns.get(threading.get_ident()) is handle:
+            del _active_reruns[threading.get_ident()]
+    profile = None
+    if handle["profiler"] is not None:
+        stacks = handle["profiler"].stop()
+        if seconds * 1000 >= PROFILE_SLOW_MS and stacks:
+            profile = os.path.join(PROFILE_DIR, f"{handle['name']}-{time.strftime('%Y%m%d-%H%M%S')}-{seconds * 1000:.0f}ms.folded")
+            write_folded(stacks, profile)
+    (recorder or SPANS).record(handle["name"], seconds, **({"profile": profile} if profile else {}))
+    return seconds
+
+
+def _serve_metrics(parts, query):
+    """Handles /metrics in the Prometheus text exposition format."""
+    return 200, "text/plain; version=0.0.4; charset=utf-8", SPANS.prometheus_text().encode("utf-8")
+
+
+# Shared by every session in this server process.
+SPANS = SpanRecorder()
+atexit.register(SPANS.flush)
+
+local_server.register_route("metrics", _serve_metrics)
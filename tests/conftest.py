@@ -0,0 +1,7 @@
+"""Runs the tests against the flat modules in the repository root, with every cache in scratch space."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import benchmarks.scratch  # noqa: E402,F401  (must come before any app module is imported)
@@ -0,0 +1,48 @@
+import threading
+import time
+from datetime import date
+
+import numpy as np
+import pytest
+
+from analysis_cache import AnalysisCache, aoi_cache_key
+
+DATE_RANGE = (date(2024, 1, 1), date(2024, 1, 31))
+AOI = {"type": "Polygon", "coordinates": [[[73.1, 22.3], [73.2, 22.3], [73.2, 22.4], [73.1, 22.4], [73.1, 22.3]]]}
+
+
+def test_redrawn_field_shares_the_key():
+    redrawn = {"type": "Polygon", "coordinates": [[[73.2, 22.4], [73.2, 22.3], [73.1, 22.3], [73.1, 22.4]]]}
+    assert aoi_cache_key(redrawn, DATE_RANGE) == aoi_cache_key(AOI, DATE_RANGE)
+
+
+def test_concurrent_misses_compute_once(tmp_path):
+    cache = AnalysisCache(str(tmp_path))
+    calls = []
+
+    def compute(aoi, date_range):
+        calls.append(threading.get_ident())
+        time.sleep(0.2)
+        return {"ndvi": np.ones(4)}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute(AOI, DATE_RANGE, compute)))
+               for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert len(results) == 4 and all(r is results[0] for r in results)
+    assert not cache._inflight
+
+
+def test_failed_compute_is_retried(tmp_path):
+    cache = AnalysisCache(str(tmp_path))
+
+    def fail(aoi, date_range):
+        raise RuntimeError("upstream down")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute(AOI, DATE_RANGE, fail)
+    assert cache.get_or_compute(AOI, DATE_RANGE, lambda aoi, dr: {"ok": True}) == {"ok": True}
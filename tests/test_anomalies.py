@@ -0,0 +1,50 @@
+import numpy as np
+
+from anomalies import detect_stress_regions, label_regions
+from ndvi_engine import HEALTHY, NODATA, SEVERE, STRESSED
+
+BOUNDS = [[22.0, 73.0], [22.01, 73.01]]
+
+
+def test_label_regions_is_4_connected():
+    mask = np.array([
+        [1, 1, 0, 0],
+        [0, 1, 0, 1],
+        [0, 0, 1, 1],
+        [1, 0, 0, 0],
+    ], dtype=bool)
+    labels, n = label_regions(mask)
+    assert n == 3
+    assert (labels > 0).sum() == mask.sum()
+    assert len({labels[0, 0], labels[0, 1], labels[1, 1]}) == 1
+    assert len({labels[1, 3], labels[2, 2], labels[2, 3]}) == 1
+    assert len({labels[0, 0], labels[2, 2], labels[3, 0]}) == 3
+
+
+def test_label_regions_u_shape_merges():
+    mask = np.zeros((5, 5), dtype=bool)
+    mask[:, 0] = mask[:, 4] = mask[4, :] = True
+    labels, n = label_regions(mask)
+    assert n == 1
+    assert np.array_equal(labels > 0, mask)
+
+
+def test_detect_stress_regions_largest_first():
+    stress = np.full((60, 60), HEALTHY, dtype=np.uint8)
+    stress[5:15, 5:15] = STRESSED    # 100 px
+    stress[5:10, 5:10] = SEVERE
+    stress[30:50, 30:50] = SEVERE    # 400 px
+    stress[55:57, 55:57] = STRESSED  # below MIN_AREA_PX
+    stress[0, :] = NODATA
+    regions = detect_stress_regions(stress, BOUNDS)
+    assert [r["area_px"] for r in regions] == [400, 100]
+    assert regions[0]["severe_fraction"] == 1.0
+    assert regions[1]["severe_fraction"] == 0.25
+    (min_lat, min_lon), (max_lat, max_lon) = regions[0]["bbox"]
+    lon, lat = regions[0]["centroid"]
+    assert min_lat < lat < max_lat and min_lon < lon < max_lon
+    assert all(min_lon <= x <= max_lon and min_lat <= y <= max_lat for x, y in regions[0]["coordinates"])
+
+
+def test_detect_stress_regions_none():
+    assert detect_stress_regions(np.full((10, 10), HEALTHY, dtype=np.uint8), BOUNDS) == []
@@ -0,0 +1,77 @@
+import pytest
+
+from basemap import FakeUpstream, TileProxy, TileStore, tile_format
+
+
+@pytest.fixture
+def upstream():
+    fake = FakeUpstream()
+    yield fake
+    fake.close()
+
+
+def _proxy(tmp_path, upstream, offline=False):
+    store = TileStore(str(tmp_path / "test.mbtiles"), "Test")
+    return TileProxy("test", upstream.template("test"), store, offline=offline)
+
+
+def test_miss_is_fetched_and_stored(tmp_path, upstream):
+    proxy = _proxy(tmp_path, upstream)
+    data = proxy.tile(12, 2900, 1780)
+    assert tile_format(data) == ("png", "image/png")
+    assert upstream.requests == 1
+    assert (12, 2900, 1780) in proxy.store
+    assert proxy.store.stats()["misses"] == 1
+
+
+def test_hit_does_not_contact_upstream(tmp_path, upstream):
+    proxy = _proxy(tmp_path, upstream)
+    first = proxy.tile(12, 2900, 1780)
+    second = proxy.tile(12, 2900, 1780)
+    assert second == first
+    assert upstream.requests == 1
+    assert proxy.store.stats()["hits"] == 1
+
+
+def test_offline_serves_only_cached_tiles(tmp_path, upstream):
+    proxy = _proxy(tmp_path, upstream)
+    cached = proxy.tile(12, 2900, 1780)
+    proxy.store.close()
+
+    offline = _proxy(tmp_path, upstream, offline=True)
+    assert offline.tile(12, 2900, 1780) == cached
+    assert offline.tile(12, 2901, 1780) is None
+    offline.ensure(12, 2902, 1780)
+    assert upstream.requests == 1
+
+
+def test_upstream_errors_are_not_cached(tmp_path, upstream):
+    proxy = _proxy(tmp_path, upstream)
+    upstream.failing = True
+    assert proxy.tile(12, 2900, 1780) is None
+    assert proxy.upstream_errors == 1
+    assert (12, 2900, 1780) not in proxy.store
+
+    upstream.failing = False
+    assert proxy.tile(12, 2900, 1780) is not None
+    assert upstream.requests == 2
+
+
+def test_store_evicts_least_recently_used(tmp_path):
+    store = TileStore(str(tmp_path / "small.mbtiles"), "Small", max_bytes=2500)
+    for x in range(3):
+        store.put(10, x, 0, b"\x89PNG" + bytes(996))
+    assert store.stats()["bytes"] <= 2500
+    assert (10, 0, 0) not in store
+    assert (10, 2, 0) in store
+
+
+def test_non_image_responses_are_not_cached(tmp_path, upstream):
+    proxy = _proxy(tmp_path, upstream)
+    upstream.portal = True
+    assert proxy.tile(12, 2900, 1780) is None
+    assert proxy.upstream_errors == 1
+    assert (12, 2900, 1780) not in proxy.store
+
+    upstream.portal = False
+    assert tile_format(proxy.tile(12, 2900, 1780)) == ("png", "image/png")
@@ -0,0 +1,54 @@
+import json
+import os
+from datetime import date
+
+import pyarrow.parquet as pq
+
+from batch_analyze import JOURNAL, PARTS_DIR, completed_ids, consolidate, main, part_name, run_batch
+
+DATE_RANGE = (date(2024, 1, 1), date(2024, 1, 20))
+
+
+def _field(farm_id, lon):
+    ring = [[lon, 22.3], [lon + 0.001, 22.3], [lon + 0.001, 22.301], [lon, 22.301], [lon, 22.3]]
+    return {"type": "Feature", "properties": {"farm_id": farm_id}, "geometry": {"type": "Polygon", "coordinates": [ring]}}
+
+
+def test_part_name_is_safe_and_distinct():
+    names = {part_name(fid) for fid in ("../etc/passwd", "a/b", "a_b", "A_B", "a:b", "x" * 300)}
+    assert len(names) == 6
+    for name in names:
+        assert os.path.basename(name) == name and name.endswith(".parquet") and len(name) < 100
+
+
+def test_resume_skips_completed_fields(tmp_path):
+    out = str(tmp_path)
+    fields = [_field("a/b", 73.1), _field("c", 73.2)]
+    assert run_batch(fields[:1], out, DATE_RANGE, workers=1) == (1, 0)
+    assert completed_ids(out) == {"a/b"}
+
+    # A crash mid-write leaves a torn last journal line; it is ignored and the field is not lost.
+    with open(os.path.join(out, JOURNAL), "a", encoding="utf-8") as f:
+        f.write('{"type": "Feature", "properties": {"farm_id"')
+    assert completed_ids(out) == {"a/b"}
+
+    assert run_batch(fields, out, DATE_RANGE, workers=1) == (1, 0)
+    assert run_batch(fields, out, DATE_RANGE, workers=1) == (0, 0)
+    assert completed_ids(out) == {"a/b", "c"}
+
+    consolidate(out)
+    summary = pq.read_table(os.path.join(out, "summary.parquet"))
+    assert sorted(summary.column("farm_id").to_pylist()) == ["a/b", "c"]
+    assert len(os.listdir(os.path.join(out, PARTS_DIR))) == 2
+    with open(os.path.join(out, "results.geojson"), encoding="utf-8") as f:
+        assert {"a/b", "c"} <= {feat["properties"]["farm_id"] for feat in json.load(f)["features"]}
+
+
+def test_empty_input_writes_empty_results(tmp_path):
+    geojson = tmp_path / "farms.geojson"
+    geojson.write_text('{"type": "FeatureCollection", "features": []}', encoding="utf-8")
+    out = str(tmp_path / "out")
+    assert main([str(geojson), "--out", out, "--workers", "1"]) == 0
+    with open(os.path.join(out, "results.geojson"), encoding="utf-8") as f:
+        assert json.load(f) == {"type": "FeatureCollection", "features": []}
+    assert not os.path.exists(os.path.join(out, "summary.parquet"))
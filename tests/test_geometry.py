@@ -0,0 +1,35 @@
+import numpy as np
+
+from geometry import polygon_mask
+
+BOUNDS = [[0.0, 0.0], [10.0, 10.0]]
+
+
+def _square(x0, y0, x1, y1):
+    return [[x0, y0], [x1, y0], [x1, y1], [x0, y1], [x0, y0]]
+
+
+def test_square_covers_pixel_centres_inside():
+    mask = polygon_mask({"type": "Polygon", "coordinates": [_square(2, 3, 6, 8)]}, BOUNDS, (10, 10))
+    expected = np.zeros((10, 10), dtype=bool)
+    expected[2:7, 2:6] = True  # row 0 is the northern edge
+    assert np.array_equal(mask, expected)
+
+
+def test_hole_is_left_out():
+    geometry = {"type": "Polygon", "coordinates": [_square(0, 0, 10, 10), _square(4, 4, 6, 6)]}
+    mask = polygon_mask(geometry, BOUNDS, (10, 10))
+    assert mask.sum() == 100 - 4
+    assert not mask[4:6, 4:6].any()
+
+
+def test_multipolygon_and_open_ring():
+    geometry = {"type": "MultiPolygon", "coordinates": [[_square(0, 0, 2, 2)[:-1]], [_square(8, 8, 10, 10)]]}
+    mask = polygon_mask(geometry, BOUNDS, (10, 10))
+    assert mask.sum() == 8
+    assert mask[8:, :2].all() and mask[:2, 8:].all()
+
+
+def test_non_square_pixels():
+    mask = polygon_mask({"type": "Polygon", "coordinates": [_square(0, 0, 5, 10)]}, BOUNDS, (4, 20))
+    assert mask[:, :10].all() and not mask[:, 10:].any()
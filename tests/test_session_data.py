@@ -0,0 +1,69 @@
+import os
+import time
+
+import numpy as np
+
+import session_data
+from ndvi_engine import NODATA
+from session_data import SessionResults
+
+
+def _result(seed=0):
+    rng = np.random.default_rng(seed)
+    stress = rng.integers(0, 3, (37, 53)).astype(np.uint8)
+    stress[:3] = NODATA
+    return {
+        "stress_map_array": stress,
+        "ndvi_forecast_cube": rng.random((4, 37, 53), dtype=np.float32),
+        "declining_mask": np.ma.masked_array(rng.random((37, 53)) < 0.3, mask=stress == NODATA),
+        "ndvi_map_array": rng.random((37, 53), dtype=np.float32),
+        "farm_name": "test",
+    }
+
+
+def test_spill_and_reload_round_trip_exactly(tmp_path):
+    results = SessionResults(str(tmp_path), idle_seconds=60)
+    original = _result()
+    results.attach("s1", "k", original)
+    results.evict_idle(now=time.time() + 120)
+    assert results.stats()["spilled"] == 1
+    assert len(os.listdir(tmp_path)) == 1
+
+    reloaded = results.get("s1", "k")
+    assert results.stats()["resident"] == 1 and not os.listdir(tmp_path)
+    assert reloaded["farm_name"] == "test"
+    assert np.array_equal(reloaded["stress_map_array"], original["stress_map_array"])
+    assert np.array_equal(reloaded["ndvi_forecast_cube"], original["ndvi_forecast_cube"])
+    assert reloaded["ndvi_map_array"].dtype == np.float32
+    assert np.array_equal(reloaded["ndvi_map_array"], original["ndvi_map_array"])
+    declining = reloaded["declining_mask"]
+    assert np.array_equal(declining.mask, original["declining_mask"].mask)
+    assert np.array_equal(declining.filled(False), original["declining_mask"].filled(False))
+
+
+def test_get_during_spill_keeps_the_entry_resident(tmp_path, monkeypatch):
+    results = SessionResults(str(tmp_path), idle_seconds=60)
+    results.attach("s1", "k", _result())
+    spill = session_data.spill_result
+    viewed = []
+
+    def spill_while_viewed(result, path):
+        spill(result, path)
+        viewed.append(results.get("s2", "k"))  # another session looks at it mid-write
+
+    monkeypatch.setattr(session_data, "spill_result", spill_while_viewed)
+    results.evict_idle(now=time.time() + 120)
+
+    assert viewed and "stress_map_array" in viewed[0]
+    assert results.stats()["resident"] == 1 and results.stats()["spilled"] == 0
+    assert not os.listdir(tmp_path)
+    assert "ndvi_map_array" in results.get("s1", "k")
+
+
+def test_last_release_drops_the_spill(tmp_path):
+    results = SessionResults(str(tmp_path), idle_seconds=60)
+    results.attach("s1", "k", _result())
+    results.evict_idle(now=time.time() + 120)
+    results.release("s1")
+    assert results.stats()["results"] == 0
+    assert not os.listdir(tmp_path)
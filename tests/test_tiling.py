@@ -0,0 +1,33 @@
+import os
+import threading
+
+import numpy as np
+
+from ndvi_engine import NODATA
+from tiling import _serve_tile, build_tile_pyramid
+
+BOUNDS = [[22.30, 73.10], [22.31, 73.11]]
+
+
+def test_concurrent_builds_leave_only_whole_tiles(tmp_path):
+    stress = np.random.default_rng(0).integers(0, 3, (300, 300)).astype(np.uint8)
+    stress[:20] = NODATA
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(build_tile_pyramid(stress, BOUNDS, str(tmp_path))))
+               for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len({tuple(sorted(r.items())) for r in results}) == 1
+
+    pyramid = results[0]
+    files = [os.path.join(d, n) for d, _, names in os.walk(tmp_path) for n in names]
+    assert not [f for f in files if f.endswith(".tmp")]
+    tiles = [f for f in files if f.endswith("." + pyramid["format"]) and "complete" not in f]
+    assert tiles
+    for path in tiles:
+        z, x, name = os.path.relpath(path, os.path.join(str(tmp_path), pyramid["digest"])).split(os.sep)
+        status, _, body, _ = _serve_tile([pyramid["digest"], z, x, name], {}, cache_dir=str(tmp_path))
+        assert status == 200 and body.startswith(b"\x89PNG" if pyramid["format"] == "png" else b"RIFF")
+    assert build_tile_pyramid(stress, BOUNDS, str(tmp_path)) == pyramid
@@ -0,0 +1,62 @@
+import os
+from datetime import date
+
+import numpy as np
+
+import timeseries_store
+from timeseries_store import TimeSeriesStore
+
+
+def test_append_and_query_range(tmp_path):
+    store = TimeSeriesStore(str(tmp_path))
+    dates = np.arange("2024-01-20", "2024-02-10", dtype="datetime64[D]")
+    ndvi = np.linspace(0.2, 0.8, dates.size)
+    assert store.append("farm/1", dates, ndvi=ndvi) == dates.size
+
+    result = store.query("farm/1", date(2024, 1, 25), date(2024, 2, 3))
+    assert result["dates"][0] == np.datetime64("2024-01-25") and result["dates"][-1] == np.datetime64("2024-02-03")
+    assert np.allclose(result["ndvi"], ndvi[5:15])
+    assert np.isnan(result["soil_moisture"]).all()
+    assert store.query("other", date(2024, 1, 1), date(2024, 12, 31))["dates"].size == 0
+
+
+def test_existing_dates_are_skipped(tmp_path):
+    store = TimeSeriesStore(str(tmp_path))
+    store.append("f", ["2024-03-01", "2024-03-02"], ndvi=[0.1, 0.2])
+    assert store.append("f", ["2024-03-02", "2024-03-03"], ndvi=[0.9, 0.3]) == 1
+    result = store.query("f", date(2024, 3, 1), date(2024, 3, 31), columns=["ndvi"])
+    assert np.allclose(result["ndvi"], [0.1, 0.2, 0.3])
+    assert store.append("f", ["2024-03-01"], ndvi=[0.5]) == 0
+
+
+def test_month_parts_are_compacted(tmp_path, monkeypatch):
+    monkeypatch.setattr(timeseries_store, "COMPACT_PARTS", 4)
+    store = TimeSeriesStore(str(tmp_path))
+    for day in range(1, 11):
+        store.append("f", [f"2024-05-{day:02d}"], temperature=[float(day)])
+    month_dir = os.path.join(str(tmp_path), "farm_id=f", "month=2024-05")
+    assert len(os.listdir(month_dir)) < 4
+    assert not [n for n in os.listdir(month_dir) if n.endswith(".tmp")]
+    result = store.query("f", date(2024, 5, 1), date(2024, 5, 31), columns=["temperature"])
+    assert np.array_equal(result["temperature"], np.arange(1, 11, dtype=np.float32))
+
+
+def test_racing_processes_keep_the_first_write(tmp_path, monkeypatch):
+    monkeypatch.setattr(timeseries_store, "COMPACT_PARTS", 3)
+    first, second = TimeSeriesStore(str(tmp_path)), TimeSeriesStore(str(tmp_path))
+    # Both processes checked for existing dates before either wrote.
+    monkeypatch.setattr(second, "stored_dates", lambda *args: np.array([], dtype="datetime64[D]"))
+    first.append("f", ["2024-06-01", "2024-06-02"], ndvi=[0.1, 0.2])
+    assert second.append("f", ["2024-06-02", "2024-06-03"], ndvi=[0.9, 0.3]) == 2
+
+    result = first.query("f", date(2024, 6, 1), date(2024, 6, 30), columns=["ndvi"])
+    assert np.array_equal(result["dates"], np.array(["2024-06-01", "2024-06-02", "2024-06-03"], dtype="datetime64[D]"))
+    assert np.allclose(result["ndvi"], [0.1, 0.2, 0.3])
+    assert first.stored_dates("f", date(2024, 6, 1), date(2024, 6, 30)).size == 3
+
+    # Compaction keeps the same rows.
+    first.append("f", ["2024-06-04"], ndvi=[0.4])
+    month_dir = os.path.join(str(tmp_path), "farm_id=f", "month=2024-06")
+    assert [n for n in os.listdir(month_dir) if n.startswith("base-")]
+    result = first.query("f", date(2024, 6, 1), date(2024, 6, 30), columns=["ndvi"])
+    assert np.allclose(result["ndvi"], [0.1, 0.2, 0.3, 0.4])
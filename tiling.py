@@ -0,0 +1,237 @@
+"""XYZ tile pyramid for the spectral health overlay.
+
+The stress raster is resampled onto the Web Mercator pixel grid at its native
+zoom, coarser zooms are built by 2x2 majority (mode) downsampling, and every
+non-empty 256px tile is written to disk once per raster. The pyramid is built
+depth first, one tile at a time, each coarser tile from the four below it, so
+memory stays at a few tiles whatever the raster size. The browser then
+fetches only the tiles in view through the local server instead of receiving
+the whole raster as a base64 data URI on every rerun.
+"""
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+import local_server
+from ndvi_engine import NODATA
+from overlay_encoder import FORMATS, MIME_TYPES, encode_classes
+from telemetry import timed
+
+TILE_SIZE = 256
+MAX_ZOOM = 20
+DIGEST_BLOCK_ROWS = 1024
+TILE_FORMAT = os.environ.get("KRISHI_TILE_FORMAT", "png")  # "png" (2-bit palette) or "webp" (lossless)
+TILE_PNG_LEVEL = int(os.environ.get("KRISHI_TILE_PNG_LEVEL", "6"))
+CACHE_DIR = os.environ.get(
+    "KRISHI_TILE_CACHE", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".krishi_cache", "tiles")
+)
+
+# Healthy / Stressed / Severe, same colours as the original image overlay.
+COLORMAP = np.array([[0, 128, 0, 180], [255, 255, 0, 180], [255, 0, 0, 180]], dtype=np.uint8)
+
+_EMPTY_TILES = {}
+
+
+def raster_digest(stress_array, bounds, colormap=COLORMAP):
+    """Content hash identifying one raster + placement + colours; used as the tile set name."""
+    h = hashlib.sha1()
+    h.update(str(stress_array.shape).encode())
+    h.update(np.asarray(colormap, dtype=np.uint8).tobytes())
+    for r in range(0, stress_array.shape[0], DIGEST_BLOCK_ROWS):  # row blocks keep a memory-mapped raster on disk
+        h.update(np.ascontiguousarray(stress_array[r:r + DIGEST_BLOCK_ROWS], dtype=np.uint8))
+    h.update(repr([[float(v) for v in corner] for corner in bounds]).encode())
+    return h.hexdigest()[:20]
+
+
+def native_zoom(stress_array, bounds):
+    """Smallest zoom whose Mercator pixels are at least as fine as the raster's."""
+    (min_lat, min_lon), (max_lat, max_lon) = bounds
+    deg_per_px = max((max_lon - min_lon) / stress_array.shape[1], 1e-12)
+    zoom = int(np.ceil(np.log2(360.0 / (TILE_SIZE * deg_per_px))))
+    return int(np.clip(zoom, 0, MAX_ZOOM))
+
+
+def _lon_to_px(lon, zoom):
+    return (np.asarray(lon) + 180.0) / 360.0 * TILE_SIZE * 2 ** zoom
+
+
+def _lat_to_px(lat, zoom):
+    lat = np.radians(np.clip(lat, -85.05112878, 85.05112878))
+    return (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / np.pi) / 2.0 * TILE_SIZE * 2 ** zoom
+
+
+def _px_to_lon(px, zoom):
+    return px / (TILE_SIZE * 2 ** zoom) * 360.0 - 180.0
+
+
+def _px_to_lat(py, zoom):
+    n = np.pi * (1.0 - 2.0 * py / (TILE_SIZE * 2 ** zoom))
+    return np.degrees(np.arctan(np.sinh(n)))
+
+
+def tile_range(bounds, zoom):
+    """Inclusive `(tx0, tx1, ty0, ty1)` of the XYZ tiles covering `bounds` at `zoom`."""
+    (min_lat, min_lon), (max_lat, max_lon) = bounds
+    last = 2 ** zoom - 1
+    tx0, tx1 = int(_lon_to_px(min_lon, zoom) // TILE_SIZE), int(_lon_to_px(max_lon, zoom) // TILE_SIZE)
+    ty0, ty1 = int(_lat_to_px(max_lat, zoom) // TILE_SIZE), int(_lat_to_px(min_lat, zoom) // TILE_SIZE)
+    return min(max(tx0, 0), last), min(max(tx1, 0), last), min(max(ty0, 0), last), min(max(ty1, 0), last)
+
+
+def _native_indices(stress_array, bounds, zoom):
+    """Source row and column of every Mercator pixel of the tiles covering `bounds` at `zoom`.
+
+    Returns `(row_idx, col_idx, (tx0, tx1, ty0, ty1))`; indices are -1 where
+    the pixel falls outside the raster.
+    """
+    (min_lat, min_lon), (max_lat, max_lon) = bounds
+    rows, cols = stress_array.shape
+    tx0, tx1, ty0, ty1 = tile_range(bounds, zoom)
+
+    # Mercator rows and columns are separable, so two 1-D index vectors suffice.
+    px = np.arange(tx0 * TILE_SIZE, (tx1 + 1) * TILE_SIZE) + 0.5
+    py = np.arange(ty0 * TILE_SIZE, (ty1 + 1) * TILE_SIZE) + 0.5
+    col_f = (_px_to_lon(px, zoom) - min_lon) / (max_lon - min_lon) * cols
+    row_f = (max_lat - _px_to_lat(py, zoom)) / (max_lat - min_lat) * rows
+    col_idx = np.where((col_f >= 0) & (col_f < cols), np.clip(col_f.astype(np.int64), 0, cols - 1), -1)
+    row_idx = np.where((row_f >= 0) & (row_f < rows), np.clip(row_f.astype(np.int64), 0, rows - 1), -1)
+    return row_idx, col_idx, (tx0, tx1, ty0, ty1)
+
+
+def _render_native_tile(stress_array, row_idx, col_idx):
+    """Nearest-neighbour resample of one native-zoom tile, given its pixels' source rows and columns.
+
+    Only the block of the raster under the tile is read, so a memory-mapped
+    raster stays on disk. Returns None when the tile holds no data.
+    """
+    row_ok, col_ok = row_idx >= 0, col_idx >= 0
+    if not row_ok.any() or not col_ok.any():
+        return None
+    # Both index vectors are increasing, so the source block is one contiguous window.
+    r, c = row_idx[row_ok], col_idx[col_ok]
+    block = np.asarray(stress_array[r[0]:r[-1] + 1, c[0]:c[-1] + 1], dtype=np.uint8)
+    tile = np.full((TILE_SIZE, TILE_SIZE), NODATA, dtype=np.uint8)
+    tile[np.ix_(row_ok, col_ok)] = block[np.ix_(r - r[0], c - c[0])]
+    return tile
+
+
+def mode_downsample(level, n_classes=3):
+    """Halves a class raster, keeping the most frequent class of each 2x2 block.
+
+    Ties go to the more severe class so small stress patches stay visible when
+    zoomed out; blocks with no data at all stay NODATA.
+    """
+    corners = (level[0::2, 0::2], level[0::2, 1::2], level[1::2, 0::2], level[1::2, 1::2])
+    # Reverse class order so argmax's first-wins tie break favours severity.
+    counts = np.stack([sum((corner == c).view(np.uint8) for corner in corners) for c in range(n_classes - 1, -1, -1)])
+    out = (n_classes - 1 - counts.argmax(axis=0)).astype(np.uint8)
+    out[counts.sum(axis=0) == 0] = NODATA
+    return out
+
+
+def encode_tile(tile, fmt=TILE_FORMAT, colormap=COLORMAP):
+    """Encodes one class tile as a palette PNG or lossless WebP; NODATA pixels are fully transparent."""
+    return encode_classes(tile, colormap, fmt, TILE_PNG_LEVEL)
+
+
+@timed("render.overlay_encoding")
+def build_tile_pyramid(stress_array, bounds, cache_dir=CACHE_DIR, fmt=TILE_FORMAT, colormap=COLORMAP):
+    """Writes the overlay pyramid to disk (once per raster and format) and returns its metadata.
+
+    `colormap` is the (n_classes, 4) RGBA of the raster's class codes;
+    coarser zooms break majority ties towards the higher code.
+    """
+    digest = raster_digest(stress_array, bounds, colormap)
+    max_zoom = native_zoom(stress_array, bounds)
+    root = os.path.join(cache_dir, digest)
+    marker = os.path.join(root, f"complete.{fmt}")
+
+    if os.path.exists(marker):
+        with open(marker) as f:
+            min_zoom = int(f.read().strip())
+        return {"digest": digest, "min_zoom": min_zoom, "max_zoom": max_zoom, "format": fmt}
+
+    row_idx, col_idx, (tx0, tx1, ty0, ty1) = _native_indices(stress_array, bounds, max_zoom)
+    # Stop once the whole AOI sits in a single tile; Leaflet upsamples below that.
+    depth = 0
+    while depth < max_zoom and (tx0 >> depth != tx1 >> depth or ty0 >> depth != ty1 >> depth):
+        depth += 1
+
+    def build(zoom, x, y):
+        """Builds tile (zoom, x, y) from its four children, depth first, and writes it if it holds data.
+
+        Only the tiles on the current path and their siblings are in memory, so
+        the peak does not grow with the raster.
+        """
+        shift = max_zoom - zoom
+        if not (tx0 >> shift <= x <= tx1 >> shift and ty0 >> shift <= y <= ty1 >> shift):
+            return None
+        if shift == 0:
+            i, j = (x - tx0) * TILE_SIZE, (y - ty0) * TILE_SIZE
+            tile = _render_native_tile(stress_array, row_idx[j:j + TILE_SIZE], col_idx[i:i + TILE_SIZE])
+        else:
+            children = [build(zoom + 1, 2 * x + dx, 2 * y + dy) for dy in (0, 1) for dx in (0, 1)]
+            if all(child is None for child in children):
+                return None
+            quad = np.full((2 * TILE_SIZE, 2 * TILE_SIZE), NODATA, dtype=np.uint8)
+            for n, child in enumerate(children):
+                if child is not None:
+                    quad[n // 2 * TILE_SIZE:(n // 2 + 1) * TILE_SIZE, n % 2 * TILE_SIZE:(n % 2 + 1) * TILE_SIZE] = child
+            tile = mode_downsample(quad, len(colormap))
+        if tile is None or np.all(tile == NODATA):
+            return None
+        tile_dir = os.path.join(root, str(zoom), str(x))
+        os.makedirs(tile_dir, exist_ok=True)
+        _write_atomic(os.path.join(tile_dir, f"{y}.{fmt}"), encode_tile(tile, fmt, colormap))
+        return tile
+
+    zoom = max_zoom - depth
+    build(zoom, tx0 >> depth, ty0 >> depth)
+
+    _write_atomic(marker, str(zoom).encode())
+    return {"digest": digest, "min_zoom": zoom, "max_zoom": max_zoom, "format": fmt}
+
+
+def _write_atomic(path, data):
+    """Writes `data` under a temporary name and renames it into place.
+
+    Tiles are served as immutable, so a reader (or another process building
+    the same raster) must never see a partly written file.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _empty_tile(fmt):
+    if fmt not in _EMPTY_TILES:
+        _EMPTY_TILES[fmt] = encode_tile(np.full((TILE_SIZE, TILE_SIZE), NODATA, dtype=np.uint8), fmt)
+    return _EMPTY_TILES[fmt]
+
+
+def _serve_tile(parts, query, cache_dir=CACHE_DIR):
+    """Handles /tiles/<digest>/<z>/<x>/<y>.<png|webp> from the on-disk pyramid."""
+    if len(parts) != 4 or "." not in parts[3]:
+        return 404, "text/plain", b"bad tile path"
+    digest, z, x = parts[0], parts[1], parts[2]
+    y, fmt = parts[3].rsplit(".", 1)
+    if not (digest.isalnum() and z.isdigit() and x.isdigit() and y.isdigit()) or fmt not in FORMATS:
+        return 404, "text/plain", b"bad tile path"
+    path = os.path.join(cache_dir, digest, z, x, f"{y}.{fmt}")
+    headers = {"Cache-Control": "public, max-age=86400, immutable"}
+    if not os.path.exists(path):
+        # Outside the AOI: a blank tile keeps Leaflet from logging errors.
+        return 200, MIME_TYPES[fmt], _empty_tile(fmt), headers
+    with open(path, "rb") as f:
+        return 200, MIME_TYPES[fmt], f.read(), headers
+
+
+local_server.register_route("tiles", _serve_tile)
+
+
+def tile_url_template(pyramid):
+    """Leaflet URL template for a pyramid returned by `build_tile_pyramid`."""
+    return local_server.public_url(f"tiles/{pyramid['digest']}") + "/{z}/{x}/{y}." + pyramid['format']
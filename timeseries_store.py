@@ -0,0 +1,207 @@
+"""Columnar per-farm time-series store (NDVI, soil moisture, temperature).
+
+Observations live in Parquet files under a hive layout,
+`farm_id=<id>/month=YYYY-MM/part-<n>.parquet`, so an append only writes a new
+part file for the months it touches and a date-range query only lists and
+opens that farm's directory and those months; inside them, Parquet row-group
+statistics prune on the `date` column. Part files are written under a
+temporary name and renamed into place, so a crash never leaves a torn file
+behind, and once a month has COMPACT_PARTS of them they are merged into one
+`base-<n>.parquet` holding every part numbered up to n. Parts a base already
+covers (left over when a compaction was interrupted) are ignored.
+
+The duplicate check in `append` only serialises threads of one process;
+when worker processes race to append the same dates, reads and compactions
+keep the row from the oldest file for each date. Metric columns are handed
+back as NumPy arrays viewing the Arrow buffers (no copy) whenever they have
+no gaps; only the date column is widened from Arrow's 32-bit days to
+datetime64[D].
+"""
+import os
+import threading
+import time
+import uuid
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+STORE_DIR = os.environ.get(
+    "KRISHI_TIMESERIES_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".krishi_cache", "timeseries")
+)
+METRICS = ['ndvi', 'soil_moisture', 'temperature']
+SCHEMA = pa.schema([
+    ("date", pa.date32()),
+    ("ndvi", pa.float32()),
+    ("soil_moisture", pa.float32()),
+    ("temperature", pa.float32()),
+])
+COMPACT_PARTS = 16  # a month's part files are merged into one once there are this many
+
+
+def _month(d):
+    return str(np.datetime64(d, 'M'))
+
+
+class TimeSeriesStore:
+    """Append-only, farm/month partitioned Parquet store."""
+
+    def __init__(self, root=STORE_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+
+    def _farm_dir(self, farm_id):
+        return os.path.join(self.root, f"farm_id={farm_id}")
+
+    @staticmethod
+    def _scan(month_dir):
+        """`(live, stale, last)` for one month partition.
+
+        `live` are the files to read, `stale` the parts a base file already
+        covers plus leftover temporary files, and `last` the highest file
+        number in use (-1 if none).
+        """
+        try:
+            names = os.listdir(month_dir)
+        except FileNotFoundError:
+            return [], [], -1
+        bases, parts, stale = [], [], []
+        for name in names:
+            stem, ext = os.path.splitext(name)
+            kind, _, number = stem.partition("-")
+            if ext == ".tmp":
+                stale.append(name)
+            elif ext == ".parquet" and number.isdigit() and kind in ("base", "part"):
+                (bases if kind == "base" else parts).append((int(number), name))
+        covered = max(bases)[0] if bases else -1
+        live = [max(bases)[1]] if bases else []
+        for number, name in sorted(parts) + sorted(bases)[:-1]:
+            if number > covered and name.startswith("part-"):
+                live.append(name)
+            else:
+                stale.append(name)
+        last = max([covered] + [number for number, _ in parts])
+        return [os.path.join(month_dir, n) for n in live], [os.path.join(month_dir, n) for n in stale], last
+
+    def _read(self, farm_id, start, end, columns):
+        """Table of the farm's rows in [start, end]; only its month directories in range are listed."""
+        farm_dir = self._farm_dir(farm_id)
+        try:
+            months = sorted(os.listdir(farm_dir))
+        except FileNotFoundError:
+            return None
+        first, last = f"month={_month(start)}", f"month={_month(end)}"
+        files = [path for month in months if first <= month <= last
+                 for path in self._scan(os.path.join(farm_dir, month))[0]]
+        if not files:
+            return None
+        date_filter = (pc.field("date") >= pa.scalar(start, pa.date32())) & (pc.field("date") <= pa.scalar(end, pa.date32()))
+        table = ds.dataset(files, format="parquet", schema=SCHEMA).to_table(columns=columns, filter=date_filter)
+        return _first_per_date(table)
+
+    @staticmethod
+    def _write(table, path):
+        tmp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.{uuid.uuid4().hex}.tmp")
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, path)
+
+    def _compact(self, month_dir):
+        """Merges a month's live files into one base file, then deletes what it replaces."""
+        live, stale, last = self._scan(month_dir)
+        table = _first_per_date(ds.dataset(live, format="parquet", schema=SCHEMA).to_table()).sort_by("date")
+        base = os.path.join(month_dir, f"base-{last}.parquet")
+        self._write(table, base)
+        for path in live + stale:
+            if path != base:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def stored_dates(self, farm_id, start, end):
+        """Dates with an observation for this farm in [start, end], as datetime64[D]."""
+        table = self._read(farm_id, start, end, ["date"])
+        if table is None:
+            return np.array([], dtype='datetime64[D]')
+        return np.sort(np.asarray(table.column("date").to_numpy(), dtype='datetime64[D]'))
+
+    def append(self, farm_id, dates, **metrics):
+        """Adds observations; dates already stored for the farm are skipped, not overwritten.
+
+        `dates` is a sequence of dates and each keyword in METRICS an equally
+        long sequence of values (NaN/None where a metric was not observed).
+        Returns the number of new rows written.
+        """
+        unknown = set(metrics) - set(METRICS)
+        if unknown:
+            raise ValueError(f"unknown metrics: {sorted(unknown)}")
+        dates = np.asarray(dates, dtype='datetime64[D]')
+        if dates.size == 0:
+            return 0
+
+        with self._lock:
+            existing = self.stored_dates(farm_id, dates.min().item(), dates.max().item())
+            keep = ~np.isin(dates, existing)
+            if not keep.any():
+                return 0
+            columns = {"date": pa.array(dates[keep], type=pa.date32())}
+            for name in METRICS:
+                values = metrics.get(name)
+                if values is None:
+                    columns[name] = pa.nulls(int(keep.sum()), type=pa.float32())
+                else:
+                    values = np.asarray(values, dtype=np.float32)[keep]
+                    columns[name] = pa.array(values, type=pa.float32(), mask=np.isnan(values))
+            table = pa.table(columns, schema=SCHEMA)
+
+            months = dates[keep].astype('datetime64[M]')
+            for month in np.unique(months):
+                part_dir = os.path.join(self._farm_dir(farm_id), f"month={month}")
+                os.makedirs(part_dir, exist_ok=True)
+                live, _, last = self._scan(part_dir)
+                number = max(time.time_ns(), last + 1)  # part numbers only grow, even if the clock steps back
+                part = table.filter(pa.array(months == month))
+                self._write(part.sort_by("date"), os.path.join(part_dir, f"part-{number}.parquet"))
+                if len(live) + 1 >= COMPACT_PARTS:
+                    self._compact(part_dir)
+        return int(keep.sum())
+
+    def query(self, farm_id, start, end, columns=METRICS):
+        """Observations for one farm in [start, end], sorted by date.
+
+        Returns a dict of NumPy arrays: `dates` (datetime64[D]) plus one
+        float32 array per requested metric, NaN where not observed.
+        """
+        table = self._read(farm_id, start, end, ["date", *columns])
+        if table is None:
+            return {"dates": np.array([], dtype='datetime64[D]'), **{c: np.array([], dtype=np.float32) for c in columns}}
+        table = table.sort_by("date").combine_chunks()
+
+        result = {"dates": np.asarray(table.column("date").to_numpy(), dtype='datetime64[D]')}
+        for name in columns:
+            result[name] = _to_numpy(table.column(name))
+        return result
+
+
+def _first_per_date(table):
+    """Drops rows repeating an earlier row's date; files are scanned oldest first, so the first write wins."""
+    _, first = np.unique(table.column("date").to_numpy(), return_index=True)
+    if first.size == table.num_rows:
+        return table
+    return table.take(first)
+
+
+def _to_numpy(column):
+    """Zero-copy view of a single-chunk column; copies (filling NaN) only when it has nulls."""
+    if column.num_chunks == 0:
+        return np.array([], dtype=np.float32)
+    chunk = column.chunk(0) if column.num_chunks == 1 else pa.concat_arrays(column.chunks)
+    if chunk.null_count == 0:
+        return chunk.to_numpy(zero_copy_only=True)
+    return chunk.to_numpy(zero_copy_only=False)
+
+
+# Shared by every session in this server process.
+TIMESERIES_STORE = TimeSeriesStore()
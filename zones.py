@@ -0,0 +1,342 @@
+"""Management zones and per-zone statistics for variable-rate application.
+
+A classified field is split into zones in one of two ways. `grid_zones` uses
+square cells of a size the user picks. `kmeans_zones` clusters pixels by
+NDVI, forecast trend and position into a handful of management zones. In
+both cases the result is a uint16 raster of zone numbers, with 0 outside the
+field.
+
+`zonal_statistics` computes each zone's area, class shares, NDVI and
+estimated yield in one pass over the in-field pixels. Counts and class
+shares come from bincount. NDVI sums and extremes come from `reduceat` over
+the pixels sorted by zone, which is a radix sort for 16-bit labels, so the
+cost stays linear in pixel count.
+
+`prescription_geojson` exports the zones as a FeatureCollection. Each
+zone's geometry is its pixels merged into rectangles. Each zone's properties
+are one row of a flat attribute table with shapefile (DBF) style column
+names.
+"""
+import numpy as np
+
+from geometry import M_PER_DEG_LAT, M_PER_DEG_LON
+from ndvi_engine import CLASS_NAMES, NODATA
+
+# t/ha per unit of mean NDVI; the same linear model as analysis.estimate_yield.
+YIELD_T_HA_PER_NDVI = 6.5
+MAX_ZONES = 10000  # grid cells are enlarged to stay below this
+DEFAULT_CELL_M = 30
+DEFAULT_ZONE_COUNT = 4
+KMEANS_MAX_ITER = 25
+KMEANS_TOL = 0.001  # stop once fewer than this share of pixels change zone
+KMEANS_SAMPLE = 10000  # pixels used to seed the centroids
+KMEANS_FIT_SAMPLE = 200000  # pixels the centroids are fitted on; every pixel is then assigned once
+KMEANS_SPATIAL_WEIGHT = 0.5  # position vs. crop features; keeps zones contiguous enough to drive
+KMEANS_SMOOTH_PX = 3  # features are box-averaged over (2r+1)^2 field pixels before clustering
+PIXEL_CHUNK = 262144
+MAX_RATE_ADJUST = 0.3  # prescribed rates stay within +/-30% of the base rate
+
+
+def pixel_size_m(bounds, shape):
+    """(height, width) in metres of one pixel of a raster covering `bounds`."""
+    (min_lat, min_lon), (max_lat, max_lon) = bounds
+    rows, cols = shape
+    lat_m = (max_lat - min_lat) / rows * M_PER_DEG_LAT
+    lon_m = (max_lon - min_lon) / cols * M_PER_DEG_LON * np.cos(np.radians((min_lat + max_lat) / 2))
+    return float(lat_m), float(lon_m)
+
+
+def _compact(raw, mask):
+    """Renumbers the labels in use inside `mask` to 1..n (0 elsewhere); returns `(labels, n)`."""
+    used = np.bincount(raw[mask], minlength=1) > 0
+    used[0] = False
+    remap = np.cumsum(used).astype(np.uint16)
+    labels = np.where(mask, remap[raw], 0).astype(np.uint16)
+    return labels, int(remap[-1])
+
+
+def grid_zones(mask, bounds, cell_m=DEFAULT_CELL_M, max_zones=MAX_ZONES):
+    """Square zones about `cell_m` metres across over the field pixels in `mask`; returns `(labels, n_zones)`.
+
+    Cells are numbered row by row from the north-west corner. Cells with no
+    field pixel are skipped. When the grid would exceed `max_zones` cells,
+    the cells are enlarged until it does not.
+    """
+    rows, cols = mask.shape
+    px_h, px_w = pixel_size_m(bounds, mask.shape)
+    cell_rows = max(int(round(cell_m / px_h)), 1)
+    cell_cols = max(int(round(cell_m / px_w)), 1)
+    cells = -(-rows // cell_rows) * -(-cols // cell_cols)
+    if cells > max_zones:
+        grow = np.sqrt(cells / max_zones)
+        cell_rows, cell_cols = int(np.ceil(cell_rows * grow)), int(np.ceil(cell_cols * grow))
+    n_cell_cols = -(-cols // cell_cols)
+    row_part = (np.arange(rows) // cell_rows * n_cell_cols).astype(np.int32)
+    col_part = (np.arange(cols) // cell_cols + 1).astype(np.int32)
+    return _compact(row_part[:, None] + col_part[None, :], mask)
+
+
+def box_mean(values, mask, radius=KMEANS_SMOOTH_PX):
+    """Mean of the valid (non-NaN, in-`mask`) values in the (2r+1)^2 window around each pixel.
+
+    Uses summed-area tables, so the cost does not depend on `radius`.
+    Pixels with no valid neighbour are NaN.
+    """
+    valid = mask & ~np.isnan(values)
+    width = 2 * radius + 1
+    sums = []
+    for layer in (np.where(valid, values, 0.0), valid):
+        table = np.zeros((layer.shape[0] + width, layer.shape[1] + width))
+        table[radius + 1:radius + 1 + layer.shape[0], radius + 1:radius + 1 + layer.shape[1]] = layer
+        table = table.cumsum(axis=0).cumsum(axis=1)
+        sums.append(table[width:, width:] - table[:-width, width:] - table[width:, :-width] + table[:-width, :-width])
+    total, count = sums
+    out = np.full(values.shape, np.nan, dtype=np.float32)
+    np.divide(total, count, out=out, where=count > 0.5, casting='unsafe')
+    return out
+
+
+def _standardize(values):
+    """One feature column scaled to zero mean and unit variance; NaNs (no observation) become the mean."""
+    values = np.asarray(values, dtype=np.float32)
+    valid = values[~np.isnan(values)]
+    mean = float(valid.mean(dtype=np.float64)) if valid.size else 0.0
+    std = float(valid.std(dtype=np.float64)) if valid.size else 0.0
+    out = (values - mean) / (std if std > 0 else 1.0)
+    out[np.isnan(out)] = 0.0
+    return out
+
+
+def _nearest(points, centroids):
+    """Index of the nearest centroid for every point, chunked over points to bound memory."""
+    c_sq = (centroids ** 2).sum(axis=1)
+    nearest = np.empty(len(points), dtype=np.int64)
+    for start in range(0, len(points), PIXEL_CHUNK):
+        block = points[start:start + PIXEL_CHUNK]
+        # |x - c|^2 without the |x|^2 term, which is the same for every centroid.
+        nearest[start:start + PIXEL_CHUNK] = np.argmin(c_sq - 2 * block @ centroids.T, axis=1)
+    return nearest
+
+
+def _seed_centroids(points, k, rng, sample=KMEANS_SAMPLE):
+    """k-means++ seeding on a random sample of the points."""
+    if len(points) > sample:
+        points = points[rng.choice(len(points), sample, replace=False)]
+    centroids = [points[rng.integers(len(points))]]
+    dist = ((points - centroids[0]) ** 2).sum(axis=1)
+    for _ in range(1, k):
+        total = dist.sum()
+        pick = rng.choice(len(points), p=dist / total) if total > 0 else rng.integers(len(points))
+        centroids.append(points[pick])
+        dist = np.minimum(dist, ((points - points[pick]) ** 2).sum(axis=1))
+    return np.array(centroids, dtype=np.float32)
+
+
+def kmeans_zones(mask, ndvi, trend=None, k=DEFAULT_ZONE_COUNT, seed=0, max_iter=KMEANS_MAX_ITER,
+                 tol=KMEANS_TOL, spatial_weight=KMEANS_SPATIAL_WEIGHT, smooth_px=KMEANS_SMOOTH_PX,
+                 fit_sample=KMEANS_FIT_SAMPLE):
+    """Management zones from k-means over the field pixels in `mask`; returns `(labels, n_zones)`.
+
+    Features per pixel are NDVI, the forecast `trend` (if given) and the row
+    and column scaled by `spatial_weight`, all standardized. NDVI and trend
+    are first averaged over `smooth_px` pixels around each pixel (see
+    `box_mean`), so pixel noise does not scatter the zones. Centroids are
+    fitted on at most `fit_sample` random pixels (each iteration is one
+    chunked distance product and one bincount per feature) and every pixel
+    is then assigned to its nearest centroid once, so the cost is linear in
+    pixel count. Zones are numbered by mean NDVI, lowest
+    first, so zone 1 is always the weakest part of the field.
+    """
+    rows, cols = np.nonzero(mask)
+    n = len(rows)
+    k = max(1, min(int(k), n))
+    if n == 0:
+        return np.zeros(mask.shape, dtype=np.uint16), 0
+    layers = [ndvi] if trend is None else [ndvi, trend]
+    if smooth_px:
+        layers = [box_mean(layer, mask, smooth_px) for layer in layers]
+    columns = [_standardize(layer[rows, cols]) for layer in layers]
+    columns += [_standardize(rows) * spatial_weight, _standardize(cols) * spatial_weight]
+    points = np.column_stack(columns)
+
+    rng = np.random.default_rng(seed)
+    centroids = _seed_centroids(points, k, rng)
+    fit = points if n <= fit_sample else points[rng.choice(n, fit_sample, replace=False)]
+    assignment = _nearest(fit, centroids)
+    for _ in range(max_iter):
+        counts = np.bincount(assignment, minlength=k)
+        for j in range(fit.shape[1]):
+            sums = np.bincount(assignment, weights=fit[:, j], minlength=k)
+            # An emptied cluster keeps its old centroid.
+            centroids[:, j] = np.where(counts > 0, sums / np.maximum(counts, 1), centroids[:, j])
+        updated = _nearest(fit, centroids)
+        moved = np.count_nonzero(updated != assignment)
+        assignment = updated
+        if moved <= tol * len(fit):
+            break
+    if fit is not points:
+        assignment = _nearest(points, centroids)
+
+    counts = np.bincount(assignment, minlength=k)
+    mean_ndvi = np.bincount(assignment, weights=points[:, 0], minlength=k) / np.maximum(counts, 1)
+    rank = np.empty(k, dtype=np.int64)
+    rank[np.argsort(np.where(counts > 0, mean_ndvi, np.inf), kind='stable')] = np.arange(k)
+    raw = np.zeros(mask.shape, dtype=np.int32)
+    raw[rows, cols] = rank[assignment] + 1
+    return _compact(raw, mask)
+
+
+def zonal_statistics(labels, n_zones, stress_array, ndvi, bounds):
+    """One dict per zone: `zone`, `pixels`, `area_ha`, `health_distribution`, NDVI mean/min/max/std and `yield_t_ha`.
+
+    Zones whose pixels have no valid NDVI report NaN NDVI and yield.
+    """
+    px_h, px_w = pixel_size_m(bounds, labels.shape)
+    px_area_ha = px_h * px_w / 10000
+    inside = labels > 0
+    zone = labels[inside]
+    n_codes = len(CLASS_NAMES) + 1  # the classes plus one slot for NODATA
+    codes = np.minimum(stress_array[inside], len(CLASS_NAMES)).astype(np.int64)
+    class_counts = np.bincount(zone.astype(np.int64) * n_codes + codes,
+                               minlength=(n_zones + 1) * n_codes).reshape(n_zones + 1, n_codes)[1:, :len(CLASS_NAMES)]
+    pixels = np.bincount(zone, minlength=n_zones + 1)[1:]
+
+    # Sorted by zone (radix sort on uint16), each zone's NDVI values are one contiguous run.
+    order = np.argsort(zone, kind='stable')
+    values = ndvi[inside][order]
+    valid = ~np.isnan(values)
+    values, zone_sorted = values[valid].astype(np.float64), zone[order][valid]
+    observed = np.bincount(zone_sorted, minlength=n_zones + 1)[1:]
+    has = observed > 0
+    starts = (np.cumsum(observed) - observed)[has]
+    mean, low, high, std = (np.full(n_zones, np.nan) for _ in range(4))
+    if values.size:
+        total = np.add.reduceat(values, starts)
+        mean[has] = total / observed[has]
+        low[has] = np.minimum.reduceat(values, starts)
+        high[has] = np.maximum.reduceat(values, starts)
+        sq = np.add.reduceat(values * values, starts)
+        std[has] = np.sqrt(np.maximum(sq / observed[has] - mean[has] ** 2, 0.0))
+
+    stats = []
+    for i in range(n_zones):
+        classified = class_counts[i].sum()
+        stats.append({
+            "zone": i + 1,
+            "pixels": int(pixels[i]),
+            "area_ha": float(pixels[i] * px_area_ha),
+            "health_distribution": {
+                name: round(float(100.0 * c / classified), 1) if classified else 0.0
+                for name, c in zip(CLASS_NAMES, class_counts[i])
+            },
+            "mean_ndvi": float(mean[i]),
+            "min_ndvi": float(low[i]),
+            "max_ndvi": float(high[i]),
+            "std_ndvi": float(std[i]),
+            "yield_t_ha": float(mean[i] * YIELD_T_HA_PER_NDVI),
+        })
+    return stats
+
+
+def build_zones(stress_array, ndvi, bounds, method="grid", size=None, trend=None):
+    """Zone raster and statistics for a result: `method` "grid" (`size` = cell metres) or "kmeans" (`size` = zones)."""
+    mask = stress_array != NODATA
+    if method == "grid":
+        labels, n_zones = grid_zones(mask, bounds, size or DEFAULT_CELL_M)
+    elif method == "kmeans":
+        labels, n_zones = kmeans_zones(mask, ndvi, trend, size or DEFAULT_ZONE_COUNT)
+    else:
+        raise ValueError(f"unknown zoning method: {method}")
+    return labels, zonal_statistics(labels, n_zones, stress_array, ndvi, bounds)
+
+
+def prescription_rates(zone_stats, base_rate, max_adjust=MAX_RATE_ADJUST):
+    """Application rate per zone: inverse to the zone's NDVI relative to the field, within +/-`max_adjust`.
+
+    Weaker zones get more input, stronger ones less; zones with no NDVI get
+    the base rate.
+    """
+    area = np.array([z['area_ha'] for z in zone_stats])
+    ndvi = np.array([z['mean_ndvi'] for z in zone_stats])
+    known = ~np.isnan(ndvi) & (ndvi > 0)
+    if not known.any():
+        return [float(base_rate)] * len(zone_stats)
+    field_ndvi = np.average(ndvi[known], weights=np.maximum(area[known], 1e-12))
+    factor = np.ones(len(zone_stats))
+    factor[known] = np.clip(field_ndvi / ndvi[known], 1 - max_adjust, 1 + max_adjust)
+    return [round(float(base_rate * f), 1) for f in factor]
+
+
+def prescription_table(zone_stats, rates=None):
+    """Attribute rows for the zones, with DBF-style column names (upper case, at most 10 characters)."""
+    rows = []
+    for i, z in enumerate(zone_stats):
+        row = {
+            "ZONE": z['zone'],
+            "AREA_HA": round(z['area_ha'], 4),
+            "NDVI_MEAN": round(z['mean_ndvi'], 3),
+            "NDVI_MIN": round(z['min_ndvi'], 3),
+            "NDVI_MAX": round(z['max_ndvi'], 3),
+            "NDVI_STD": round(z['std_ndvi'], 3),
+            "YIELD_TH": round(z['yield_t_ha'], 2),
+            **{f"{name.upper()[:6]}_PCT": pct for name, pct in z['health_distribution'].items()},
+        }
+        if rates is not None:
+            row["RATE"] = rates[i]
+        # NaN is not valid JSON; an absent value is null in the table.
+        rows.append({k: (None if isinstance(v, float) and np.isnan(v) else v) for k, v in row.items()})
+    return rows
+
+
+def zone_rectangles(labels):
+    """Zone pixels merged into rectangles: parallel arrays `(zone, row0, row1, col0, col1)`, ends exclusive.
+
+    Runs of one zone along each row are found for the whole raster at once.
+    A run continues the rectangle above it when the row above has a run of
+    the same zone over exactly the same columns, so grid cells come out as
+    one rectangle each.
+    """
+    rows, cols = labels.shape
+    padded = np.zeros((rows, cols + 2), dtype=np.int32)
+    padded[:, 1:-1] = labels
+    change = padded[:, 1:] != padded[:, :-1]
+    run_r, edge_c = np.nonzero(change)
+    # Edges come in row order; consecutive edges in a row bound one run.
+    same_row = run_r[:-1] == run_r[1:]
+    r, c0, c1 = run_r[:-1][same_row], edge_c[:-1][same_row], edge_c[1:][same_row]
+    zone = labels[r, c0].astype(np.int64)
+    keep = zone > 0
+    r, c0, c1, zone = r[keep], c0[keep], c1[keep], zone[keep]
+    if r.size == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty, empty, empty
+
+    order = np.lexsort((r, c1, c0, zone))
+    r, c0, c1, zone = r[order], c0[order], c1[order], zone[order]
+    starts = np.ones(r.size, dtype=bool)
+    starts[1:] = (zone[1:] != zone[:-1]) | (c0[1:] != c0[:-1]) | (c1[1:] != c1[:-1]) | (r[1:] != r[:-1] + 1)
+    first = np.flatnonzero(starts)
+    last = np.append(first[1:], r.size) - 1
+    return zone[first], r[first], r[last] + 1, c0[first], c1[first]
+
+
+def prescription_geojson(labels, bounds, zone_stats, rates=None):
+    """FeatureCollection with one MultiPolygon Feature per zone, carrying its `prescription_table` row."""
+    (min_lat, min_lon), (max_lat, max_lon) = bounds
+    rows, cols = labels.shape
+    px_w, px_h = (max_lon - min_lon) / cols, (max_lat - min_lat) / rows
+    zone, r0, r1, c0, c1 = zone_rectangles(labels)
+    west, east = min_lon + c0 * px_w, min_lon + c1 * px_w
+    north, south = max_lat - r0 * px_h, max_lat - r1 * px_h
+    rectangles = {}
+    for z, w, s, e, n in zip(zone.tolist(), west.tolist(), south.tolist(), east.tolist(), north.tolist()):
+        rectangles.setdefault(z, []).append([[[w, s], [e, s], [e, n], [w, n], [w, s]]])
+    features = [
+        {
+            "type": "Feature",
+            "geometry": {"type": "MultiPolygon", "coordinates": rectangles.get(props['ZONE'], [])},
+            "properties": props,
+        }
+        for props in prescription_table(zone_stats, rates)
+    ]
+    return {"type": "FeatureCollection", "features": features}